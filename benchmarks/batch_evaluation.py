@@ -0,0 +1,51 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark of evaluating resources over grids of parameters, point by point and in batch.
+
+Run with `python benchmarks/batch_evaluation.py`. Requires NumPy.
+"""
+
+from pathlib import Path
+from time import perf_counter
+
+import yaml
+
+from qref.evaluation import evaluate_resources, parameter_grid
+
+EXAMPLE_PATH = Path(__file__).parent.parent / "docs" / "examples" / "alias_sampling.yaml"
+
+GRID_SIZES = [10**2, 10**3, 10**4, 10**5]
+
+
+def main():
+    data = yaml.safe_load(EXAMPLE_PATH.read_text())
+    print(f"{'points':>10} {'pointwise [s]':>14} {'batch [s]':>10} {'speedup':>8}")
+    for size in GRID_SIZES:
+        grid = parameter_grid(L=range(2, size // 10 + 2), mu=range(1, 11), N=[10], X=[3])
+        # Evaluating point by point is slow, hence only a sample of points is evaluated and the time is scaled.
+        sample = min(size, 1000)
+        start = perf_counter()
+        for i in range(sample):
+            evaluate_resources(data, {name: values[i] for name, values in grid.items()}, strict=False)
+        pointwise = (perf_counter() - start) * size / sample
+
+        start = perf_counter()
+        evaluate_resources(data, grid, strict=False)
+        batch = perf_counter() - start
+        print(f"{size:>10} {pointwise:>14.4f} {batch:>10.4f} {pointwise / batch:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark of constructing programs programmatically, routine by routine and with ProgramBuilder.
+
+Both methods construct the same programs, described by the synthetic dictionaries, and give equal results.
+
+Run with `python benchmarks/building.py`.
+"""
+
+from timeit import Timer
+from typing import Any
+
+from synthetic import make_program
+
+from qref import SchemaV1
+from qref.builder import ProgramBuilder
+from qref.schema_v1 import ConnectionV1, PortV1, ResourceV1, RoutineV1
+
+SIZES = [10**3, 10**4, 10**5]
+
+
+def build_routine_by_routine(data: dict[str, Any]) -> SchemaV1:
+    def _build(routine: dict[str, Any]) -> RoutineV1:
+        source_target_pairs = (connection.split(" -> ") for connection in routine.get("connections", ()))
+        return RoutineV1(
+            name=routine["name"],
+            children=[_build(child) for child in routine.get("children", ())],
+            ports=[PortV1(**port) for port in routine["ports"]],
+            resources=[ResourceV1(**resource) for resource in routine.get("resources", ())],
+            connections=[ConnectionV1(source=source, target=target) for source, target in source_target_pairs],
+        )
+
+    return SchemaV1(version="v1", program=_build(data["program"]))
+
+
+def build_with_builder(data: dict[str, Any]) -> SchemaV1:
+    builder = ProgramBuilder(data["program"]["name"])
+    stack = [(data["program"], builder.root)]
+    while stack:
+        routine, handle = stack.pop()
+        for port in routine["ports"]:
+            builder.add_port(handle, port["name"], port["direction"], port["size"])
+        for resource in routine.get("resources", ()):
+            builder.add_resource(handle, resource["name"], resource["type"], resource["value"])
+        for connection in routine.get("connections", ()):
+            builder.add_connection(handle, *connection.split(" -> "))
+        stack.extend((child, builder.add_routine(handle, child["name"])) for child in routine.get("children", ()))
+    return builder.build()
+
+
+METHODS = {
+    "routine by routine": build_routine_by_routine,
+    "ProgramBuilder": build_with_builder,
+}
+
+
+def main():
+    print(f"{'method':>20} {'routines':>10} {'time [s]':>10} {'speedup':>8}")
+    for size in SIZES:
+        data = make_program(size)
+        assert build_with_builder(data) == build_routine_by_routine(data)
+        baseline = None
+        for name, method in METHODS.items():
+            n_runs, total = Timer(lambda: method(data)).autorange()
+            elapsed = total / n_runs
+            baseline = baseline or elapsed
+            print(f"{name:>20} {size:>10} {elapsed:>10.4f} {baseline / elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark of storing and loading programs with and without factoring out repeated subroutines.
+
+Run with `python benchmarks/definitions.py`.
+"""
+
+import json
+import tracemalloc
+from time import perf_counter
+
+from synthetic import make_program
+
+from qref import SchemaV1
+from qref.definitions import dump_with_definitions, load_with_definitions
+
+SIZES = [10**3, 10**4, 10**5]
+
+
+def _measure(load, data):
+    tracemalloc.start()
+    start = perf_counter()
+    program = load(data)
+    elapsed = perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del program
+    return elapsed, memory
+
+
+def main():
+    print(f"{'form':>12} {'routines':>10} {'JSON [kB]':>10} {'load [s]':>10} {'memory [MB]':>12}")
+    for size in SIZES:
+        program = SchemaV1.model_validate(make_program(size))
+        forms = {
+            "ordinary": (program.model_dump(exclude_unset=True), SchemaV1.model_validate),
+            "definitions": (dump_with_definitions(program), load_with_definitions),
+        }
+        for name, (data, load) in forms.items():
+            elapsed, memory = _measure(load, data)
+            print(
+                f"{name:>12} {size:>10} {len(json.dumps(data)) / 1024:>10.1f} {elapsed:>10.4f} "
+                f"{memory / 2**20:>12.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark of flattening programs into netlists of their leaves.
+
+Run with `python benchmarks/flattening.py`.
+"""
+
+from time import perf_counter
+
+from synthetic import make_program
+
+from qref import SchemaV1
+from qref.flattening import flatten
+
+SIZES = [10**3, 10**4, 10**5, 5 * 10**5]
+
+
+def main():
+    print(f"{'routines':>10} {'leaves':>10} {'edges':>10} {'flatten [s]':>12} {'arrays [MB]':>12}")
+    for size in SIZES:
+        program = SchemaV1.model_validate(make_program(size))
+        start = perf_counter()
+        netlist = flatten(program)
+        elapsed = perf_counter() - start
+        arrays = (netlist.port_offsets, netlist.port_routines, netlist.sources, netlist.targets)
+        memory = sum(array.itemsize * len(array) for array in arrays)
+        print(f"{size:>10} {len(netlist.routines) - 1:>10} {len(netlist):>10} {elapsed:>12.4f} {memory / 2**20:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark of startup latency of QREF: importing it, and running `qref-render --help`.
+
+Every case is run in a fresh interpreter with `python -X importtime`. Reported times are the minima
+over several runs of the total time spent on imports (as reported by `-X importtime`), and of the
+wall-clock time of the whole process. Startup of the interpreter alone is reported for reference.
+
+Run with `python benchmarks/import_time.py`.
+"""
+
+import subprocess
+import sys
+from time import perf_counter
+
+N_RUNS = 10
+
+CASES = {
+    "python": "pass",
+    "import qref": "import qref",
+    "from qref import SchemaV1": "from qref import SchemaV1",
+    "qref-render --help": (
+        "import sys; from qref.experimental._cli import render_entry_point; "
+        "sys.argv = ['qref-render', '--help']; render_entry_point()"
+    ),
+}
+
+
+def total_import_time(importtime_output: str) -> float:
+    """Sum cumulative times of top-level imports (in microseconds) reported by `python -X importtime`."""
+    total = 0
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        # Names of imports made by other modules are indented, the top-level ones by a single space.
+        if cumulative.strip().isdigit() and not name.startswith("  "):
+            total += int(cumulative)
+    return total
+
+
+def measure(code: str) -> tuple[float, float]:
+    """Run code in a fresh interpreter, returning times of imports and of the whole run, in milliseconds."""
+    start = perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, check=True
+    )
+    elapsed = perf_counter() - start
+    return total_import_time(result.stderr) / 1000, elapsed * 1000
+
+
+def main():
+    print(f"{'case':>26} {'imports [ms]':>13} {'wall [ms]':>10}")
+    for name, code in CASES.items():
+        imports, wall = map(min, zip(*(measure(code) for _ in range(N_RUNS))))
+        print(f"{name:>26} {imports:>13.1f} {wall:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark of accessing a single routine in a large JSON file, with eager and lazy loading.
+
+Run with `python benchmarks/lazy_loading.py`.
+"""
+
+import json
+import os
+import tempfile
+from time import perf_counter
+
+from synthetic import make_program
+
+from qref import SchemaV1
+from qref.lazy import load_lazy
+
+SIZES = [10**3, 10**4, 10**5]
+
+
+def load_eagerly(path):
+    with open(path) as f:
+        program = SchemaV1.model_validate(json.load(f)).program
+    return program.children[-1].resources
+
+
+def load_lazily(path):
+    return load_lazy(path).children[-1].resources
+
+
+METHODS = {"eager": load_eagerly, "lazy": load_lazily}
+
+
+def main():
+    print(f"{'method':>8} {'routines':>10} {'file [MB]':>10} {'time [s]':>10} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in SIZES:
+            path = os.path.join(directory, f"program_{size}.json")
+            with open(path, "w") as f:
+                json.dump(make_program(size), f)
+            file_size = os.path.getsize(path) / 2**20
+            baseline = None
+            for name, method in METHODS.items():
+                start = perf_counter()
+                method(path)
+                elapsed = perf_counter() - start
+                baseline = baseline or elapsed
+                print(f"{name:>8} {size:>10} {file_size:>10.1f} {elapsed:>10.4f} {baseline / elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
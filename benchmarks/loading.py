@@ -0,0 +1,49 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark of loading programs from dictionaries, with and without validation.
+
+Run with `python benchmarks/loading.py`. Speedups are relative to `model_validate`. As with
+all the benchmarks using timeit, the garbage collector is disabled while measuring, and with it
+enabled, the collections it triggers take a considerable part of the time for large programs.
+"""
+
+from timeit import Timer
+
+from synthetic import make_program
+
+from qref import SchemaV1
+
+SIZES = [10**3, 10**4, 10**5]
+
+METHODS = {
+    "model_validate": SchemaV1.model_validate,
+    "load_trusted": SchemaV1.load_trusted,
+}
+
+
+def main():
+    print(f"{'method':>15} {'routines':>10} {'time [s]':>10} {'speedup':>8}")
+    for size in SIZES:
+        data = make_program(size)
+        baseline = None
+        for name, method in METHODS.items():
+            n_runs, total = Timer(lambda: method(data)).autorange()
+            elapsed = total / n_runs
+            baseline = baseline or elapsed
+            print(f"{name:>15} {size:>10} {elapsed:>10.4f} {baseline / elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
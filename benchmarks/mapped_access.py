@@ -0,0 +1,61 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark of reading a single port of a serialized program, with and without loading it.
+
+Run with `python benchmarks/mapped_access.py`.
+"""
+
+import os
+import tempfile
+from timeit import Timer
+
+from synthetic import make_program
+
+from qref import SchemaV1
+from qref.mapped import load_mapped
+
+SIZES = [10**3, 10**4, 10**5]
+
+
+def read_loaded(path):
+    with open(path, "rb") as f:
+        program = SchemaV1.from_bytes(f.read()).program
+    return program.children[-1].children[-1].ports.by_name["in_0"].size
+
+
+def read_mapped(path):
+    return load_mapped(path).children[-1].children[-1].ports.by_name["in_0"].size
+
+
+METHODS = {"from_bytes": read_loaded, "load_mapped": read_mapped}
+
+
+def main():
+    print(f"{'method':>12} {'routines':>10} {'time [s]':>10} {'speedup':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in SIZES:
+            path = os.path.join(directory, f"program_{size}.qref")
+            with open(path, "wb") as f:
+                f.write(SchemaV1.model_validate(make_program(size)).to_bytes())
+            baseline = None
+            for name, method in METHODS.items():
+                n_runs, total = Timer(lambda: method(path)).autorange()
+                elapsed = total / n_runs
+                baseline = baseline or elapsed
+                print(f"{name:>12} {size:>10} {elapsed:>10.6f} {baseline / elapsed:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
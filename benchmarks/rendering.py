@@ -0,0 +1,60 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark of converting programs to graphviz graphs and writing their DOT sources (without running graphviz itself).
+
+Programs are wide, i.e. every non-leaf routine has thousands of children, connected in a chain. DOT sources
+are written to the null device, so that the peak memory of writing them does not include the sources themselves.
+
+Run with `python benchmarks/rendering.py`.
+"""
+
+import os
+import tracemalloc
+from timeit import Timer
+
+from synthetic import make_program
+
+from qref import SchemaV1
+from qref.experimental.rendering import to_graphviz, write_dot
+
+# Pairs of numbers of routines and numbers of children of every non-leaf routine.
+SHAPES = [(1001, 1000), (5001, 5000), (20001, 20000), (100000, 2000)]
+
+
+def peak_memory(function) -> int:
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    print(
+        f"{'routines':>10} {'children':>10} {'to_graphviz [s]':>16} {'write_dot [s]':>14} "
+        f"{'to_graphviz [MB]':>17} {'write_dot [MB]':>15}"
+    )
+    with open(os.devnull, "w") as null:
+        for size, branching in SHAPES:
+            program = SchemaV1.model_validate(make_program(size, branching))
+            methods = [lambda: to_graphviz(program), lambda: write_dot(program, null)]
+            times = [total / n_runs for n_runs, total in (Timer(method).autorange() for method in methods)]
+            peaks = [peak_memory(method) / 2**20 for method in methods]
+            print(f"{size:>10} {branching:>10} {times[0]:>16.4f} {times[1]:>14.4f} {peaks[0]:>17.1f} {peaks[1]:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
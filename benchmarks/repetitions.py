@@ -0,0 +1,54 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark of evaluating repetitions by unrolling them, and in closed form.
+
+Run with `python benchmarks/repetitions.py`. Requires NumPy.
+"""
+
+from time import perf_counter
+
+from qref.evaluation import evaluate_repetition
+from qref.schema_v1 import RepetitionV1
+
+COUNTS = [10**3, 10**5, 10**7, 10**9]
+
+# Unrolling is slow, hence it is only measured for counts up to this limit, and extrapolated above it.
+MAX_UNROLLED_COUNT = 10**6
+
+SEQUENCES = {
+    "arithmetic": ({"type": "arithmetic", "initial_term": 1, "difference": 2}, lambda i: 1 + 2 * i),
+    "custom": ({"type": "custom", "term_expression": "1/(i+1)^2", "iterator_symbol": "i"}, lambda i: 1 / (i + 1) ** 2),
+}
+
+
+def _unrolled(term, count):
+    start = perf_counter()
+    sum(term(i) for i in range(min(count, MAX_UNROLLED_COUNT)))
+    return (perf_counter() - start) * count / min(count, MAX_UNROLLED_COUNT)
+
+
+def main():
+    print(f"{'sequence':>12} {'count':>12} {'unrolled [s]':>14} {'evaluated [s]':>14}")
+    for name, (sequence, term) in SEQUENCES.items():
+        for count in COUNTS:
+            repetition = RepetitionV1.model_validate({"count": "N", "sequence": sequence})
+            start = perf_counter()
+            evaluate_repetition(repetition, {"N": float(count)})
+            evaluated = perf_counter() - start
+            print(f"{name:>12} {count:>12} {_unrolled(term, count):>14.4f} {evaluated:>14.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark of serializing programs to JSON and to the binary format.
+
+Run with `python benchmarks/serialization.py`.
+"""
+
+from timeit import Timer
+
+from synthetic import make_program
+
+from qref import SchemaV1
+
+SIZES = [10**3, 10**4, 10**5]
+
+FORMATS = {
+    "json": (lambda program: program.model_dump_json(exclude_unset=True), SchemaV1.model_validate_json),
+    "binary": (SchemaV1.to_bytes, SchemaV1.from_bytes),
+}
+
+
+def _time(f):
+    n_runs, total = Timer(f).autorange()
+    return total / n_runs
+
+
+def main():
+    print(f"{'format':>8} {'routines':>10} {'size [kB]':>10} {'dump [s]':>10} {'load [s]':>10} {'load speedup':>13}")
+    for size in SIZES:
+        program = SchemaV1.model_validate(make_program(size))
+        baseline = None
+        for name, (dump, load) in FORMATS.items():
+            serialized = dump(program)
+            dump_time = _time(lambda: dump(program))
+            load_time = _time(lambda: load(serialized))
+            baseline = baseline or load_time
+            print(
+                f"{name:>8} {size:>10} {len(serialized) / 1024:>10.1f} {dump_time:>10.4f} {load_time:>10.4f} "
+                f"{baseline / load_time:>13.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Generators of synthetic programs used in benchmarks."""
+
+from typing import Any
+
+from qref.schema_v1 import RoutineV1
+
+
+def make_program(n_routines: int, branching: int = 10) -> dict[str, Any]:
+    """Generate a valid program with (approximately) given number of routines.
+
+    The program is a complete tree in which every non-leaf routine has `branching` children
+    connected in a chain between the parent's input and output ports. Every leaf carries a few resources.
+
+    Args:
+        n_routines: total number of routines in the generated program (including the root).
+        branching: number of children of every non-leaf routine.
+
+    Returns:
+        A dictionary with program in the V1 schema.
+    """
+    counter = iter(range(n_routines))
+    next(counter)
+    remaining = n_routines - 1
+
+    def _make_routine(name: str, budget: int) -> dict[str, Any]:
+        routine: dict[str, Any] = {
+            "name": name,
+            "ports": [
+                {"name": "in_0", "direction": "input", "size": "N"},
+                {"name": "out_0", "direction": "output", "size": "N"},
+            ],
+        }
+        if budget == 0:
+            routine["resources"] = [
+                {"name": "T_gates", "type": "additive", "value": "4*N"},
+                {"name": "rotations", "type": "additive", "value": 2},
+                {"name": "success_rate", "type": "multiplicative", "value": 0.99},
+                {"name": "qubits", "type": "qubits", "value": "N"},
+            ]
+            return routine
+
+        n_children = min(branching, budget)
+        budgets = [(budget - n_children) // n_children] * n_children
+        for i in range((budget - n_children) % n_children):
+            budgets[i] += 1
+        names = [f"child_{next(counter)}" for _ in range(n_children)]
+        routine["children"] = [_make_routine(child_name, b) for child_name, b in zip(names, budgets)]
+        routine["connections"] = [
+            f"in_0 -> {names[0]}.in_0",
+            *[f"{src}.out_0 -> {dst}.in_0" for src, dst in zip(names, names[1:])],
+            f"{names[-1]}.out_0 -> out_0",
+        ]
+        return routine
+
+    return {"version": "v1", "program": _make_routine("root", remaining)}
+
+
+def make_deep_routine(depth: int) -> RoutineV1:
+    """Generate a valid routine whose hierarchy forms a chain of given depth.
+
+    The routine is constructed bottom-up from RoutineV1 objects, because validating
+    a dictionary nested that deeply would exceed Python's recursion limit.
+    """
+    ports = [{"name": "in_0", "direction": "input", "size": 1}, {"name": "out_0", "direction": "output", "size": 1}]
+    routine = RoutineV1(name="leaf", ports=ports)
+    for i in range(depth - 1):
+        routine = RoutineV1(
+            name=f"level_{depth - i - 2}",
+            ports=ports,
+            children=[routine],
+            connections=[f"in_0 -> {routine.name}.in_0", f"{routine.name}.out_0 -> out_0"],
+        )
+    return routine
@@ -0,0 +1,55 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark of validating programs and assignments to their routines.
+
+Run with `python benchmarks/validation.py`. The time per routine should stay (approximately)
+constant, and validation should not do any work which is not needed for checking the data
+(e.g. building indices used only by topology verification).
+"""
+
+from timeit import Timer
+
+from synthetic import make_program
+
+from qref import SchemaV1
+
+SIZES = [10**3, 10**4, 10**5]
+
+
+def _report(kind, size, func):
+    n_runs, total = Timer(func).autorange()
+    elapsed = total / n_runs
+    print(f"{kind:>12} {size:>10} {elapsed:>10.4f} {elapsed / size * 1e6:>18.2f}")
+
+
+def main():
+    print(f"{'kind':>12} {'routines':>10} {'time [s]':>10} {'per routine [us]':>18}")
+    for size in SIZES:
+        data = make_program(size)
+        _report("program", size, lambda: SchemaV1.model_validate(data))
+
+    for size in SIZES:
+        # Wide routine, whose connections are checked against ports of all its children on each assignment.
+        routine = SchemaV1.model_validate(make_program(size + 1, branching=size)).program
+        connections = list(routine.connections)
+
+        def _assign():
+            routine.connections = connections
+
+        _report("connections", size, _assign)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark of topology verification on synthetic programs of increasing size.
+
+Run with `python benchmarks/verification.py`. The time per routine should stay
+(approximately) constant, i.e. verification time should grow linearly with program size.
+On machines with multiple CPUs, parallel verification using all of them is measured as well.
+Incremental re-verification after modifying a single leaf ("edit" shape) should only grow
+with the depth of the program, i.e. logarithmically with the size of the synthetic programs.
+"""
+
+import os
+from timeit import Timer
+
+from synthetic import make_deep_routine, make_program
+
+from qref import SchemaV1, verify_topology
+
+SIZES = [10**3, 10**4, 10**5]
+
+
+def _report(shape, size, routine, workers=1):
+    assert verify_topology(routine, workers=workers)
+    n_runs, total = Timer(lambda: verify_topology(routine, workers=workers)).autorange()
+    elapsed = total / n_runs
+    print(f"{shape:>6} {workers:>8} {size:>10} {elapsed:>10.4f} {elapsed / size * 1e6:>18.2f}")
+
+
+def _report_edit(size, program):
+    assert verify_topology(program, incremental=True)
+    leaf = program.program
+    while leaf.children:
+        leaf = leaf.children[-1]
+
+    def _edit_and_verify():
+        leaf.mark_modified()
+        return verify_topology(program, incremental=True)
+
+    assert _edit_and_verify()
+    n_runs, total = Timer(_edit_and_verify).autorange()
+    elapsed = total / n_runs
+    print(f"{'edit':>6} {1:>8} {size:>10} {elapsed:>10.4f} {elapsed / size * 1e6:>18.2f}")
+
+
+def main():
+    print(f"{'shape':>6} {'workers':>8} {'routines':>10} {'time [s]':>10} {'per routine [us]':>18}")
+    for size in SIZES:
+        program = SchemaV1.model_validate(make_program(size))
+        _report("wide", size, program)
+        if (n_cpus := os.cpu_count() or 1) > 1:
+            _report("wide", size, program, workers=n_cpus)
+        _report_edit(size, program)
+    for size in SIZES:
+        _report("deep", size, make_deep_routine(size))
+
+
+if __name__ == "__main__":
+    main()
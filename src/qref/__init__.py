@@ -12,17 +12,79 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-"""Public API of QREF."""
+"""Public API of QREF.
 
-from typing import Any
+Names defined in submodules are imported on first access, so that importing QREF itself (e.g. by
+`qref-render`, or by code using only some of its submodules) does not import pydantic and the models.
+"""
 
-from .schema_v1 import SchemaV1, generate_schema_v1
-from .verification import verify_topology
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .schema_v1 import SchemaV1, generate_schema_v1
+    from .verification import verify_topology
+
+    SCHEMA_GENERATORS: dict[str, Any]
+    MODELS: dict[str, Any]
 
-SCHEMA_GENERATORS = {"v1": generate_schema_v1}
-MODELS = {"v1": SchemaV1}
 LATEST_SCHEMA_VERSION = "v1"
 
+# Submodules which are imported on first access, as if they were attributes of the package.
+_SUBMODULES = frozenset(
+    (
+        "aggregation",
+        "binary",
+        "builder",
+        "connections",
+        "definitions",
+        "evaluation",
+        "experimental",
+        "expressions",
+        "fingerprinting",
+        "flattening",
+        "functools",
+        "lazy",
+        "mapped",
+        "parameters",
+        "paths",
+        "schema_v1",
+        "verification",
+    )
+)
+
+
+def _import_schema_v1() -> None:
+    if "MODELS" in globals():
+        return
+    from . import schema_v1
+
+    globals().update(
+        SchemaV1=schema_v1.SchemaV1,
+        generate_schema_v1=schema_v1.generate_schema_v1,
+        SCHEMA_GENERATORS={"v1": schema_v1.generate_schema_v1},
+        MODELS={"v1": schema_v1.SchemaV1},
+    )
+
+
+def __getattr__(name: str) -> Any:
+    # Imported names are stored in the module's namespace, hence Python calls this at most once per name.
+    if name in ("SchemaV1", "generate_schema_v1", "SCHEMA_GENERATORS", "MODELS"):
+        _import_schema_v1()
+    elif name == "verify_topology":
+        from . import verification
+
+        globals()["verify_topology"] = verification.verify_topology
+    elif name in _SUBMODULES:
+        import importlib
+
+        # Importing a submodule binds it in the namespace of the package.
+        importlib.import_module(f"{__name__}.{name}")
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return globals()[name]
+
 
 def generate_program_schema(version: str = LATEST_SCHEMA_VERSION) -> dict[str, Any]:
     """Generate Program schema of given version.
@@ -37,7 +99,7 @@ def generate_program_schema(version: str = LATEST_SCHEMA_VERSION) -> dict[str, A
         ValueError: if `version` does not match any known version schema.
     """
     try:
-        return SCHEMA_GENERATORS[version]()
+        return __getattr__("SCHEMA_GENERATORS")[version]()
     except KeyError:
         raise ValueError(f"Unknown schema version {version}")
 
@@ -0,0 +1,119 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Caching of data computed bottom-up for every routine in a tree.
+
+Values (e.g. fingerprints or aggregated resources) are computed from the routine and the values
+of its children, and cached on each routine. Cached values are invalidated when the routine is
+modified, and revalidated on the next access by checking if the values of its children are still
+the same objects.
+
+Modifying a routine also changes the subtree revisions of all its ancestors, which are found through
+links to parents recorded during traversals of the tree (see `RoutineV1.mark_modified`). Hence, only
+the modified routines and their ancestors are revisited, and as long as no routine in the subtree is
+modified, cached values are returned right away.
+"""
+
+from __future__ import annotations
+
+import weakref
+from typing import Any, Callable, Generic, TypeVar
+
+from .schema_v1 import RoutineV1, _bookkeeping
+
+T = TypeVar("T")
+
+
+class _Entry(Generic[T]):
+    __slots__ = ("checked_at", "children", "value")
+
+    def __init__(self, checked_at: int, children: list[T], value: T):
+        # Subtree revision of the routine at the time this value was known to be valid.
+        self.checked_at = checked_at
+        self.children = children
+        self.value = value
+
+
+def routine_cache(routine: RoutineV1) -> dict[str, Any]:
+    """Get dictionary for storing data derived from the routine, cleared each time the routine is modified."""
+    return _bookkeeping(routine)["_cache"]
+
+
+def revision(routine: RoutineV1) -> int:
+    """Get revision which changes each time the routine is modified."""
+    return _bookkeeping(routine)["_revision"]
+
+
+def subtree_revision(routine: RoutineV1) -> int:
+    """Get revision which changes each time the routine or any of its descendants linked to it is modified."""
+    return _bookkeeping(routine)["_subtree_revision"]
+
+
+def link_children(routine: RoutineV1) -> None:
+    """Record the routine as a parent of its children, so that their modifications change its subtree revision."""
+    for child in routine.children:
+        parents = _bookkeeping(child)["_parents"]
+        if not any(parent() is routine for parent in parents):
+            parents.append(weakref.ref(routine))
+
+
+def _is_up_to_date(routine: RoutineV1, key: str) -> bool:
+    entry = routine_cache(routine).get(key)
+    return entry is not None and entry.checked_at == subtree_revision(routine)
+
+
+def _same_objects(first: list[T], second: list[T]) -> bool:
+    return len(first) == len(second) and all(a is b for a, b in zip(first, second))
+
+
+def _update(routine: RoutineV1, key: str, compute: Callable[[RoutineV1, list[T]], T]) -> None:
+    # Values of all children have to be up to date at this point.
+    cache = routine_cache(routine)
+    entry: _Entry[T] | None = cache.get(key)
+    children = [routine_cache(child)[key].value for child in routine.children]
+    if entry is not None and _same_objects(entry.children, children):
+        entry.checked_at = subtree_revision(routine)
+    else:
+        cache[key] = _Entry(subtree_revision(routine), children, compute(routine, children))
+
+
+def compute_bottom_up(routine: RoutineV1, key: str, compute: Callable[[RoutineV1, list[T]], T]) -> T:
+    """Compute value for given routine and all its descendants, reusing cached values where possible.
+
+    Args:
+        routine: root of the tree for which the values should be computed.
+        key: key under which the values are cached.
+        compute: function computing the value of a routine given the values of its children.
+            It should not modify any routines.
+
+    Returns:
+        Value computed for the routine. Values of its descendants can be retrieved with `cached_value`.
+    """
+    if not _is_up_to_date(routine, key):
+        # Iterative post-order traversal, skipping subtrees whose values are known to be up to date.
+        stack = [(routine, False)]
+        while stack:
+            current, children_done = stack.pop()
+            if children_done:
+                _update(current, key, compute)
+            elif not _is_up_to_date(current, key):
+                link_children(current)
+                stack.append((current, True))
+                stack.extend((child, False) for child in current.children)
+    return cached_value(routine, key)
+
+
+def cached_value(routine: RoutineV1, key: str) -> Any:
+    """Retrieve value cached by `compute_bottom_up` for given routine or any of its descendants."""
+    return routine_cache(routine)[key].value
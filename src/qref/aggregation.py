@@ -0,0 +1,307 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Aggregation of resources from leaves of a program up to its root.
+
+Resources of every routine are rolled up from its children according to their types:
+
+- `additive` resources are summed,
+- `multiplicative` resources are multiplied,
+- for `qubits`, the maximum over the children is taken,
+- `other` resources are not aggregated.
+
+Resources declared by a routine take precedence over the aggregated ones. If a routine is repeated,
+the aggregated resources of its children describe a single term of the repetition's sequence, and
+the total is obtained from the sum S of the sequence's terms: additive resources are multiplied by S,
+multiplicative ones are raised to the power of S, and qubits are unaffected. The sum is computed
+in closed form for constant, arithmetic and geometric sequences. For closed-form sequences, `sum`
+(or `prod` for multiplicative resources, if provided) with `num_terms_symbol` substituted by the count
+is used. For custom sequences, the sum is expressed as `sum(term_expression, iterator_symbol, 0, count - 1)`.
+
+Values are folded to numbers whenever all the operands are numbers. Otherwise, aggregated values are
+expressions, given as strings, in the same syntax as the values in QREF documents.
+"""
+
+from __future__ import annotations
+
+import math
+import re
+from collections.abc import Callable, Mapping
+from typing import Any, TypeVar, Union
+
+from ._subtree_cache import cached_value, compute_bottom_up
+from .functools import accepts_all_qref_types
+from .schema_v1 import NamedList, RepetitionV1, ResourceV1, RoutineV1, _construct
+
+Value = Union[int, float, str]
+
+T = TypeVar("T")
+
+# Aggregated resources of a routine, mapping names of resources to their types and values.
+_Resources = dict[str, tuple[str, Union[Value, None]]]
+
+_RESOURCES_CACHE_KEY = "aggregated_resources"
+
+_AGGREGATED_TYPES = ("additive", "multiplicative", "qubits")
+
+_NUMBER = re.compile(r"[0-9]+(\.[0-9]*)?([eE][-+]?[0-9]+)?")
+_ATOM = re.compile(rf"[A-Za-z_][A-Za-z0-9_.]*|{_NUMBER.pattern}")
+
+# Limit on the number of bits of integers obtained by exponentiation, above which floats are used instead.
+_MAX_EXACT_POWER_BITS = 4096
+
+
+def _as_number(value: Value) -> int | float | None:
+    if isinstance(value, (int, float)):
+        return value
+    if _NUMBER.fullmatch(value):
+        return float(value) if any(char in value for char in ".eE") else int(value)
+    return None
+
+
+def _operand(value: Value) -> str:
+    # Numbers and names can be used in any expression as they are, everything else has to be parenthesized.
+    text = str(value)
+    return text if _ATOM.fullmatch(text) or _is_parenthesized(text) else f"({text})"
+
+
+def _is_parenthesized(text: str) -> bool:
+    if not text.startswith("("):
+        return False
+    depth = 0
+    for position, char in enumerate(text):
+        depth += (char == "(") - (char == ")")
+        if depth == 0:
+            return position == len(text) - 1
+    return False
+
+
+def _sum(values: list[Value]) -> Value:
+    total: int | float = 0
+    symbolic = []
+    for value in values:
+        if (number := _as_number(value)) is None:
+            symbolic.append(str(value))
+        else:
+            total += number
+    if not symbolic:
+        return total
+    expression = " + ".join(symbolic)
+    if total < 0:
+        return f"{expression} - {-total}"
+    return f"{expression} + {total}" if total else expression
+
+
+def _product(values: list[Value]) -> Value:
+    total: int | float = 1
+    symbolic = []
+    for value in values:
+        if (number := _as_number(value)) is None:
+            symbolic.append(_operand(value))
+        else:
+            total *= number
+    if not symbolic or total == 0:
+        return total
+    return "*".join(([_operand(total)] if total != 1 else []) + symbolic)
+
+
+def _maximum(values: list[Value]) -> Value:
+    numbers = [number for value in values if (number := _as_number(value)) is not None]
+    symbolic = [str(value) for value in values if _as_number(value) is None]
+    if not symbolic:
+        return max(numbers, default=0)
+    arguments = symbolic + ([str(max(numbers))] if numbers else [])
+    return arguments[0] if len(arguments) == 1 else f"max({', '.join(arguments)})"
+
+
+def _power(base: Value, exponent: Value) -> Value:
+    base_number, exponent_number = _as_number(base), _as_number(exponent)
+    if exponent_number == 0:
+        return 1
+    if exponent_number == 1:
+        return base
+    if base_number is None or exponent_number is None:
+        return f"{_operand(base)}**{_operand(exponent)}"
+    if isinstance(base_number, int) and isinstance(exponent_number, int) and exponent_number > 0:
+        if exponent_number * max(abs(base_number).bit_length(), 1) <= _MAX_EXACT_POWER_BITS:
+            return base_number**exponent_number
+    try:
+        return float(base_number) ** exponent_number
+    except OverflowError:
+        return math.inf
+
+
+def _substitute(expression: Value, symbol: str, value: Value) -> Value:
+    if not isinstance(expression, str):
+        return expression
+    return re.sub(rf"(?<![\w.]){re.escape(symbol)}(?![\w.])", _operand(value), expression)
+
+
+def _terms_sum(repetition: RepetitionV1, resource_type: str) -> Value:
+    """Sum of the terms of the repetition's sequence, i.e. the total number of repetitions of the children."""
+    count = repetition.count
+    sequence = repetition.sequence
+    if sequence.type == "constant":
+        return _product([count, sequence.multiplier])
+    if sequence.type == "arithmetic":
+        count_number = _as_number(count)
+        if count_number is not None and isinstance(count_number, int):
+            # Number of pairs is an integer, which keeps the result exact if other values are integers.
+            pairs = count_number * (count_number - 1) // 2
+            return _sum([_product([count, sequence.initial_term]), _product([sequence.difference, pairs])])
+        pairs_expression = f"{_operand(count)}*({_operand(count)} - 1)/2"
+        return _sum([_product([count, sequence.initial_term]), _product([sequence.difference, pairs_expression])])
+    if sequence.type == "geometric":
+        ratio = _as_number(sequence.ratio)
+        if ratio == 1:
+            return count
+        power = _power(sequence.ratio, count)
+        power_number = _as_number(power)
+        if ratio is not None and power_number is not None:
+            if isinstance(ratio, int) and isinstance(power_number, int):
+                return (power_number - 1) // (ratio - 1)
+            return (power_number - 1) / (ratio - 1)
+        return f"({power} - 1)/({sequence.ratio} - 1)"
+    if sequence.type == "closed_form":
+        expression = sequence.sum
+        if resource_type == "multiplicative" and sequence.prod is not None:
+            expression = sequence.prod
+        if expression is None:
+            raise ValueError(f"Closed-form sequence does not provide expression for {resource_type} resources.")
+        return _substitute(expression, sequence.num_terms_symbol, count)
+    last_term = _sum([count, -1])
+    return f"sum({sequence.term_expression}, {sequence.iterator_symbol}, 0, {last_term})"
+
+
+def _repeat(resource_type: str, value: Value, repetition: RepetitionV1) -> Value:
+    if resource_type == "additive":
+        return _product([_terms_sum(repetition, resource_type), value])
+    if resource_type == "multiplicative":
+        return _power(value, _terms_sum(repetition, resource_type))
+    return value
+
+
+_COMBINE = {"additive": _sum, "multiplicative": _product, "qubits": _maximum}
+
+
+def _aggregate_values(
+    routine: RoutineV1,
+    declared: dict[str, tuple[str, T | None]],
+    children_resources: list[dict[str, tuple[str, T | None]]],
+    combine: Mapping[str, Callable[[list[T]], T]],
+    repeat: Callable[[str, T], T],
+) -> dict[str, tuple[str, T | None]]:
+    """Aggregate resources of routine's children, regardless of how their values are represented.
+
+    Args:
+        routine: the routine whose resources are aggregated.
+        declared: resources declared by the routine, which take precedence over the aggregated ones.
+        children_resources: aggregated resources of the routine's children.
+        combine: functions combining values of children, for each aggregated type of resources.
+        repeat: function computing total value of a resource of given type from the value of a single term
+            of the routine's repetition. Only called for routines with repetitions.
+
+    Returns:
+        Aggregated resources of the routine, sorted by name. Values of resources aggregated from resources
+        with unknown values (i.e. None) are unknown as well.
+    """
+    resources = dict(declared)
+    values: dict[str, list[T | None]] = {}
+    types: dict[str, str] = {}
+    for child, child_resources in zip(routine.children, children_resources):
+        for name, (resource_type, value) in child_resources.items():
+            if resource_type not in _AGGREGATED_TYPES or name in resources:
+                continue
+            if types.setdefault(name, resource_type) != resource_type:
+                raise ValueError(
+                    f"Resource {name} has different types in children of {routine.name}: "
+                    f"{types[name]} and {resource_type} (in {child.name})."
+                )
+            values.setdefault(name, []).append(value)
+
+    for name, resource_values in values.items():
+        resource_type = types[name]
+        if any(value is None for value in resource_values):
+            # Values of some resources are unknown, and so are their totals.
+            resources[name] = (resource_type, None)
+            continue
+        total = combine[resource_type](resource_values)  # type: ignore[arg-type]
+        if routine.repetition is not None:
+            total = repeat(resource_type, total)
+        resources[name] = (resource_type, total)
+
+    return dict(sorted(resources.items()))
+
+
+def _aggregate(routine: RoutineV1, children_resources: list[_Resources]) -> _Resources:
+    return _aggregate_values(
+        routine,
+        {resource.name: (resource.type, resource.value) for resource in routine.resources},
+        children_resources,
+        _COMBINE,
+        lambda resource_type, total: _repeat(resource_type, total, routine.repetition),  # type: ignore[arg-type]
+    )
+
+
+def _to_named_list(resources: _Resources) -> NamedList[ResourceV1]:
+    return NamedList(
+        _construct(ResourceV1, {"name": name, "type": resource_type, "value": value}, {"name", "type", "value"})
+        for name, (resource_type, value) in resources.items()
+    )
+
+
+@accepts_all_qref_types
+def aggregate_resources(routine: RoutineV1) -> NamedList[ResourceV1]:
+    """Compute resources of a routine aggregated from all its descendants.
+
+    Aggregated resources of all routines in the subtree are cached, so that after modifying some
+    of them (see `RoutineV1.mark_modified`), only their ancestors are aggregated again.
+
+    Args:
+        routine: routine whose resources should be aggregated.
+
+    Returns:
+        Resources of the routine, sorted by name. The resources declared by the routine are
+        returned as they are, and the remaining ones are aggregated from its children.
+
+    Raises:
+        ValueError: if the resources cannot be aggregated, e.g. because a resource has
+            different types in different children, or a closed-form sequence does not provide
+            expression needed for some resource.
+    """
+    return _to_named_list(compute_bottom_up(routine, _RESOURCES_CACHE_KEY, _aggregate))
+
+
+@accepts_all_qref_types
+def aggregate_all_resources(routine: RoutineV1) -> dict[str, NamedList[ResourceV1]]:
+    """Compute aggregated resources of a routine and all its descendants in a single pass.
+
+    Args:
+        routine: root of the subtree whose resources should be aggregated.
+
+    Returns:
+        Dictionary mapping dotted paths of the routines (starting with the name of `routine`) to their
+        aggregated resources, as returned by `aggregate_resources`.
+
+    Raises:
+        ValueError: if the resources cannot be aggregated, see `aggregate_resources`.
+    """
+    compute_bottom_up(routine, _RESOURCES_CACHE_KEY, _aggregate)
+    result: dict[str, Any] = {}
+    stack = [(routine, routine.name)]
+    while stack:
+        current, path = stack.pop()
+        result[path] = _to_named_list(cached_value(current, _RESOURCES_CACHE_KEY))
+        stack.extend((child, f"{path}.{child.name}") for child in reversed(current.children))
+    return result
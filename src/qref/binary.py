@@ -0,0 +1,472 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compact binary serialization format of programs in V1 schema.
+
+The format is tabular: every kind of object (routines, ports, resources, connections, etc.) is stored
+in its own table of fixed-size little-endian records. Strings, integers and floats are interned,
+and records refer to them by their position in the corresponding pool. Directions of ports, types
+of resources and types of sequences are encoded as small integers. Objects owned by a routine
+(e.g. its ports) are stored contiguously, and the routine's record holds the position of the first
+one and their count. Routines are stored in breadth-first order, and hence the children of every
+routine are contiguous as well.
+
+The serialized document consists of the header (see `_HEADER`) followed by the sections:
+
+1. offsets of the strings in the string data (number of strings + 1 unsigned 32-bit integers),
+2. UTF-8 encoded string data,
+3. integer pool (signed 64-bit integers),
+4. float pool (64-bit floats),
+5. tables of routines, ports, resources, connections, parameter links and repetitions,
+6. references, i.e. a table of 32-bit integers used for storing lists of strings.
+
+Values of type `int | float | str | None` are stored as a pair (tag, position in the pool).
+Integers that do not fit in 64 bits are stored as strings. Routine's `meta` is stored as a JSON
+encoded string, and hence it has to be JSON-serializable.
+"""
+
+from __future__ import annotations
+
+import json
+import struct
+from collections import deque
+from itertools import accumulate, chain, pairwise, starmap
+from typing import Any, Callable, Collection, Iterable, NamedTuple, Sequence, TypeVar
+
+from .schema_v1 import (
+    _SEQUENCE_MODELS,
+    ConnectionV1,
+    NamedList,
+    ParamLinkV1,
+    PortV1,
+    RepetitionV1,
+    ResourceV1,
+    RoutineV1,
+    SchemaV1,
+    _construct,
+)
+
+MAGIC = b"QREF"
+FORMAT_VERSION = 1
+
+# Marker of a missing optional reference (e.g. routine without type).
+_NONE = 0xFFFFFFFF
+
+# Tags of values.
+_NULL, _INT, _FLOAT, _STR, _BIG_INT = range(5)
+
+T = TypeVar("T")
+
+_INT64_MIN, _INT64_MAX = -(2**63), 2**63 - 1
+
+_DIRECTIONS = ("input", "output", "through")
+_RESOURCE_TYPES = ("additive", "multiplicative", "qubits", "other")
+_SEQUENCE_TYPES = tuple(_SEQUENCE_MODELS)
+_SEQUENCE_FIELDS = {
+    name: tuple(field for field in model.model_fields if field != "type") for name, model in _SEQUENCE_MODELS.items()
+}
+_MAX_SEQUENCE_FIELDS = 3
+_ROUTINE_FIELDS = tuple(RoutineV1.model_fields)
+
+# magic, format version, version of the schema (string), followed by sizes of the sections:
+# strings, string data (bytes), integers, floats, routines, ports, resources, connections,
+# parameter links, repetitions, references.
+_HEADER = struct.Struct("<4sH12I")
+
+# name, type, fields set (bit mask over RoutineV1.model_fields), followed by (first, count) pairs of
+# children, ports, resources, connections, input params, local variables (stored as pairs
+# of references), parameter links, and finally repetition and meta (JSON-encoded string).
+_ROUTINE = struct.Struct("<IIH14III")
+# name, direction, size (tag, value)
+_PORT = struct.Struct("<IBBI")
+# name, type, value (tag, value)
+_RESOURCE = struct.Struct("<IBBI")
+# source and target, each stored as a position of the child and the name of its port, or as _NONE
+# and the whole name, if the endpoint is a port of the routine itself.
+_CONNECTION = struct.Struct("<IIII")
+# source, first target reference, number of targets
+_PARAM_LINK = struct.Struct("<III")
+# count (tag, value), sequence type, sequence's fields set (bit mask), sequence's fields (tag, value)
+_REPETITION = struct.Struct("<BIBB" + "BI" * _MAX_SEQUENCE_FIELDS)
+
+_FLOAT64 = struct.Struct("<d")
+
+_TABLES = (_ROUTINE, _PORT, _RESOURCE, _CONNECTION, _PARAM_LINK, _REPETITION)
+_ROUTINES, _PORTS, _RESOURCES, _CONNECTIONS, _PARAM_LINKS, _REPETITIONS = range(len(_TABLES))
+
+
+class Layout(NamedTuple):
+    """Positions at which the sections of the serialized program start, as computed from its header."""
+
+    version: int
+    n_strings: int
+    string_offsets: int
+    string_data: int
+    integers: int
+    floats: int
+    routines: int
+    ports: int
+    resources: int
+    connections: int
+    param_links: int
+    repetitions: int
+    references: int
+    end: int
+
+    @classmethod
+    def from_header(cls, buffer: Any) -> Layout:
+        """Compute the layout of a serialized program from its header.
+
+        Raises:
+            ValueError: if the buffer does not start with a valid header.
+        """
+        if len(buffer) < _HEADER.size:
+            raise ValueError("Buffer is too short to contain a serialized program.")
+        magic, format_version, version, *sizes = _HEADER.unpack_from(buffer)
+        if magic != MAGIC:
+            raise ValueError("Buffer does not contain a serialized program.")
+        if format_version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported format version: {format_version}.")
+        n_strings, string_bytes, n_ints, n_floats, *n_records, n_references = sizes
+        section_sizes = [
+            4 * (n_strings + 1),
+            string_bytes,
+            8 * n_ints,
+            8 * n_floats,
+            *(table.size * n for table, n in zip(_TABLES, n_records)),
+            4 * n_references,
+        ]
+        starts = list(accumulate(section_sizes, initial=_HEADER.size))
+        if starts[-1] > len(buffer):
+            raise ValueError("Serialized program is truncated.")
+        return cls(version, n_strings, *starts)
+
+
+# Position of the first table (i.e. routines) among the fields of Layout.
+_FIRST_TABLE_FIELD = Layout._fields.index("routines")
+
+
+class _Encoder:
+    """Builder of the pools and tables of a single serialized program."""
+
+    def __init__(self) -> None:
+        self.strings: dict[str, int] = {}
+        self.ints: dict[int, int] = {}
+        # Floats are keyed by their encoding, so that e.g. 0.0 and -0.0 are kept distinct.
+        self.floats: dict[bytes, int] = {}
+        self.tables: tuple[list[tuple], ...] = tuple([] for _ in _TABLES)
+        self.references: list[int] = []
+
+    def string(self, value: str) -> int:
+        return self.strings.setdefault(value, len(self.strings))
+
+    def value(self, value: int | float | str | None) -> tuple[int, int]:
+        if value is None:
+            return _NULL, 0
+        if isinstance(value, str):
+            return _STR, self.string(value)
+        if isinstance(value, float):
+            return _FLOAT, self.floats.setdefault(_FLOAT64.pack(value), len(self.floats))
+        if _INT64_MIN <= value <= _INT64_MAX:
+            return _INT, self.ints.setdefault(value, len(self.ints))
+        return _BIG_INT, self.string(str(value))
+
+    def strings_list(self, strings: Iterable[str]) -> tuple[int, int]:
+        first = len(self.references)
+        self.references.extend(map(self.string, strings))
+        return first, len(self.references) - first
+
+    def endpoint(self, routine: RoutineV1, path: str) -> tuple[int, int]:
+        # Storing children's ports as pairs avoids interning a distinct string for each of them.
+        child_name, dot, port_name = path.partition(".")
+        if dot:
+            try:
+                return routine.children._find_index(child_name), self.string(port_name)
+            except KeyError:
+                pass
+        return _NONE, self.string(path)
+
+    def add_rows(self, table: int, rows: list[tuple]) -> tuple[int, int]:
+        first = len(self.tables[table])
+        self.tables[table].extend(rows)
+        return first, len(rows)
+
+    def add_routine(self, routine: RoutineV1, first_child: int) -> None:
+        string, value = self.string, self.value
+        fields_set = routine.model_fields_set
+        record: list[int] = [
+            string(routine.name),
+            _NONE if routine.type is None else string(routine.type),
+            sum(1 << i for i, field in enumerate(_ROUTINE_FIELDS) if field in fields_set),
+            first_child,
+            len(routine.children),
+        ]
+        record += self.add_rows(
+            _PORTS,
+            [(string(port.name), _DIRECTIONS.index(port.direction), *value(port.size)) for port in routine.ports],
+        )
+        record += self.add_rows(
+            _RESOURCES,
+            [
+                (string(resource.name), _RESOURCE_TYPES.index(resource.type), *value(resource.value))
+                for resource in routine.resources
+            ],
+        )
+        record += self.add_rows(
+            _CONNECTIONS,
+            [
+                (*self.endpoint(routine, connection.source), *self.endpoint(routine, connection.target))
+                for connection in routine.connections
+            ],
+        )
+        record += self.strings_list(routine.input_params)
+        first, _ = self.strings_list(chain.from_iterable(routine.local_variables.items()))
+        record += (first, len(routine.local_variables))
+        record += self.add_rows(
+            _PARAM_LINKS, [(string(link.source), *self.strings_list(link.targets)) for link in routine.linked_params]
+        )
+        record.append(_NONE if routine.repetition is None else self.add_repetition(routine.repetition))
+        record.append(string(json.dumps(routine.meta)) if routine.meta else _NONE)
+        self.tables[_ROUTINES].append(tuple(record))
+
+    def add_repetition(self, repetition: RepetitionV1) -> int:
+        sequence = repetition.sequence
+        field_names = _SEQUENCE_FIELDS[sequence.type]
+        fields_set = sequence.model_fields_set
+        values = [self.value(getattr(sequence, name)) for name in field_names]
+        values += [(_NULL, 0)] * (_MAX_SEQUENCE_FIELDS - len(values))
+        record = (
+            *self.value(repetition.count),
+            _SEQUENCE_TYPES.index(sequence.type),
+            sum(1 << i for i, name in enumerate(field_names) if name in fields_set),
+            *chain.from_iterable(values),
+        )
+        return self.add_rows(_REPETITIONS, [record])[0]
+
+    def encode(self, program: SchemaV1) -> bytes:
+        version = self.string(program.version)
+        # Routines are laid out in breadth-first order, so that the children of each routine are contiguous.
+        queue = deque([program.program])
+        next_child = 1
+        while queue:
+            routine = queue.popleft()
+            self.add_routine(routine, next_child)
+            next_child += len(routine.children)
+            queue.extend(routine.children)
+
+        encoded_strings = [string.encode() for string in self.strings]
+        string_offsets = list(accumulate(map(len, encoded_strings), initial=0))
+        header = _HEADER.pack(
+            MAGIC,
+            FORMAT_VERSION,
+            version,
+            len(encoded_strings),
+            string_offsets[-1],
+            len(self.ints),
+            len(self.floats),
+            *map(len, self.tables),
+            len(self.references),
+        )
+        return b"".join(
+            [
+                header,
+                _pack_array("I", string_offsets),
+                *encoded_strings,
+                _pack_array("q", self.ints),
+                *self.floats,
+                *(b"".join(starmap(table.pack, rows)) for table, rows in zip(_TABLES, self.tables)),
+                _pack_array("I", self.references),
+            ]
+        )
+
+
+def _pack_array(typecode: str, values: Collection[int]) -> bytes:
+    return struct.pack(f"<{len(values)}{typecode}", *values)
+
+
+def _unpack_array(typecode: str, buffer: Any, start: int, end: int) -> tuple:
+    count = (end - start) // struct.calcsize(typecode)
+    return struct.unpack_from(f"<{count}{typecode}", buffer, start)
+
+
+def _decode_strings(buffer: Any, layout: Layout) -> list[str]:
+    offsets = _unpack_array("I", buffer, layout.string_offsets, layout.string_data)
+    start, end = layout.string_data, layout.integers
+    data = bytes(buffer[start:end])
+    if data.isascii():
+        # Offsets of characters coincide with offsets of bytes, so the data can be decoded at once.
+        text = data.decode()
+        return [text[start:end] for start, end in pairwise(offsets)]
+    return [data[start:end].decode() for start, end in pairwise(offsets)]
+
+
+def _records(buffer: Any, layout: Layout, table: int) -> list[tuple]:
+    start = layout[_FIRST_TABLE_FIELD + table]
+    end = layout[_FIRST_TABLE_FIELD + table + 1]
+    return list(_TABLES[table].iter_unpack(memoryview(buffer)[start:end]))
+
+
+def _slice(items: Sequence[T], first: int, count: int) -> Sequence[T]:
+    end = first + count
+    return items[first:end]
+
+
+def _fields_set(names: Sequence[str], mask: int) -> set[str]:
+    return {name for i, name in enumerate(names) if mask & (1 << i)}
+
+
+def _decode_repetition(record: tuple, value: Callable[[int, int], Any]) -> RepetitionV1:
+    count_tag, count, sequence_type, mask, *values = record
+    type_name = _SEQUENCE_TYPES[sequence_type]
+    field_names = _SEQUENCE_FIELDS[type_name]
+    fields = {"type": type_name}
+    fields.update((name, value(tag, index)) for name, tag, index in zip(field_names, values[::2], values[1::2]))
+    sequence = _construct(_SEQUENCE_MODELS[type_name], fields, {"type", *_fields_set(field_names, mask)})
+    return _construct(RepetitionV1, {"count": value(count_tag, count), "sequence": sequence}, {"count", "sequence"})
+
+
+class _Decoder:
+    """Reconstruction of a program from its serialized pools and tables."""
+
+    def __init__(self, buffer: Any):
+        layout = Layout.from_header(buffer)
+        self.strings = _decode_strings(buffer, layout)
+        self.pools: tuple[Sequence[Any], ...] = (
+            (None,),
+            _unpack_array("q", buffer, layout.integers, layout.floats),
+            _unpack_array("d", buffer, layout.floats, layout.routines),
+            self.strings,
+            self.strings,
+        )
+        self.references = _unpack_array("I", buffer, layout.references, layout.end)
+        self.version = self.strings[layout.version]
+        self.tables = [_records(buffer, layout, table) for table in range(len(_TABLES))]
+
+    def value(self, tag: int, index: int) -> int | float | str | None:
+        value = self.pools[tag][index]
+        return int(value) if tag == _BIG_INT else value
+
+    def string_list(self, first: int, count: int) -> list[str]:
+        strings = self.strings
+        return [strings[i] for i in _slice(self.references, first, count)]
+
+    def ports(self, first: int, count: int) -> NamedList[PortV1]:
+        strings, value = self.strings, self.value
+        return NamedList(
+            _construct(
+                PortV1,
+                {"name": strings[name], "direction": _DIRECTIONS[direction], "size": value(tag, size)},
+                {"name", "direction", "size"},
+            )
+            for name, direction, tag, size in _slice(self.tables[_PORTS], first, count)
+        )
+
+    def resources(self, first: int, count: int) -> NamedList[ResourceV1]:
+        strings, value = self.strings, self.value
+        return NamedList(
+            _construct(
+                ResourceV1,
+                {"name": strings[name], "type": _RESOURCE_TYPES[type_], "value": value(tag, resource_value)},
+                {"name", "type", "value"},
+            )
+            for name, type_, tag, resource_value in _slice(self.tables[_RESOURCES], first, count)
+        )
+
+    def endpoint(self, children: Sequence[RoutineV1], child: int, port: int) -> str:
+        return self.strings[port] if child == _NONE else f"{children[child].name}.{self.strings[port]}"
+
+    def connections(self, first: int, count: int, children: Sequence[RoutineV1]) -> list[ConnectionV1]:
+        endpoint = self.endpoint
+        return [
+            _construct(
+                ConnectionV1,
+                {
+                    "source": endpoint(children, source_child, source_port),
+                    "target": endpoint(children, target_child, target_port),
+                },
+                {"source", "target"},
+            )
+            for source_child, source_port, target_child, target_port in _slice(self.tables[_CONNECTIONS], first, count)
+        ]
+
+    def local_variables(self, first: int, count: int) -> dict[str, str]:
+        names_and_expressions = iter(self.string_list(first, 2 * count))
+        return dict(zip(names_and_expressions, names_and_expressions))
+
+    def param_links(self, first: int, count: int) -> list[ParamLinkV1]:
+        return [
+            _construct(
+                ParamLinkV1,
+                {"source": self.strings[source], "targets": self.string_list(first_target, n_targets)},
+                {"source", "targets"},
+            )
+            for source, first_target, n_targets in _slice(self.tables[_PARAM_LINKS], first, count)
+        ]
+
+    def repetition(self, index: int) -> RepetitionV1 | None:
+        return None if index == _NONE else _decode_repetition(self.tables[_REPETITIONS][index], self.value)
+
+    def decode(self) -> SchemaV1:
+        records = self.tables[_ROUTINES]
+        routines: list[RoutineV1] = [None] * len(records)  # type: ignore[list-item]
+        strings = self.strings
+        # Children come after their parents in the breadth-first order, so routines are constructed backwards.
+        for index in range(len(records) - 1, -1, -1):
+            (
+                name,
+                type_,
+                mask,
+                first_child,
+                n_children,
+                first_port,
+                n_ports,
+                first_resource,
+                n_resources,
+                first_connection,
+                n_connections,
+                first_param,
+                n_params,
+                first_variable,
+                n_variables,
+                first_link,
+                n_links,
+                repetition,
+                meta,
+            ) = records[index]
+            children = NamedList(_slice(routines, first_child, n_children))
+            fields = {
+                "name": strings[name],
+                "children": children,
+                "type": None if type_ == _NONE else strings[type_],
+                "ports": self.ports(first_port, n_ports),
+                "resources": self.resources(first_resource, n_resources),
+                "connections": self.connections(first_connection, n_connections, children),
+                "input_params": self.string_list(first_param, n_params),
+                "local_variables": self.local_variables(first_variable, n_variables),
+                "linked_params": self.param_links(first_link, n_links),
+                "repetition": self.repetition(repetition),
+                "meta": {} if meta == _NONE else json.loads(strings[meta]),
+            }
+            routines[index] = _construct(RoutineV1, fields, _fields_set(_ROUTINE_FIELDS, mask))
+        return _construct(SchemaV1, {"version": self.version, "program": routines[0]}, {"version", "program"})
+
+
+def encode(program: SchemaV1) -> bytes:
+    """Serialize program to the compact binary format, see `SchemaV1.to_bytes`."""
+    return _Encoder().encode(program)
+
+
+def decode(buffer: Any) -> SchemaV1:
+    """Deserialize program from the compact binary format, see `SchemaV1.from_bytes`."""
+    return _Decoder(buffer).decode()
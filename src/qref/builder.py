@@ -0,0 +1,326 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Bulk construction of programs.
+
+Constructing large programs routine by routine (i.e. by instantiating `RoutineV1` for each of
+them) is slow, because pydantic validates, sorts and copies the fields of every routine
+separately. `ProgramBuilder` instead accumulates routines, ports, resources and connections in flat
+columns, validating each item with a precompiled check as it is added. The program is then
+materialized at once, with all the models constructed directly from the columns, without going
+through pydantic's validation again.
+
+The resulting program is equal to the one obtained by validating equivalent data with
+`SchemaV1.model_validate`, and invalid data is rejected with the same errors.
+"""
+
+from __future__ import annotations
+
+import re
+from array import array
+from copy import deepcopy
+from operator import attrgetter
+from typing import Any
+
+from .schema_v1 import (
+    NAME_PATTERN,
+    OPTIONALLY_NAMESPACED_NAME_PATTERN,
+    ConnectionV1,
+    NamedList,
+    PortV1,
+    ResourceV1,
+    RoutineV1,
+    SchemaV1,
+    _construct,
+)
+
+_NAME = re.compile(NAME_PATTERN)
+_ENDPOINT = re.compile(OPTIONALLY_NAMESPACED_NAME_PATTERN)
+_DIRECTIONS = frozenset(("input", "output", "through"))
+_RESOURCE_TYPES = frozenset(("additive", "multiplicative", "qubits", "other"))
+# Types of values which are stored as they are. Values of other types, including subclasses of these (e.g. bool),
+# are coerced by pydantic.
+_VALUE_TYPES = frozenset((int, float, str, type(None)))
+
+_name = attrgetter("name")
+_source = attrgetter("source")
+
+# Fields of routines which are rarely used, and hence are validated by pydantic when they are set.
+_DETAILS = ("input_params", "local_variables", "linked_params", "repetition", "meta")
+
+
+def _is_name(value: Any, pattern: re.Pattern[str] = _NAME) -> bool:
+    return isinstance(value, str) and pattern.fullmatch(value) is not None
+
+
+def _is_value(value: Any) -> bool:
+    return type(value) in _VALUE_TYPES
+
+
+class ProgramBuilder:
+    """Builder of programs with large numbers of routines.
+
+    Routines are identified by integer handles returned by `add_routine`, the root having handle 0.
+    Children of every routine are ordered as they were added.
+
+    Example:
+        >>> builder = ProgramBuilder("root")
+        >>> child = builder.add_routine(builder.root, "child")
+        >>> builder.add_port(child, "in_0", "input", "N")
+        >>> builder.add_port(builder.root, "in_0", "input", "N")
+        >>> builder.add_connection(builder.root, "in_0", "child.in_0")
+        >>> builder.build().program.children[0].ports[0].size
+        'N'
+    """
+
+    root = 0
+
+    def __init__(self, name: str, type: str | None = None):
+        """Initialize the builder with the root of the program.
+
+        Args:
+            name: name of the root routine.
+            type: type of the root routine.
+        """
+        self._names: list[str] = []
+        self._types: list[str | None] = []
+        self._parents = array("i")
+        self._details: dict[int, dict[str, Any]] = {}
+
+        self._port_routines = array("I")
+        self._port_names: list[str] = []
+        self._port_directions: list[str] = []
+        self._port_sizes: list[int | float | str | None] = []
+
+        self._resource_routines = array("I")
+        self._resource_names: list[str] = []
+        self._resource_types: list[str] = []
+        self._resource_values: list[int | float | str | None] = []
+
+        self._connection_routines = array("I")
+        self._sources: list[str] = []
+        self._targets: list[str] = []
+
+        self._add_routine(-1, name, type)
+
+    def __len__(self) -> int:
+        """Number of routines added so far, including the root."""
+        return len(self._names)
+
+    def _check_routine(self, routine: int) -> None:
+        if not 0 <= routine < len(self._names):
+            raise ValueError(f"There is no routine with handle {routine}.")
+
+    def _add_routine(self, parent: int, name: str, type: str | None) -> int:
+        if not _is_name(name) or not (type is None or isinstance(type, str)):
+            # Values rejected by the fast checks are validated by pydantic, which either raises the same error
+            # as model_validate would, or coerces them (e.g. NumPy integers) the same way.
+            routine = RoutineV1(name=name, type=type)
+            name, type = routine.name, routine.type
+        self._names.append(name)
+        self._types.append(type)
+        self._parents.append(parent)
+        return len(self._names) - 1
+
+    def add_routine(self, parent: int, name: str, type: str | None = None) -> int:
+        """Add a child to a routine.
+
+        Args:
+            parent: handle of the routine to which the child should be added.
+            name: name of the child.
+            type: type of the child.
+
+        Returns:
+            Handle of the child.
+
+        Raises:
+            ValueError: if there is no routine with handle `parent`, or the name or type are invalid.
+        """
+        self._check_routine(parent)
+        return self._add_routine(parent, name, type)
+
+    def add_port(self, routine: int, name: str, direction: str, size: int | float | str | None) -> None:
+        """Add a port to a routine.
+
+        Raises:
+            ValueError: if there is no routine with handle `routine`, or any of the port's fields is invalid.
+        """
+        self._check_routine(routine)
+        if not (_is_name(name) and direction in _DIRECTIONS and _is_value(size)):
+            port = PortV1(name=name, direction=direction, size=size)  # type: ignore[arg-type]
+            name, direction, size = port.name, port.direction, port.size
+        self._port_routines.append(routine)
+        self._port_names.append(name)
+        self._port_directions.append(direction)
+        self._port_sizes.append(size)
+
+    def add_resource(self, routine: int, name: str, type: str, value: int | float | str | None) -> None:
+        """Add a resource to a routine.
+
+        Raises:
+            ValueError: if there is no routine with handle `routine`, or any of the resource's fields is invalid.
+        """
+        self._check_routine(routine)
+        if not (_is_name(name) and type in _RESOURCE_TYPES and _is_value(value)):
+            resource = ResourceV1(name=name, type=type, value=value)  # type: ignore[arg-type]
+            name, type, value = resource.name, resource.type, resource.value
+        self._resource_routines.append(routine)
+        self._resource_names.append(name)
+        self._resource_types.append(type)
+        self._resource_values.append(value)
+
+    def add_connection(self, routine: int, source: str, target: str) -> None:
+        """Add a connection to a routine.
+
+        Ports connected by the connection are referred to as in `ConnectionV1`, i.e. relative to the
+        routine. Whether they exist is only checked by `build`, so that connections can be added
+        before the ports they connect.
+
+        Raises:
+            ValueError: if there is no routine with handle `routine`, or the source or target are invalid.
+        """
+        self._check_routine(routine)
+        if not (_is_name(source, _ENDPOINT) and _is_name(target, _ENDPOINT)):
+            connection = ConnectionV1(source=source, target=target)
+            source, target = connection.source, connection.target
+        self._connection_routines.append(routine)
+        self._sources.append(source)
+        self._targets.append(target)
+
+    def update_routine(self, routine: int, **details: Any) -> None:
+        """Set rarely used fields of a routine.
+
+        Args:
+            routine: handle of the routine to be updated.
+            details: values of any of the fields `input_params`, `local_variables`, `linked_params`,
+                `repetition` and `meta`, in any form accepted by `RoutineV1`.
+
+        Raises:
+            ValueError: if there is no routine with handle `routine`, or any of the values is invalid.
+        """
+        self._check_routine(routine)
+        if unknown := [field for field in details if field not in _DETAILS]:
+            raise ValueError(f"Fields {', '.join(unknown)} cannot be set with update_routine.")
+        validated = RoutineV1(name=self._names[routine], **details)
+        routine_details = self._details.setdefault(routine, {})
+        for field in details:
+            # Empty values are ignored by RoutineV1, and hence they reset the fields to their defaults.
+            if field in validated.model_fields_set:
+                routine_details[field] = getattr(validated, field)
+            else:
+                routine_details.pop(field, None)
+
+    def build(self) -> SchemaV1:
+        """Materialize the program.
+
+        The builder can still be used afterwards, and building again gives a new, independent program.
+
+        Returns:
+            The program, as if it was validated with `SchemaV1.model_validate`.
+
+        Raises:
+            ValueError: if some connection refers to a nonexistent port.
+        """
+        n_routines = len(self._names)
+        ports: list[list[PortV1]] = [[] for _ in range(n_routines)]
+        for routine, name, direction, size in zip(
+            self._port_routines, self._port_names, self._port_directions, self._port_sizes
+        ):
+            ports[routine].append(
+                _construct(PortV1, {"name": name, "direction": direction, "size": size}, {"name", "direction", "size"})
+            )
+        resources: list[list[ResourceV1]] = [[] for _ in range(n_routines)]
+        for routine, name, type_, value in zip(
+            self._resource_routines, self._resource_names, self._resource_types, self._resource_values
+        ):
+            resources[routine].append(
+                _construct(ResourceV1, {"name": name, "type": type_, "value": value}, {"name", "type", "value"})
+            )
+        connections: list[list[ConnectionV1]] = [[] for _ in range(n_routines)]
+        for routine, source, target in zip(self._connection_routines, self._sources, self._targets):
+            connections[routine].append(
+                _construct(ConnectionV1, {"source": source, "target": target}, {"source", "target"})
+            )
+        children: list[list[int]] = [[] for _ in range(n_routines)]
+        for child in range(1, n_routines):
+            children[self._parents[child]].append(child)
+
+        # Parents are always added before their children, hence routines are constructed backwards.
+        routines: list[RoutineV1] = [None] * n_routines  # type: ignore[list-item]
+        for index in range(n_routines - 1, -1, -1):
+            routine_children = NamedList(routines[child] for child in children[index])
+            routine_ports = ports[index]
+            routine_resources = resources[index]
+            routine_connections = connections[index]
+            # Most routines have few items of each kind, so checking their lengths is cheaper than sorting.
+            if len(routine_ports) > 1:
+                routine_ports.sort(key=_name)
+            if len(routine_resources) > 1:
+                routine_resources.sort(key=_name)
+            if len(routine_connections) > 1:
+                routine_connections.sort(key=_source)
+            if routine_connections and (missed := _missed_ports(routine_ports, routine_children, routine_connections)):
+                raise ValueError(
+                    f"The following ports appear in a connection of {self._path(index)} but are not "
+                    f"among routine's port or their children's ports: {missed}."
+                )
+            fields: dict[str, Any] = {
+                "name": self._names[index],
+                "children": routine_children,
+                "type": self._types[index],
+                "ports": NamedList(routine_ports),
+                "resources": NamedList(routine_resources),
+                "connections": routine_connections,
+                "input_params": [],
+                "local_variables": {},
+                "linked_params": [],
+                "repetition": None,
+                "meta": {},
+            }
+            # Like RoutineV1.__init__, which ignores empty lists and dictionaries.
+            fields_set = {"name"}
+            if routine_children:
+                fields_set.add("children")
+            if fields["type"] is not None:
+                fields_set.add("type")
+            if routine_ports:
+                fields_set.add("ports")
+            if routine_resources:
+                fields_set.add("resources")
+            if routine_connections:
+                fields_set.add("connections")
+            if details := self._details.get(index):
+                # Details are copied, so that modifying one built program does not affect the others.
+                fields.update(deepcopy(details))
+                fields_set.update(details)
+            routines[index] = _construct(RoutineV1, fields, fields_set)
+        return _construct(SchemaV1, {"version": "v1", "program": routines[0]}, {"version", "program"})
+
+    def _path(self, routine: int) -> str:
+        names = []
+        while routine >= 0:
+            names.append(self._names[routine])
+            routine = self._parents[routine]
+        return ".".join(reversed(names))
+
+
+def _missed_ports(ports: list[PortV1], children: list[RoutineV1], connections: list[ConnectionV1]) -> list[str]:
+    available_port_names = {port.name for port in ports}
+    available_port_names.update(f"{child.name}.{port.name}" for child in children for port in child.ports)
+    return [
+        port
+        for connection in connections
+        for port in (connection.source, connection.target)
+        if port not in available_port_names
+    ]
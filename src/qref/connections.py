@@ -0,0 +1,120 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Adjacency index of connections of a routine.
+
+Connections of a routine are stored as a flat list, sorted by their sources. The index groups them
+by their sources, targets and the children they touch, so that queries like "what is connected to
+this port" take constant time. Ports are identified as in connections, i.e. by names relative to
+the routine (e.g. `in_0` for ports of the routine itself and `a.in_0` for ports of its child `a`).
+
+The index is built on first use (validation of routines does not need it, which keeps loading programs
+cheap) and cached on the routine, until the routine is modified (see `RoutineV1.mark_modified`). Since
+the list of connections can be modified in place without marking the routine as modified, the cached
+index is only used if it was built from the same connection objects as the routine currently has.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Iterable
+
+from ._subtree_cache import routine_cache
+from .schema_v1 import ConnectionV1, RoutineV1
+
+_CONNECTION_INDEX_CACHE_KEY = "connection_index"
+
+
+class ConnectionIndex:
+    """Adjacency index of connections of a single routine.
+
+    All the lists are ordered as the connections of the routine, and should not be modified.
+
+    Attributes:
+        outgoing: mapping of ports to the lists of ports they are connected to.
+        incoming: mapping of ports to the lists of ports connected to them.
+    """
+
+    __slots__ = ("outgoing", "incoming", "_connections", "_by_child")
+
+    def __init__(self, connections: Iterable[ConnectionV1]):
+        self.outgoing: dict[str, list[str]] = {}
+        self.incoming: dict[str, list[str]] = {}
+        self._connections = list(connections)
+        self._by_child: dict[str, list[ConnectionV1]] | None = None
+        for connection in self._connections:
+            source, target = connection.source, connection.target
+            if (targets := self.outgoing.get(source)) is None:
+                targets = self.outgoing[source] = []
+            targets.append(target)
+            if (sources := self.incoming.get(target)) is None:
+                sources = self.incoming[target] = []
+            sources.append(source)
+
+    @property
+    def by_child(self) -> dict[str, list[ConnectionV1]]:
+        """Mapping of names of children to the lists of connections leading to or from any of their ports.
+
+        Connections between ports of the routine itself are not included. Since topology
+        verification does not need this mapping, it is only built on first access.
+        """
+        if self._by_child is None:
+            self._by_child = {}
+            for connection in self._connections:
+                source_child = connection.source.partition(".")[0] if "." in connection.source else None
+                target_child = connection.target.partition(".")[0] if "." in connection.target else None
+                if source_child is not None:
+                    self._by_child.setdefault(source_child, []).append(connection)
+                if target_child is not None and target_child != source_child:
+                    self._by_child.setdefault(target_child, []).append(connection)
+        return self._by_child
+
+    def _is_built_from(self, connections: list[ConnectionV1]) -> bool:
+        return len(self._connections) == len(connections) and all(
+            indexed is connection for indexed, connection in zip(self._connections, connections)
+        )
+
+    def targets(self, port: str) -> list[str]:
+        """Get ports to which given port is connected."""
+        return self.outgoing.get(port, [])
+
+    def sources(self, port: str) -> list[str]:
+        """Get ports connected to given port."""
+        return self.incoming.get(port, [])
+
+    def child_connections(self, child: str) -> list[ConnectionV1]:
+        """Get connections leading to or from ports of the child with given name."""
+        return self.by_child.get(child, [])
+
+    def is_connected(self, port: str) -> bool:
+        """Check if given port is a source or a target of any connection."""
+        return port in self.outgoing or port in self.incoming
+
+
+def connection_index(routine: RoutineV1) -> ConnectionIndex:
+    """Get the adjacency index of connections of a routine.
+
+    The index is cached on the routine, and shared by all its users (e.g. topology verification).
+
+    Args:
+        routine: the routine whose connections should be indexed. Connections of its descendants
+            are not included.
+
+    Returns:
+        Index of connections of the routine.
+    """
+    cache = routine_cache(routine)
+    index = cache.get(_CONNECTION_INDEX_CACHE_KEY)
+    if index is None or not index._is_built_from(routine.connections):
+        index = cache[_CONNECTION_INDEX_CACHE_KEY] = ConnectionIndex(routine.connections)
+    return index
@@ -0,0 +1,260 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Storing programs with identical subroutines factored out as definitions.
+
+In the "definitions + references" form, the document contains, next to the usual `version`
+and `program` fields, a `definitions` mapping from names of definitions to routines without
+names. A child of any routine (including a definition) can then be given as a reference
+`{"name": "child_name", "ref": "definition_name"}`, which stands for the definition named
+`child_name`. For instance:
+
+```yaml
+version: v1
+definitions:
+  leaf:
+    ports: [{name: in_0, direction: input, size: N}]
+program:
+  name: root
+  children:
+    - {name: a, ref: leaf}
+    - {name: b, ref: leaf}
+```
+
+Programs are converted to this form with `dump_with_definitions`, which factors out all
+subroutines occurring more than once (as detected by their fingerprints). Documents in this
+form can be loaded either with `load_with_definitions`, which validates each definition
+only once and shares its contents between all the routines referring to it, or expanded to
+the ordinary form with `expand_definitions`.
+"""
+
+from __future__ import annotations
+
+import re
+from collections import Counter
+from collections.abc import Iterator
+from typing import Any
+
+from .schema_v1 import (
+    NAME_PATTERN,
+    RoutineV1,
+    SchemaV1,
+    _construct,
+)
+
+_REF_KEY = "ref"
+_DEFINITIONS_KEY = "definitions"
+
+
+def dump_with_definitions(program: SchemaV1) -> dict[str, Any]:
+    """Dump program to a dictionary in which identical subroutines are stored only once.
+
+    Every subroutine (other than the program itself) occurring more than once in the program
+    is stored as a definition, and all its occurrences are replaced by references to it.
+    Definitions are named after the first occurrence of the corresponding subroutine.
+
+    Args:
+        program: program to be dumped.
+
+    Returns:
+        Dictionary with the program in the "definitions + references" form, with unset fields
+        excluded as in `model_dump(exclude_unset=True)`. If the program does not contain any
+        repeated subroutines, the dictionary does not contain definitions at all.
+    """
+    occurrences: Counter[str] = Counter()
+    subroutines = list(program.program.children)
+    while subroutines:
+        subroutine = subroutines.pop()
+        occurrences[subroutine.fingerprint()] += 1
+        subroutines.extend(subroutine.children)
+
+    definitions: dict[str, dict[str, Any]] = {}
+    definition_names: dict[str, str] = {}
+
+    def _dump(routine: RoutineV1, children: list[dict[str, Any]]) -> dict[str, Any]:
+        data = routine.model_dump(exclude={"children"}, exclude_unset=True)
+        if routine.children:
+            data["children"] = children
+        return data
+
+    # Routines being dumped, with iterators over their remaining children, their dumped children and names of
+    # definitions they are dumped as (if any). Routines are visited in pre-order, so that definitions are named
+    # in the order of first occurrences of the corresponding subroutines.
+    stack: list[tuple[RoutineV1, Iterator[RoutineV1], list[dict[str, Any]], str | None]] = [
+        (program.program, iter(program.program.children), [], None)
+    ]
+    while True:
+        routine, children, dumped_children, definition_name = stack[-1]
+        if (child := next(children, None)) is None:
+            stack.pop()
+            data = _dump(routine, dumped_children)
+            if not stack:
+                break
+            if definition_name is not None:
+                del data["name"]
+                definitions[definition_name] = data
+                data = {"name": routine.name, _REF_KEY: definition_name}
+            stack[-1][2].append(data)
+            continue
+        fingerprint = child.fingerprint()
+        if occurrences[fingerprint] < 2:
+            stack.append((child, iter(child.children), [], None))
+        elif fingerprint in definition_names:
+            dumped_children.append({"name": child.name, _REF_KEY: definition_names[fingerprint]})
+        else:
+            name = child.name
+            suffix = 1
+            while name in definitions:
+                name = f"{child.name}_{suffix}"
+                suffix += 1
+            definition_names[fingerprint] = name
+            # Definition is reserved before dumping it, so that nested definitions get different names.
+            definitions[name] = {}
+            stack.append((child, iter(child.children), [], name))
+
+    result = program.model_dump(exclude={"program"}, exclude_unset=True)
+    result["program"] = data
+    if definitions:
+        result[_DEFINITIONS_KEY] = definitions
+    return result
+
+
+def load_with_definitions(data: dict[str, Any]) -> SchemaV1:
+    """Load program stored in the "definitions + references" form.
+
+    Each definition is validated only once, and all routines referring to it share its contents
+    (e.g. lists of ports and children). Hence, loading a program with many references takes
+    considerably less time and memory than loading its expanded form.
+
+    Warning:
+        Since routines referring to the same definition share their contents, all their
+        descendants are shared as well, i.e. the loaded program is a directed acyclic graph
+        rather than a tree. Assigning to fields of the routines referring to definitions is
+        safe, but neither they nor their descendants should be modified in place. To obtain
+        a program which can be freely modified, validate the result of `expand_definitions`.
+
+    Args:
+        data: dictionary with program in the "definitions + references" form. Ordinary programs,
+            without definitions, are accepted as well.
+
+    Returns:
+        Validated program, equal to the one obtained by validating the expanded form of `data`.
+
+    Raises:
+        ValueError: if the document refers to an unknown definition, definitions refer to each
+            other cyclically, or the program is otherwise invalid.
+    """
+    definitions: dict[str, dict[str, Any]] = data.get(_DEFINITIONS_KEY, {})
+    # None marks definitions being loaded, which allows for detecting cycles.
+    resolved: dict[str, RoutineV1 | None] = {}
+
+    # Routines being loaded, with iterators over data of their remaining children, their loaded children and
+    # names of definitions they are loaded from (if any).
+    stack: list[tuple[dict[str, Any], Iterator[dict[str, Any]], list[RoutineV1], str | None]] = [
+        (data["program"], iter(data["program"].get("children", ())), [], None)
+    ]
+    while True:
+        routine_data, children, loaded_children, definition_name = stack[-1]
+        if (child := next(children, None)) is None:
+            stack.pop()
+            if "children" in routine_data:
+                routine_data = {**routine_data, "children": loaded_children}
+            routine = RoutineV1.model_validate(routine_data)
+            if definition_name is not None:
+                resolved[definition_name] = routine
+                routine = _renamed(routine, routine.name)
+            if not stack:
+                break
+            stack[-1][2].append(routine)
+        elif _REF_KEY not in child:
+            stack.append((child, iter(child.get("children", ())), [], None))
+        else:
+            name, child_definition_name = child["name"], child[_REF_KEY]
+            if not re.fullmatch(NAME_PATTERN, name):
+                raise ValueError(
+                    f"Invalid name of the routine referring to definition {child_definition_name}: {name}."
+                )
+            if child_definition_name not in resolved:
+                if child_definition_name not in definitions:
+                    raise ValueError(f"Reference to unknown definition: {child_definition_name}.")
+                resolved[child_definition_name] = None
+                definition = {**definitions[child_definition_name], "name": name}
+                stack.append((definition, iter(definition.get("children", ())), [], child_definition_name))
+            elif (resolved_definition := resolved[child_definition_name]) is None:
+                raise ValueError(f"Definition {child_definition_name} refers to itself.")
+            else:
+                loaded_children.append(_renamed(resolved_definition, name))
+
+    return SchemaV1.model_validate(
+        {key: value for key, value in data.items() if key != _DEFINITIONS_KEY} | {"program": routine}
+    )
+
+
+def expand_definitions(data: dict[str, Any]) -> dict[str, Any]:
+    """Expand all references in a program stored in the "definitions + references" form.
+
+    Args:
+        data: dictionary with program in the "definitions + references" form.
+
+    Returns:
+        Dictionary with the same program in the ordinary V1 form, in which every reference
+        is replaced by a copy of the definition it refers to.
+
+    Raises:
+        ValueError: if the document refers to an unknown definition, or definitions refer to each
+            other cyclically.
+    """
+    definitions: dict[str, dict[str, Any]] = data.get(_DEFINITIONS_KEY, {})
+    expanding: set[str] = set()
+
+    def _start(
+        routine: dict[str, Any],
+    ) -> tuple[dict[str, Any], Iterator[dict[str, Any]], list[dict[str, Any]], str | None]:
+        if _REF_KEY not in routine:
+            return routine, iter(routine.get("children", ())), [], None
+        definition_name = routine[_REF_KEY]
+        if definition_name not in definitions:
+            raise ValueError(f"Reference to unknown definition: {definition_name}.")
+        if definition_name in expanding:
+            raise ValueError(f"Definition {definition_name} refers to itself.")
+        expanding.add(definition_name)
+        definition = {"name": routine["name"], **definitions[definition_name]}
+        return definition, iter(definition.get("children", ())), [], definition_name
+
+    # Routines being expanded, with iterators over their remaining children, their expanded children and names
+    # of definitions they are expanded from (if any).
+    stack = [_start(data["program"])]
+    while True:
+        routine, children, expanded_children, definition_name = stack[-1]
+        if (child := next(children, None)) is not None:
+            stack.append(_start(child))
+            continue
+        stack.pop()
+        expanded_routine = {**routine, "children": expanded_children} if "children" in routine else dict(routine)
+        if definition_name is not None:
+            expanding.remove(definition_name)
+        if not stack:
+            break
+        stack[-1][2].append(expanded_routine)
+
+    expanded = {key: value for key, value in data.items() if key != _DEFINITIONS_KEY}
+    expanded["program"] = expanded_routine
+    return expanded
+
+
+def _renamed(routine: RoutineV1, name: str) -> RoutineV1:
+    # Shallow copy of the routine, sharing all its fields but the name, but not the bookkeeping data,
+    # so that both routines track their modifications independently.
+    fields = {**routine.__dict__, "name": name}
+    return _construct(RoutineV1, fields, set(routine.model_fields_set))
@@ -0,0 +1,291 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Batch evaluation of resources over grids of parameters.
+
+Values of resources are evaluated for many values of parameters at once, by evaluating compiled
+expressions over NumPy arrays (see `qref.expressions`).
+Parameters are given as a mapping from names to numbers or arrays, which are broadcast against
+each other. Names can be qualified with a dotted path of a routine (e.g. `root.usp.L`), in which
+case the value is only visible in that routine, and takes precedence over unqualified values.
+
+Resources can also be aggregated from the leaves up to the root (as in `qref.aggregation`), with
+repetitions evaluated in closed form, which takes constant time regardless of their counts, except
+for custom sequences, whose terms are summed in vectorized chunks.
+
+Evaluation requires NumPy, which is an optional dependency of QREF.
+"""
+
+from __future__ import annotations
+
+from collections import ChainMap
+from collections.abc import Iterator, Mapping
+from typing import Any
+
+from .aggregation import _aggregate_values
+from .expressions import _functions, _import_numpy, compile_expression
+from .functools import accepts_all_qref_types
+from .schema_v1 import RepetitionV1, RoutineV1
+
+
+def parameter_grid(**axes: Any) -> dict[str, Any]:
+    """Construct a grid of all combinations of values of given parameters.
+
+    Args:
+        axes: values of each parameter, as sequences of numbers.
+
+    Returns:
+        Dictionary mapping names of parameters to flat arrays of equal lengths, such that the
+        i-th elements of the arrays form the i-th point of the grid.
+
+    Example:
+        >>> grid = parameter_grid(L=[4, 8], mu=[1, 2, 3])
+        >>> grid["L"].tolist(), grid["mu"].tolist()
+        ([4.0, 4.0, 4.0, 8.0, 8.0, 8.0], [1.0, 2.0, 3.0, 1.0, 2.0, 3.0])
+    """
+    np = _import_numpy()
+    arrays = np.meshgrid(*(np.asarray(values, dtype=float) for values in axes.values()), indexing="ij")
+    return {name: array.ravel() for name, array in zip(axes, arrays)}
+
+
+class _Scope(Mapping[str, Any]):
+    """Values of symbols in a routine, with local variables evaluated lazily when needed."""
+
+    def __init__(self, path: str, routine: RoutineV1, parameters: Mapping[str, Any]):
+        self._path = path
+        self._local_variables = routine.local_variables
+        self._parameters = parameters
+        self._values: dict[str, Any] = {}
+        self._evaluating: set[str] = set()
+
+    def __getitem__(self, name: str) -> Any:
+        if (qualified := f"{self._path}.{name}") in self._parameters:
+            return self._parameters[qualified]
+        if name in self._values:
+            return self._values[name]
+        if name in self._local_variables:
+            if name in self._evaluating:
+                raise ValueError(f"Local variable {name} of {self._path} depends on itself.")
+            self._evaluating.add(name)
+            value = self._values[name] = compile_expression(self._local_variables[name])(self)
+            self._evaluating.remove(name)
+            return value
+        return self._parameters[name]
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._local_variables or name in self._parameters or f"{self._path}.{name}" in self._parameters
+
+    def __iter__(self) -> Iterator[str]:
+        return iter({**self._parameters, **self._local_variables})
+
+    def __len__(self) -> int:
+        return len({**self._parameters, **self._local_variables})
+
+
+@accepts_all_qref_types
+def evaluate_resources(
+    routine: RoutineV1, parameters: Mapping[str, Any], strict: bool = True
+) -> dict[str, dict[str, Any]]:
+    """Evaluate resources of a routine and all its descendants over a grid of parameters.
+
+    Only resources declared by the routines are evaluated. Resources of type `other` and ones
+    with unknown values are skipped. Expressions can refer to parameters and to local variables
+    of the routine they belong to.
+
+    Args:
+        routine: root of the program whose resources should be evaluated.
+        parameters: values of parameters, as numbers or NumPy arrays broadcastable against each
+            other, e.g. as returned by `parameter_grid`. Names qualified with paths of routines
+            are visible only in these routines.
+        strict: if False, resources which cannot be evaluated (e.g. because their values are not
+            valid expressions) are omitted from the result instead of raising an error.
+
+    Returns:
+        Dictionary mapping dotted paths of the routines (starting with the name of `routine`) to
+        dictionaries mapping names of their resources to arrays of values, one value per point of
+        the grid.
+
+    Raises:
+        ValueError: if `strict` is True, and some expression is malformed or refers to a symbol
+            without value.
+        ImportError: if NumPy is not installed.
+    """
+    np = _import_numpy()
+    arrays = {name: np.asarray(values, dtype=float) for name, values in parameters.items()}
+    shape = np.broadcast_shapes(*(array.shape for array in arrays.values()))
+
+    result: dict[str, dict[str, Any]] = {}
+    stack = [(routine, routine.name)]
+    while stack:
+        current, path = stack.pop()
+        scope = _Scope(path, current, arrays)
+        resources = result[path] = {}
+        for resource in current.resources:
+            if resource.type == "other" or resource.value is None:
+                continue
+            try:
+                value = compile_expression(resource.value)(scope)
+            except ValueError as error:
+                if not strict:
+                    continue
+                raise ValueError(f"Cannot evaluate resource {resource.name} of {path}: {error}") from error
+            resources[resource.name] = np.array(np.broadcast_to(value, shape))
+        stack.extend((child, f"{path}.{child.name}") for child in reversed(current.children))
+    return result
+
+
+def evaluate_repetition(repetition: RepetitionV1, values: Mapping[str, Any], resource_type: str = "additive") -> Any:
+    """Evaluate the total number of repetitions, i.e. the sum of terms of the repetition's sequence.
+
+    Constant, arithmetic and geometric sequences are summed in closed form. For closed-form sequences,
+    their `sum` (or `prod`, if provided, for multiplicative resources) is evaluated with `num_terms_symbol`
+    standing for the count. Terms of custom sequences are summed over the whole grid at once.
+
+    Args:
+        repetition: the repetition to be evaluated.
+        values: values of symbols occurring in the repetition, as numbers or NumPy arrays.
+        resource_type: type of resources the sum is needed for. Only matters for closed-form sequences.
+
+    Returns:
+        The sum of terms, as a float or an array of floats.
+
+    Raises:
+        ValueError: if some expression is malformed or refers to a symbol without value, or a closed-form
+            sequence does not provide expression needed for given type of resources.
+    """
+    np = _import_numpy()
+    count = compile_expression(repetition.count)(values)
+    sequence = repetition.sequence
+
+    def _evaluate(expression: Any) -> Any:
+        return compile_expression(expression)(values)
+
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        if sequence.type == "constant":
+            return count * _evaluate(sequence.multiplier)
+        if sequence.type == "arithmetic":
+            return count * _evaluate(sequence.initial_term) + _evaluate(sequence.difference) * count * (count - 1) / 2
+        if sequence.type == "geometric":
+            ratio = _evaluate(sequence.ratio)
+            return np.where(ratio == 1, count, (ratio**count - 1) / np.where(ratio == 1, 2, ratio - 1))
+        if sequence.type == "closed_form":
+            expression = sequence.sum
+            if resource_type == "multiplicative" and sequence.prod is not None:
+                expression = sequence.prod
+            if expression is None:
+                raise ValueError(f"Closed-form sequence does not provide expression for {resource_type} resources.")
+            scope = ChainMap({sequence.num_terms_symbol: count}, values)  # type: ignore[arg-type]
+            return compile_expression(expression)(scope)
+        term = compile_expression(sequence.term_expression)
+        return _functions()["sum"](term, values, sequence.iterator_symbol, 0, count - 1, term.symbols)
+
+
+# Reductions of NumPy arrays combining values of resources of children, see `qref.aggregation`.
+_REDUCTIONS = {"additive": "add", "multiplicative": "multiply", "qubits": "maximum"}
+
+
+def _aggregate_evaluated(
+    routine: RoutineV1,
+    path: str,
+    children_resources: list[dict[str, tuple[str, Any]]],
+    parameters: Mapping[str, Any],
+    shape: tuple[int, ...],
+    strict: bool,
+) -> dict[str, tuple[str, Any]]:
+    np = _import_numpy()
+    scope = _Scope(path, routine, parameters)
+    declared: dict[str, tuple[str, Any]] = {}
+    for resource in routine.resources:
+        if resource.type == "other":
+            continue
+        value = np.nan
+        if resource.value is not None:
+            try:
+                value = compile_expression(resource.value)(scope)
+            except ValueError as error:
+                if strict:
+                    raise ValueError(f"Cannot evaluate resource {resource.name} of {path}: {error}") from error
+        declared[resource.name] = (resource.type, np.broadcast_to(value, shape))
+
+    def _repeat(resource_type: str, total: Any) -> Any:
+        if resource_type == "qubits":
+            return total
+        try:
+            repetitions = evaluate_repetition(routine.repetition, scope, resource_type)  # type: ignore[arg-type]
+        except ValueError as error:
+            if strict:
+                raise ValueError(f"Cannot evaluate repetition of {path}: {error}") from error
+            repetitions = np.nan
+        with np.errstate(over="ignore", invalid="ignore"):
+            return np.broadcast_to(total * repetitions if resource_type == "additive" else total**repetitions, shape)
+
+    combine = {resource_type: getattr(np, name).reduce for resource_type, name in _REDUCTIONS.items()}
+    return _aggregate_values(routine, declared, children_resources, combine, _repeat)
+
+
+@accepts_all_qref_types
+def evaluate_aggregated_resources(
+    routine: RoutineV1, parameters: Mapping[str, Any], strict: bool = True
+) -> dict[str, dict[str, Any]]:
+    """Evaluate resources of a routine and all its descendants, aggregated from the leaves, over a grid.
+
+    Resources are aggregated as in `qref.aggregation.aggregate_resources`, except that values are
+    evaluated numerically at every step. Repetitions, including nested ones, are evaluated with
+    `evaluate_repetition`, without unrolling them.
+
+    Args:
+        routine: root of the program whose resources should be evaluated.
+        parameters: values of parameters, see `evaluate_resources`.
+        strict: if False, declared resources and repetitions which cannot be evaluated are treated as
+            unknown instead of raising an error. Values of unknown resources, and ones aggregated from them, are NaNs.
+
+    Returns:
+        Dictionary mapping dotted paths of the routines (starting with the name of `routine`) to
+        dictionaries mapping names of their resources, sorted by name, to arrays of values, one value
+        per point of the grid. If several routines have the same path (i.e. some routine has multiple
+        children with the same name), only the first of them is included, consistently with accessing
+        children by name. Resources of all of them are still aggregated into their ancestors.
+
+    Raises:
+        ValueError: if `strict` is True and some expression cannot be evaluated, or if resources
+            cannot be aggregated (see `qref.aggregation.aggregate_resources`).
+        ImportError: if NumPy is not installed.
+    """
+    np = _import_numpy()
+    arrays = {name: np.asarray(values, dtype=float) for name, values in parameters.items()}
+    shape = np.broadcast_shapes(*(array.shape for array in arrays.values()))
+
+    result: dict[str, dict[str, Any]] = {}
+    # Frames of the post-order traversal hold a routine, its path, the list to which its aggregated resources are
+    # appended (the one of its parent), the list of aggregated resources of its children, once they are visited,
+    # and whether the routine is included in the result. Passing the resources along, instead of looking them up
+    # by paths, keeps children with equal paths apart.
+    stack: list[tuple[RoutineV1, str, list[Any], list[Any] | None, bool]] = [(routine, routine.name, [], None, True)]
+    while stack:
+        current, path, siblings_resources, children_resources, included = stack.pop()
+        if children_resources is None:
+            # Reserves the routine's place in the result, so that routines are listed in pre-order.
+            included = path not in result
+            result.setdefault(path, {})
+            children_resources = []
+            stack.append((current, path, siblings_resources, children_resources, included))
+            stack.extend(
+                (child, f"{path}.{child.name}", children_resources, None, True) for child in reversed(current.children)
+            )
+            continue
+        resources = _aggregate_evaluated(current, path, children_resources, arrays, shape, strict)
+        siblings_resources.append(resources)
+        if included:
+            result[path] = {name: np.array(value) for name, (_, value) in resources.items()}
+    return result
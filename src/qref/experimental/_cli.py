@@ -0,0 +1,86 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Entry point of the `qref-render` CLI tool.
+
+This module only imports the standard library, and the rendering module (and hence pydantic,
+graphviz, etc.) is imported only once the arguments are parsed. Hence, invocations like
+`qref-render --help`, or ones with invalid arguments, return immediately.
+"""
+
+import sys
+from argparse import ArgumentParser
+from pathlib import Path
+
+
+def render_entry_point():
+    parser = ArgumentParser(
+        description=(
+            "Render a program into a file, or with --output-dir, render many programs into files in given directory."
+        )
+    )
+    parser.add_argument(
+        "paths",
+        help=(
+            "Path to the YAML or JSON file with Routine in V1 schema, followed by path to the output file. "
+            "File format is determined based on the extension, which should be either .svg or .pdf. "
+            "With --output-dir, paths of the input files, directories containing them or glob patterns"
+        ),
+        nargs="+",
+    )
+    parser.add_argument("--output-dir", help="Directory for the output files, enables rendering many files", type=Path)
+    parser.add_argument("--format", help="Format of the output files rendered with --output-dir", default="svg")
+    parser.add_argument(
+        "--jobs", help="Number of processes rendering files with --output-dir in parallel", type=int, default=1
+    )
+    parser.add_argument(
+        "--max-depth",
+        help="Render routines only down to this depth, drawing deeper non-leaf routines collapsed",
+        type=int,
+    )
+    parser.add_argument("--path", help="Dotted path of the routine to render instead of the whole program")
+
+    args = parser.parse_args()
+
+    # Imported only after parsing the arguments, see the module's docstring.
+    from .rendering import (
+        _expand_inputs,
+        _load_program,
+        _render_dot,
+        _resolve_rendered_routine,
+        render_files,
+    )
+
+    if args.output_dir is not None:
+        try:
+            errors = render_files(
+                _expand_inputs(args.paths), args.output_dir, args.format, args.jobs, args.max_depth, args.path
+            )
+        except ValueError as error:
+            parser.error(str(error))
+        for input_path, message in errors.items():
+            print(f"Failed to render {input_path}: {message}", file=sys.stderr)
+        sys.exit(1 if errors else 0)
+
+    if len(args.paths) != 2:
+        parser.error("exactly one input and one output path are required without --output-dir")
+    input_path, output_path = map(Path, args.paths)
+
+    routine = _load_program(input_path)
+
+    try:
+        rendered, parent_path = _resolve_rendered_routine(routine.program, args.max_depth, args.path)
+    except ValueError as error:
+        parser.error(str(error))
+    _render_dot(rendered, output_path, parent_path, args.max_depth)
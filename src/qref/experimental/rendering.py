@@ -32,17 +32,27 @@ Because of the above dichotomy, care has to be taken when constructing edges.
   "root.child.in_0"
 """
 
-from argparse import ArgumentParser
+from __future__ import annotations
+
+from collections import Counter
+from collections.abc import Iterable, Iterator, Sequence
+from functools import lru_cache
+from glob import glob
 from pathlib import Path
+from typing import TextIO
 
 import graphviz
 import yaml
+from graphviz.quoting import a_list, quote, quote_edge
 
-from qref.functools import accepts_all_qref_types, ensure_routine
+from qref.functools import accepts_all_qref_types
 from qref.schema_v1 import RoutineV1
 
 from .. import SchemaV1
 
+# Entry point of qref-render used to be defined here, and hence it is still importable from this module.
+from ._cli import render_entry_point  # noqa: F401
+
 # Dictionary of default graph attributes, used for non-leaf nodes
 GRAPH_ATTRS = {
     "rankdir": "LR",  # Draw left to right (default is top to bottom)
@@ -58,6 +68,9 @@ LEAF_NODE_KWARGS = {
     "fontsize": "12",  # Larger font size then e.g. ports of non-leafs
 }
 
+# Keyword args passed to dag.node for drawing non-leaf nodes collapsed due to the depth limit
+COLLAPSED_NODE_KWARGS = {**LEAF_NODE_KWARGS, "style": "bold,dashed"}  # Dashed border marks hidden children
+
 # Keyword args passed to dag.node for drawing ports of non-leaf nodes
 PORT_NODE_KWARGS = {
     "style": "bold",  # Bold border
@@ -82,8 +95,8 @@ PORT_GROUP_ATTRS = {"rank": "same"}  # Place all ports in the group in the same
 CLUSTER_KWARGS = {"style": "rounded"}  # Make cluster edges rounded
 
 
-def _format_node_name(node_name, parent, full_path):
-    """Given a node name and a parent container, format it accordingly.
+def _format_node_name(node_name, leaves, full_path):
+    """Given a node name and names of leaf children of its parent, format it accordingly.
 
     Read the module-level docstring for explanation why different port formats
     of ports are being used.
@@ -93,17 +106,64 @@ def _format_node_name(node_name, parent, full_path):
 
     # Resolve the child, assume the graph is correct and thus the child exists.
     child_name, port_name = node_name.split(".")
-    child = next(iter((child for child in parent.children if child.name == child_name)))
-    if child.children:  # Case 2: port of non-leaf child (=> port is a graphviz node)
+    if child_name not in leaves:  # Case 2: port of non-leaf child (=> port is a graphviz node)
         return f'"{full_path}.{node_name}"'
     else:  # Case 3: port of leaf child (=> port is an actual port of Mrecord, use ":")
         return f'"{full_path}.{child_name}": {port_name}'
 
 
-def _add_nonleaf_ports(ports, parent_cluster, parent_path: str, group_name):
-    with parent_cluster.subgraph(name=f"{parent_path}: {group_name}", graph_attr=PORT_GROUP_ATTRS) as subgraph:
-        for port in ports:
-            subgraph.node(name=f'"{parent_path}.{port.name}"', label=port.name, **PORT_NODE_KWARGS)
+@lru_cache(maxsize=None)
+def _attributes(items: tuple[tuple[str, str], ...]) -> str:
+    # Nodes and edges are drawn with a handful of distinct sets of attributes, hence they are quoted only once.
+    return a_list(kwargs=dict(items))
+
+
+def _attr_list(label: str | None, attrs: dict[str, str]) -> str:
+    """Format a list of attributes exactly as `graphviz.quoting.attr_list` does."""
+    parts = [f"label={quote(label)}"] if label is not None else []
+    if attrs and (attributes := _attributes(tuple(attrs.items()))):
+        parts.append(attributes)
+    return f" [{' '.join(parts)}]" if parts else ""
+
+
+class _DotFormatter:
+    """Formatter of lines of DOT source describing nodes, edges and nested subgraphs.
+
+    Lines are the same as the ones added by `graphviz.Digraph` (names and attributes are quoted by
+    the functions graphviz uses), and indented according to the nesting of subgraphs opened so far.
+    However, they are formatted directly, without the object layer of `graphviz.Digraph`, and every
+    line is formatted exactly once, so that it can be emitted right away. In contrast, subgraphs
+    created with `graphviz.Digraph.subgraph` are copied into their parents once they are complete.
+    """
+
+    def __init__(self) -> None:
+        self.indent = ""
+        self._tails: list[str] = []
+
+    def node(self, name: str, label: str | None = None, **attrs: str) -> str:
+        return f"{self.indent}\t{quote(name)}{_attr_list(label, attrs)}\n"
+
+    def edge(self, tail_name: str, head_name: str, **attrs: str) -> str:
+        return f"{self.indent}\t{quote_edge(tail_name)} -> {quote_edge(head_name)}{_attr_list(None, attrs)}\n"
+
+    def open_subgraph(self, name: str, graph_attr: dict[str, str]) -> list[str]:
+        self.indent += "\t"
+        head = [f"{self.indent}subgraph {quote(name)} {{\n"]
+        if graph_attr:
+            head.append(f"{self.indent}\tgraph{_attr_list(None, graph_attr)}\n")
+        self._tails.append(f"{self.indent}}}\n")
+        return head
+
+    def close_subgraph(self) -> str:
+        self.indent = self.indent[:-1]
+        return self._tails.pop()
+
+
+def _nonleaf_ports_lines(ports, formatter: _DotFormatter, parent_path: str, group_name) -> Iterator[str]:
+    yield from formatter.open_subgraph(name=f"{parent_path}: {group_name}", graph_attr=PORT_GROUP_ATTRS)
+    for port in ports:
+        yield formatter.node(name=f'"{parent_path}.{port.name}"', label=port.name, **PORT_NODE_KWARGS)
+    yield formatter.close_subgraph()
 
 
 def _split_ports(ports):
@@ -120,94 +180,267 @@ def _split_ports(ports):
     return input_ports, output_ports, through_ports
 
 
-def _add_nonleaf(routine, dag: graphviz.Digraph, parent_path: str) -> None:
+def _nonleaf_opening_lines(routine, formatter: _DotFormatter, full_path: str) -> Iterator[str]:
+    """Generate lines opening the cluster of a non-leaf routine, i.e. the ones preceding its children."""
     input_ports, output_ports, through_ports = _split_ports(routine.ports)
-    full_path = f"{parent_path}.{routine.name}"
-
-    with dag.subgraph(name=f"cluster_{full_path}", graph_attr={"label": routine.name, **CLUSTER_KWARGS}) as cluster:
-        _add_nonleaf_ports(input_ports, cluster, full_path, "inputs")
-        _add_nonleaf_ports(output_ports, cluster, full_path, "outputs")
-        _add_nonleaf_ports(through_ports, cluster, full_path, "through")
-
-        # We're adding ghost nodes and edges to position the through ports in the middle
-        for port in through_ports:
-            dummy_out = f'"{full_path}.{port.name}_out"'
-            dummy_in = f'"{full_path}.{port.name}_in"'
-            pname = f'"{full_path}.{port.name}"'
-            cluster.node(dummy_in, label="", style="invis")
-            cluster.node(dummy_out, label="", style="invis")
-            cluster.edge(dummy_in, pname, style="invis")
-            cluster.edge(pname, dummy_out, style="invis")
-
-        for child in routine.children:
-            _add_routine(child, cluster, f"{parent_path}.{routine.name}")
-
-        for connection in routine.connections:
-            cluster.edge(
-                _format_node_name(connection.source, routine, full_path),
-                _format_node_name(connection.target, routine, full_path),
-            )
-
-        if routine.repetition is not None:
-            label = "Repeated subroutine"
-            repetition_type = routine.repetition.sequence.type
-            count = routine.repetition.count
-            node_structure = f"{label} | {{type: {repetition_type}}} | {{count: {count}}}"
-            # Similarly to through ports, we add ghost nodes and edges to center repetition
-            cname = f"{full_path}_repetition"
-            dummy_out = f"{cname}_out"
-            dummy_in = f"{cname}_in"
-            cluster.node(dummy_in, label="", style="invis")
-            cluster.node(dummy_out, label="", style="invis")
-            cluster.edge(dummy_in, cname, style="invis")
-            cluster.edge(cname, dummy_out, style="invis")
-
-            cluster.node(cname, node_structure, **REPETITION_NODE_KWARGS)
+
+    yield from formatter.open_subgraph(
+        name=f"cluster_{full_path}", graph_attr={"label": routine.name, **CLUSTER_KWARGS}
+    )
+    yield from _nonleaf_ports_lines(input_ports, formatter, full_path, "inputs")
+    yield from _nonleaf_ports_lines(output_ports, formatter, full_path, "outputs")
+    yield from _nonleaf_ports_lines(through_ports, formatter, full_path, "through")
+
+    # We're adding ghost nodes and edges to position the through ports in the middle
+    for port in through_ports:
+        dummy_out = f'"{full_path}.{port.name}_out"'
+        dummy_in = f'"{full_path}.{port.name}_in"'
+        pname = f'"{full_path}.{port.name}"'
+        yield formatter.node(dummy_in, label="", style="invis")
+        yield formatter.node(dummy_out, label="", style="invis")
+        yield formatter.edge(dummy_in, pname, style="invis")
+        yield formatter.edge(pname, dummy_out, style="invis")
+
+
+def _nonleaf_closing_lines(routine, formatter: _DotFormatter, full_path: str, child_depth: int | None) -> Iterator[str]:
+    """Generate lines closing the cluster of a non-leaf routine, i.e. the ones following its children."""
+    # Names of children drawn as leaves are computed once, so that resolving every endpoint takes constant time.
+    leaves = {child.name for child in routine.children if not child.children or child_depth == 0}
+    for connection in routine.connections:
+        yield formatter.edge(
+            _format_node_name(connection.source, leaves, full_path),
+            _format_node_name(connection.target, leaves, full_path),
+        )
+
+    if routine.repetition is not None:
+        label = "Repeated subroutine"
+        repetition_type = routine.repetition.sequence.type
+        count = routine.repetition.count
+        node_structure = f"{label} | {{type: {repetition_type}}} | {{count: {count}}}"
+        # Similarly to through ports, we add ghost nodes and edges to center repetition
+        cname = f"{full_path}_repetition"
+        dummy_out = f"{cname}_out"
+        dummy_in = f"{cname}_in"
+        yield formatter.node(dummy_in, label="", style="invis")
+        yield formatter.node(dummy_out, label="", style="invis")
+        yield formatter.edge(dummy_in, cname, style="invis")
+        yield formatter.edge(cname, dummy_out, style="invis")
+
+        yield formatter.node(cname, node_structure, **REPETITION_NODE_KWARGS)
+
+    yield formatter.close_subgraph()
 
 
 def _ports_row(ports) -> str:
     return "{" + "|".join(f"<{port.name}> {port.name}" for port in ports) + "}"
 
 
-def _add_leaf(routine, dag: graphviz.Digraph, parent_path: str) -> None:
+def _leaf_line(routine, formatter: _DotFormatter, parent_path: str) -> str:
     input_ports, output_ports, through_ports = _split_ports(routine.ports)
     label = f"{{{_ports_row(input_ports)}|{routine.name}|{_ports_row(output_ports)}}}"
     if through_ports:
         label += f"|{_ports_row(through_ports)}"
-    dag.node(f'"{".".join((parent_path, routine.name))}"', label=label, **LEAF_NODE_KWARGS)
+    node_kwargs = COLLAPSED_NODE_KWARGS if routine.children else LEAF_NODE_KWARGS
+    return formatter.node(f'"{".".join((parent_path, routine.name))}"', label=label, **node_kwargs)
 
 
-def _add_routine(routine, dag: graphviz.Digraph, parent_path: str = "") -> None:
-    if routine.children:
-        _add_nonleaf(routine, dag, parent_path)
-    else:
-        _add_leaf(routine, dag, parent_path)
+def _dot_lines(routine: RoutineV1, parent_path: str = "", depth: int | None = None) -> Iterator[str]:
+    """Generate lines of DOT source of the body of the graph representing given routine.
+
+    Routines are visited in pre-order with an explicit stack rather than recursively, so that lines
+    are yielded directly to the caller (instead of passing through a generator per level of the
+    hierarchy), and the depth of the hierarchy is not limited by the recursion limit. Children are
+    iterated lazily, hence memory used for drawing does not depend on the size of the routine.
+    """
+    formatter = _DotFormatter()
+    # Non-leaf routines being drawn, with their paths, depths of their children and iterators over their children.
+    # The first entry is a placeholder for the parent of the drawn routine.
+    stack: list[tuple[RoutineV1 | None, str, int | None, Iterator[RoutineV1]]] = [
+        (None, parent_path, depth, iter((routine,)))
+    ]
+    while stack:
+        parent, parent_path, depth, children = stack[-1]
+        if (child := next(children, None)) is None:
+            stack.pop()
+            if parent is not None:
+                yield from _nonleaf_closing_lines(parent, formatter, parent_path, depth)
+        elif child.children and depth != 0:
+            full_path = f"{parent_path}.{child.name}"
+            yield from _nonleaf_opening_lines(child, formatter, full_path)
+            stack.append((child, full_path, None if depth is None else depth - 1, iter(child.children)))
+        else:
+            yield _leaf_line(child, formatter, parent_path)
+
+
+def _find_subroutine(routine: RoutineV1, path: str) -> RoutineV1:
+    # Only routines along the path are visited, so that the cost does not depend on the size of the program.
+    root_name, *names = path.split(".")
+    if root_name != routine.name:
+        raise ValueError(f"Path {path} does not start with the name of the program, {routine.name}.")
+    for i, name in enumerate(names):
+        if name not in routine.children.by_name:
+            parent_path = ".".join([root_name, *names[:i]])
+            raise ValueError(f"Routine {parent_path} has no child named {name}.")
+        routine = routine.children.by_name[name]
+    return routine
+
+
+def _resolve_rendered_routine(routine: RoutineV1, max_depth: int | None, path: str | None) -> tuple[RoutineV1, str]:
+    """Find the routine to be rendered and the path of its parent, validating the arguments of rendering."""
+    if max_depth is not None and max_depth < 0:
+        raise ValueError(f"Maximum depth has to be nonnegative, got {max_depth}.")
+    if path is None:
+        return routine, ""
+    return _find_subroutine(routine, path), "".join(f".{name}" for name in path.split(".")[:-1])
 
 
 @accepts_all_qref_types
-def to_graphviz(routine: RoutineV1) -> graphviz.Digraph:
-    """Convert routine encoded with v1 schema to a graphviz DAG."""
+def to_graphviz(routine: RoutineV1, max_depth: int | None = None, path: str | None = None) -> graphviz.Digraph:
+    """Convert routine encoded with v1 schema to a graphviz DAG.
+
+    Args:
+        routine: routine or program to be converted.
+        max_depth: if given, only descendants down to this depth (relative to the rendered routine,
+            whose depth is 0) are drawn. Non-leaf routines at this depth are collapsed, i.e. drawn like
+            leaves, with dashed borders.
+        path: if given, only the routine with this dotted path (e.g. `root.a.b`) and its descendants
+            are drawn. Names of nodes are the same as when drawing the whole program.
+
+    Raises:
+        ValueError: if `max_depth` is negative, or there is no routine with given path.
+    """
+    routine, parent_path = _resolve_rendered_routine(routine, max_depth, path)
     dag = graphviz.Digraph(graph_attr=GRAPH_ATTRS)
-    _add_routine(ensure_routine(routine), dag)
+    dag.body.extend(_dot_lines(routine, parent_path, max_depth))
     return dag
 
 
-def render_entry_point():
-    parser = ArgumentParser()
-    parser.add_argument("input", help="Path to the YAML or JSON file with Routine in V1 schema", type=Path)
-    parser.add_argument(
-        "output",
-        help=(
-            "Path to the output file. File format is determined based on the extension, "
-            "which should be either .svg or .pdf"
-        ),
-        type=Path,
-    )
+def _write_dot(routine: RoutineV1, file: TextIO, parent_path: str, max_depth: int | None) -> None:
+    *head, tail = graphviz.Digraph(graph_attr=GRAPH_ATTRS)
+    file.writelines(head)
+    file.writelines(_dot_lines(routine, parent_path, max_depth))
+    file.write(tail)
+
+
+@accepts_all_qref_types
+def write_dot(routine: RoutineV1, file: TextIO, max_depth: int | None = None, path: str | None = None) -> None:
+    """Write DOT source of the graph representing routine encoded with v1 schema into a file.
+
+    The source is the same as the one of the graph returned by `to_graphviz`, but it is written line
+    by line, as it is generated, without constructing the graph in memory. Hence, it is suitable for
+    huge programs, whose DOT sources would not fit in memory, or when the source is processed by
+    graphviz (or other tools) directly, e.g. with `graphviz.render`.
+
+    Args:
+        routine: routine or program to be converted.
+        file: text file (or any other object with `write` and `writelines` methods) to write to.
+        max_depth: maximum depth of drawn routines, see `to_graphviz`.
+        path: dotted path of the routine to be drawn, see `to_graphviz`.
+
+    Raises:
+        ValueError: if `max_depth` is negative, or there is no routine with given path. Nothing is
+            written to the file in such a case.
+    """
+    routine, parent_path = _resolve_rendered_routine(routine, max_depth, path)
+    _write_dot(routine, file, parent_path, max_depth)
+
+
+# Extensions of files considered as inputs when rendering all files in a directory.
+INPUT_EXTENSIONS = (".yaml", ".yml", ".json")
+
+
+def _render_dot(routine: RoutineV1, output_path: Path, parent_path: str, max_depth: int | None) -> None:
+    # DOT source is streamed into a file next to the output (like graphviz.Digraph.render does), and rendered from it.
+    dot_path = output_path.with_suffix("")
+    with open(dot_path, "w", encoding="utf-8") as f:
+        _write_dot(routine, f, parent_path, max_depth)
+    graphviz.render("dot", output_path.suffix.strip("."), dot_path)
 
-    args = parser.parse_args()
 
-    with open(args.input) as f:
-        routine = SchemaV1.model_validate(yaml.safe_load(f))
+def _load_program(input_path: Path) -> SchemaV1:
+    with open(input_path) as f:
+        return SchemaV1.model_validate(yaml.safe_load(f))
+
+
+def _render_file(input_path: Path, output_path: Path, max_depth: int | None = None, path: str | None = None) -> None:
+    routine = _load_program(input_path)
+    rendered, parent_path = _resolve_rendered_routine(routine.program, max_depth, path)
+    _render_dot(rendered, output_path, parent_path, max_depth)
+
+
+def _render_file_in_worker(task: tuple[Path, Path, int | None, str | None]) -> str | None:
+    # Errors are returned as messages, because exceptions (e.g. pydantic's) are not always picklable.
+    try:
+        _render_file(*task)
+    except Exception as error:
+        return f"{type(error).__name__}: {error}"
+    return None
+
+
+def _expand_inputs(patterns: Iterable[str]) -> list[Path]:
+    """Expand paths of directories and glob patterns into paths of input files.
+
+    Directories are expanded into all the files with extensions from `INPUT_EXTENSIONS` they contain
+    (non-recursively), and patterns are expanded with `glob.glob`. Paths of existing files are kept as is.
+
+    Raises:
+        ValueError: if some pattern does not match any file.
+    """
+    inputs = []
+    for pattern in patterns:
+        if (path := Path(pattern)).is_dir():
+            inputs.extend(sorted(file for file in path.iterdir() if file.suffix in INPUT_EXTENSIONS))
+        elif path.exists():
+            inputs.append(path)
+        elif matches := sorted(glob(pattern)):
+            inputs.extend(map(Path, matches))
+        else:
+            raise ValueError(f"No files match {pattern}.")
+    return inputs
+
+
+def render_files(
+    inputs: Sequence[Path],
+    output_dir: Path,
+    output_format: str = "svg",
+    jobs: int = 1,
+    max_depth: int | None = None,
+    path: str | None = None,
+) -> dict[Path, str]:
+    """Render many files with programs, in parallel.
+
+    Every input file is validated and rendered into the file in `output_dir` with the same name as
+    the input, and extension corresponding to `output_format`. Files are processed by a pool of worker
+    processes, started once for all the files.
+
+    Args:
+        inputs: paths of YAML or JSON files with programs in V1 schema.
+        output_dir: directory to which rendered files are written. It is created if it does not exist.
+        output_format: format of the output files, any of the formats supported by graphviz.
+        jobs: number of worker processes. If 1, files are rendered in the calling process.
+        max_depth: maximum depth of rendered routines, see `to_graphviz`.
+        path: dotted path of the routine to be rendered, see `to_graphviz`.
+
+    Returns:
+        Dictionary mapping paths of the inputs which could not be rendered to descriptions of the errors.
+
+    Raises:
+        ValueError: if `jobs` is not positive, or some inputs would be rendered into the same file.
+    """
+    if jobs < 1:
+        raise ValueError(f"Number of jobs has to be positive, got {jobs}.")
+    outputs = [output_dir / f"{input_path.stem}.{output_format}" for input_path in inputs]
+    if duplicates := sorted(str(output) for output, count in Counter(outputs).items() if count > 1):
+        raise ValueError(f"Multiple inputs would be rendered into the same files: {', '.join(duplicates)}.")
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    tasks = [(input_path, output_path, max_depth, path) for input_path, output_path in zip(inputs, outputs)]
+    if jobs == 1:
+        errors = list(map(_render_file_in_worker, tasks))
+    else:
+        # Imported here, because importing multiprocessing noticeably slows down importing QREF.
+        from concurrent.futures import ProcessPoolExecutor
 
-    dag = to_graphviz(routine)
-    dag.render(args.output.with_suffix(""), format=args.output.suffix.strip("."))
+        with ProcessPoolExecutor(max_workers=min(jobs, len(tasks) or 1)) as pool:
+            errors = list(pool.map(_render_file_in_worker, tasks))
+    return {input_path: error for input_path, error in zip(inputs, errors) if error is not None}
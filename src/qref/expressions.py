@@ -0,0 +1,435 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Parsing and compilation of symbolic expressions used in QREF documents.
+
+Expressions (e.g. values of resources, sizes of ports or counts of repetitions) are parsed into
+a small abstract syntax tree, which is then compiled into a Python function evaluating the
+expression over NumPy arrays. The supported syntax comprises:
+
+- numbers and symbols, which may be namespaced (e.g. `N`, `2.5`, `child.N`),
+- binary operators `+`, `-`, `*`, `/` and `^` or `**` (power), and unary `-` and `+`,
+- implicit multiplication of a number and a following symbol or parenthesized expression (e.g. `2L`),
+- functions `ceil` (or `ceiling`), `floor`, `abs`, `sqrt`, `exp`, `log`, `log2` (or `log_2`), `log10`,
+  `min` and `max` (of any number of arguments), and `multiplicity(base, n)`, the largest power
+  of `base` dividing `n`,
+- sums and products `sum(term, iterator, start, stop)` and `prod(term, iterator, start, stop)` over
+  the iterator ranging from `start` to `stop`, inclusive.
+
+Parsed and compiled expressions are kept in a process-wide cache, bounded by `EXPRESSION_CACHE_SIZE`
+distinct expressions, so that every expression is parsed and compiled only once, no matter how
+many times it occurs in a program, or in different programs.
+
+Evaluation requires NumPy, which is an optional dependency of QREF.
+"""
+
+from __future__ import annotations
+
+import re
+from collections import ChainMap
+from collections.abc import Iterable, Mapping
+from functools import cache, lru_cache
+from typing import Any, Callable, NamedTuple, Union
+
+from .functools import CacheInfo
+
+_TOKEN = re.compile(
+    r"\s*(?:(?P<number>(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][-+]?[0-9]+)?)"
+    r"|(?P<name>[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)*)"
+    r"|(?P<operator>\*\*|[-+*/^(),]))"
+)
+
+_AGGREGATES = ("sum", "prod")
+
+# Maximum number of elements of intermediate arrays when evaluating sums and products over ranges.
+_MAX_CHUNK_ELEMENTS = 2**20
+
+# Maximum number of distinct expressions whose syntax trees and compiled forms are cached.
+EXPRESSION_CACHE_SIZE = 4096
+
+
+class Number(NamedTuple):
+    """Numeric literal."""
+
+    value: int | float
+
+
+class Symbol(NamedTuple):
+    """Symbol, e.g. a parameter or a local variable."""
+
+    name: str
+
+
+class UnaryOp(NamedTuple):
+    """Negation (`-`) or identity (`+`) of an expression."""
+
+    operator: str
+    operand: Expression
+
+
+class BinaryOp(NamedTuple):
+    """Binary operation. Both `^` and `**` are represented by the `**` operator."""
+
+    operator: str
+    left: Expression
+    right: Expression
+
+
+class Call(NamedTuple):
+    """Call of a function, including sums and products over ranges."""
+
+    function: str
+    arguments: tuple[Expression, ...]
+
+
+Expression = Union[Number, Symbol, UnaryOp, BinaryOp, Call]
+
+
+class _Parser:
+    def __init__(self, text: str):
+        self.text = text
+        self.tokens: list[tuple[str, str]] = []
+        position = 0
+        while position < len(text.rstrip()):
+            match = _TOKEN.match(text, position)
+            if match is None:
+                raise ValueError(f"Invalid expression {text!r}: unexpected character at position {position}.")
+            kind = match.lastgroup
+            assert kind is not None
+            self.tokens.append((kind, match.group(kind)))
+            position = match.end()
+        self.position = 0
+
+    def _error(self, message: str) -> ValueError:
+        return ValueError(f"Invalid expression {self.text!r}: {message}.")
+
+    def _peek(self) -> tuple[str, str] | None:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def _accept(self, *operators: str) -> str | None:
+        token = self._peek()
+        if token is not None and token[0] == "operator" and token[1] in operators:
+            self.position += 1
+            return token[1]
+        return None
+
+    def _expect(self, operator: str) -> None:
+        if self._accept(operator) is None:
+            raise self._error(f"expected {operator!r}")
+
+    def parse(self) -> Expression:
+        expression = self._sum()
+        if self._peek() is not None:
+            raise self._error(f"unexpected {self._peek()[1]!r}")  # type: ignore[index]
+        return expression
+
+    def _sum(self) -> Expression:
+        expression = self._product()
+        while (operator := self._accept("+", "-")) is not None:
+            expression = BinaryOp(operator, expression, self._product())
+        return expression
+
+    def _product(self) -> Expression:
+        expression = self._unary()
+        while (operator := self._accept("*", "/")) is not None:
+            expression = BinaryOp(operator, expression, self._unary())
+        return expression
+
+    def _unary(self) -> Expression:
+        if (operator := self._accept("-", "+")) is not None:
+            return UnaryOp(operator, self._unary())
+        return self._power()
+
+    def _power(self) -> Expression:
+        base = self._implicit_product()
+        if self._accept("^", "**") is not None:
+            # Power is right-associative and binds tighter than unary minus on its left, e.g. -2^2 = -4.
+            return BinaryOp("**", base, self._unary())
+        return base
+
+    def _implicit_product(self) -> Expression:
+        expression = self._atom()
+        token = self._peek()
+        if isinstance(expression, Number) and token is not None and (token[0] == "name" or token[1] == "("):
+            return BinaryOp("*", expression, self._power())
+        return expression
+
+    def _atom(self) -> Expression:
+        token = self._peek()
+        if token is None:
+            raise self._error("unexpected end")
+        kind, text = token
+        self.position += 1
+        if kind == "number":
+            return Number(float(text) if any(char in text for char in ".eE") else int(text))
+        if kind == "name":
+            if self._accept("(") is None:
+                return Symbol(text)
+            arguments = [self._sum()]
+            while self._accept(",") is not None:
+                arguments.append(self._sum())
+            self._expect(")")
+            return _call(text, tuple(arguments), self._error)
+        if text == "(":
+            expression = self._sum()
+            self._expect(")")
+            return expression
+        raise self._error(f"unexpected {text!r}")
+
+
+# Names of functions and their numbers of arguments (None meaning any positive number).
+_ARITIES: dict[str, int | None] = {
+    "ceil": 1,
+    "ceiling": 1,
+    "floor": 1,
+    "abs": 1,
+    "sqrt": 1,
+    "exp": 1,
+    "log": 1,
+    "log2": 1,
+    "log_2": 1,
+    "log10": 1,
+    "min": None,
+    "max": None,
+    "multiplicity": 2,
+    "sum": 4,
+    "prod": 4,
+}
+
+_ALIASES = {"ceiling": "ceil", "log_2": "log2"}
+
+
+def _call(function: str, arguments: tuple[Expression, ...], error: Callable[[str], ValueError]) -> Call:
+    if function not in _ARITIES:
+        raise error(f"unknown function {function!r}")
+    arity = _ARITIES[function]
+    if arity is not None and len(arguments) != arity:
+        raise error(f"{function} takes {arity} arguments, but {len(arguments)} were given")
+    if function in _AGGREGATES and not isinstance(arguments[1], Symbol):
+        raise error(f"second argument of {function} has to be a symbol")
+    return Call(_ALIASES.get(function, function), arguments)
+
+
+@lru_cache(maxsize=EXPRESSION_CACHE_SIZE, typed=True)
+def parse(expression: str | int | float) -> Expression:
+    """Parse an expression into its syntax tree.
+
+    Syntax trees are immutable, and the ones of recently parsed expressions are cached.
+
+    Args:
+        expression: expression to be parsed. Numbers are accepted as well, for convenience.
+
+    Returns:
+        Root of the syntax tree of the expression.
+
+    Raises:
+        ValueError: if the expression is malformed, or uses unknown functions.
+    """
+    if isinstance(expression, (int, float)):
+        return Number(expression)
+    return _Parser(expression).parse()
+
+
+def free_symbols(expression: Expression) -> frozenset[str]:
+    """Find all symbols that have to be given values in order to evaluate an expression.
+
+    Iterators of sums and products are bound by them, and hence are not free.
+    """
+    if isinstance(expression, Symbol):
+        return frozenset([expression.name])
+    if isinstance(expression, UnaryOp):
+        return free_symbols(expression.operand)
+    if isinstance(expression, BinaryOp):
+        return free_symbols(expression.left) | free_symbols(expression.right)
+    if isinstance(expression, Call):
+        if expression.function in _AGGREGATES:
+            term, iterator, start, stop = expression.arguments
+            return (free_symbols(term) - {iterator.name}) | free_symbols(start) | free_symbols(stop)  # type: ignore
+        return frozenset().union(*(free_symbols(argument) for argument in expression.arguments))
+    return frozenset()
+
+
+def _generate(expression: Expression) -> str:
+    # Python source of the expression, in which values of symbols are looked up in the `_values` mapping.
+    if isinstance(expression, Number):
+        return repr(float(expression.value))
+    if isinstance(expression, Symbol):
+        return f"_values[{expression.name!r}]"
+    if isinstance(expression, UnaryOp):
+        return f"({expression.operator}{_generate(expression.operand)})"
+    if isinstance(expression, BinaryOp):
+        return f"({_generate(expression.left)} {expression.operator} {_generate(expression.right)})"
+    if expression.function in _AGGREGATES:
+        term, iterator, start, stop = expression.arguments
+        return (
+            f"_functions[{expression.function!r}](lambda _values: {_generate(term)}, _values, "
+            f"{iterator.name!r}, {_generate(start)}, {_generate(stop)}, "  # type: ignore[union-attr]
+            f"{tuple(sorted(free_symbols(term)))!r})"
+        )
+    arguments = ", ".join(_generate(argument) for argument in expression.arguments)
+    return f"_functions[{expression.function!r}]({arguments})"
+
+
+def _import_numpy() -> Any:
+    try:
+        import numpy
+    except ImportError as error:
+        raise ImportError(
+            "Evaluation of expressions requires NumPy. Install it with `pip install 'qref[numpy]'`."
+        ) from error
+    return numpy
+
+
+@cache
+def _functions() -> dict[str, Callable[..., Any]]:
+    np = _import_numpy()
+
+    def _multiplicity(base: Any, n: Any) -> Any:
+        base, n = np.broadcast_arrays(np.asarray(base, dtype=np.int64), np.abs(np.asarray(n, dtype=np.int64)))
+        result = np.zeros(n.shape)
+        # Zero is divisible by any power of base, its multiplicity is reported as 0.
+        divisible = (n != 0) & (np.abs(base) > 1) & (n % np.where(base == 0, 1, base) == 0)
+        while divisible.any():
+            result += divisible
+            n = np.where(divisible, n // np.where(divisible, base, 1), n)
+            divisible &= n % np.where(base == 0, 1, base) == 0
+        return result
+
+    def _aggregate(ufunc: Any, identity: float, repeat: Callable[[Any, Any], Any]) -> Callable[..., Any]:
+        def _reduce(
+            term: Callable[[Mapping[str, Any]], Any],
+            values: Mapping[str, Any],
+            iterator: str,
+            start: Any,
+            stop: Any,
+            symbols: Iterable[str],
+        ) -> Any:
+            # Symbols are the free symbols of the term, possibly including the iterator.
+            start, stop = np.ceil(start), np.floor(stop)
+            if iterator not in symbols:
+                # All the terms are equal, hence there is no need to evaluate them one by one.
+                return repeat(term(values), np.maximum(stop - start + 1, 0))
+            shape = np.broadcast_shapes(
+                np.shape(start), np.shape(stop), *(np.shape(values[name]) for name in symbols if name != iterator)
+            )
+            result = np.full(shape, identity)
+            if result.size == 0 or not np.any(start <= stop):
+                return result
+            # Terms are evaluated in chunks of consecutive values of the iterator, along an additional leading
+            # axis, for the whole grid at once. Terms outside of the ranges of respective points are masked out.
+            first, last = int(np.min(start)), int(np.max(stop))
+            chunk_size = max(1, _MAX_CHUNK_ELEMENTS // result.size)
+            for chunk_start in range(first, last + 1, chunk_size):
+                chunk_stop = min(chunk_start + chunk_size, last + 1)
+                indices = np.arange(chunk_start, chunk_stop, dtype=float).reshape((-1,) + (1,) * len(shape))
+                scope = ChainMap({iterator: indices}, values)  # type: ignore[arg-type]
+                terms = np.broadcast_to(term(scope), indices.shape[:1] + shape)
+                in_range = (start <= indices) & (indices <= stop)
+                result = ufunc(result, ufunc.reduce(np.where(in_range, terms, identity), axis=0))
+                # Undefined results cannot be changed by any further terms. Infinite ones can, e.g. inf + (-inf)
+                # or inf * 0 are undefined, hence the remaining terms have to be evaluated for them.
+                if np.isnan(result[np.broadcast_to(stop >= chunk_stop, shape)]).all():
+                    break
+            return result
+
+        return _reduce
+
+    return {
+        "ceil": np.ceil,
+        "floor": np.floor,
+        "abs": np.abs,
+        "sqrt": np.sqrt,
+        "exp": np.exp,
+        "log": np.log,
+        "log2": np.log2,
+        "log10": np.log10,
+        "min": lambda *arguments: np.minimum.reduce(np.broadcast_arrays(*arguments)),
+        "max": lambda *arguments: np.maximum.reduce(np.broadcast_arrays(*arguments)),
+        "multiplicity": _multiplicity,
+        "sum": _aggregate(np.add, 0.0, np.multiply),
+        "prod": _aggregate(np.multiply, 1.0, np.power),
+    }
+
+
+class CompiledExpression:
+    """Expression compiled into a function evaluating it over arrays of values of its symbols.
+
+    Attributes:
+        expression: the original expression.
+        tree: syntax tree of the expression.
+        symbols: names of the free symbols of the expression, which have to be given values.
+    """
+
+    def __init__(self, expression: str | int | float):
+        self.expression = expression
+        self.tree = tree = parse(expression)
+        self.symbols = free_symbols(tree)
+        namespace = {"_functions": _functions()}
+        self._function: Callable[[Mapping[str, Any]], Any] = eval(
+            compile(f"lambda _values: {_generate(tree)}", "<qref expression>", "eval"), namespace
+        )
+
+    def __call__(self, values: Mapping[str, Any]) -> Any:
+        """Evaluate the expression.
+
+        Args:
+            values: mapping of symbols of the expression to their values, which can be numbers or NumPy
+                arrays. Arrays have to be broadcastable against each other.
+
+        Returns:
+            Value of the expression, as a float or an array of floats broadcast from the values.
+
+        Raises:
+            ValueError: if values of some symbols are missing.
+        """
+        missing = [symbol for symbol in self.symbols if symbol not in values]
+        if missing:
+            raise ValueError(f"Cannot evaluate {self.expression!r}, values of {sorted(missing)} are missing.")
+        np = _import_numpy()
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            return self._function(values)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.expression!r})"
+
+
+@lru_cache(maxsize=EXPRESSION_CACHE_SIZE, typed=True)
+def compile_expression(expression: str | int | float) -> CompiledExpression:
+    """Compile an expression for evaluation over NumPy arrays.
+
+    Compiled expressions are cached, hence compiling the same expression again returns the same object.
+
+    Args:
+        expression: expression to be compiled, or a number.
+
+    Returns:
+        Compiled expression.
+
+    Raises:
+        ValueError: if the expression is malformed, or uses unknown functions.
+        ImportError: if NumPy is not installed.
+    """
+    return CompiledExpression(expression)
+
+
+def expression_cache_info() -> CacheInfo:
+    """Get statistics of the cache of compiled expressions."""
+    info = compile_expression.cache_info()
+    return CacheInfo(info.hits, info.misses, EXPRESSION_CACHE_SIZE, info.currsize)
+
+
+def clear_expression_cache() -> None:
+    """Remove all parsed and compiled expressions from the cache, and reset its statistics."""
+    parse.cache_clear()
+    compile_expression.cache_clear()
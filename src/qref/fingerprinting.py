@@ -0,0 +1,97 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Structural fingerprints of routines.
+
+Fingerprint of a routine is a Merkle-style hash: a digest of the routine's own contents (ports,
+resources, connections, parameters, repetition etc.) combined with the names and fingerprints of
+its children. The routine's own name is not included, and hence identical subroutines have
+the same fingerprints regardless of their names and positions in the program.
+
+Fingerprints are computed bottom-up in a single pass and cached on each routine. Cached fingerprints
+are invalidated when the routine is modified (see `RoutineV1.mark_modified`), and revalidated on
+the next access by checking the fingerprints of its children. As long as no routine is modified,
+fingerprints of any routine are retrieved in constant time.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from collections import defaultdict
+
+from ._subtree_cache import cached_value, compute_bottom_up, routine_cache
+from .functools import accepts_all_qref_types
+from .schema_v1 import RoutineV1
+
+_FINGERPRINT_CACHE_KEY = "fingerprint"
+_CONTENTS_DIGEST_CACHE_KEY = "contents_digest"
+
+# Fields which are not part of routine's own contents, and ones serialized separately because they are dictionaries,
+# whose order is irrelevant for equality of routines.
+_EXCLUDED_FIELDS = {"name", "children", "local_variables", "meta"}
+
+
+def _contents_digest(routine: RoutineV1) -> bytes:
+    digest = hashlib.blake2b(routine.model_dump_json(exclude=_EXCLUDED_FIELDS).encode(), digest_size=16)
+    for mapping in (routine.local_variables, routine.meta):
+        digest.update(json.dumps(mapping, sort_keys=True, default=repr).encode())
+    return digest.digest()
+
+
+def _fingerprint(routine: RoutineV1, children_fingerprints: list[str]) -> str:
+    cache = routine_cache(routine)
+    # Routine's own contents can only change together with its revision, which clears the cache.
+    if (contents_digest := cache.get(_CONTENTS_DIGEST_CACHE_KEY)) is None:
+        contents_digest = cache[_CONTENTS_DIGEST_CACHE_KEY] = _contents_digest(routine)
+    digest = hashlib.blake2b(contents_digest, digest_size=16)
+    for child, child_fingerprint in zip(routine.children, children_fingerprints):
+        digest.update(f"{child.name}:{child_fingerprint};".encode())
+    return digest.hexdigest()
+
+
+@accepts_all_qref_types
+def fingerprint(routine: RoutineV1) -> str:
+    """Compute structural fingerprint of a routine, see `RoutineV1.fingerprint`.
+
+    Args:
+        routine: routine to be fingerprinted.
+
+    Returns:
+        Hexadecimal digest uniquely identifying the structure of the routine.
+    """
+    return compute_bottom_up(routine, _FINGERPRINT_CACHE_KEY, _fingerprint)
+
+
+@accepts_all_qref_types
+def find_identical_subroutines(routine: RoutineV1) -> list[list[str]]:
+    """Find groups of identical subroutines in a program.
+
+    Args:
+        routine: the program to be searched.
+
+    Returns:
+        List of groups of paths (relative to the program) of routines that have the same fingerprint.
+        Only groups of two or more routines are reported, and routines in each group are listed in
+        pre-order. Note that if two routines are identical, then so are their children, which are
+        reported as separate groups.
+    """
+    fingerprint(routine)
+    groups: defaultdict[str, list[str]] = defaultdict(list)
+    stack = [(routine, routine.name)]
+    while stack:
+        current, path = stack.pop()
+        groups[cached_value(current, _FINGERPRINT_CACHE_KEY)].append(path)
+        stack.extend((child, f"{path}.{child.name}") for child in reversed(current.children))
+    return [paths for paths in groups.values() if len(paths) > 1]
@@ -0,0 +1,216 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Flattening of programs into netlists of leaf routines.
+
+A netlist comprises the leaves of a program, together with the program itself, whose ports form
+the boundary of the netlist, and direct connections between their ports. Connections passing through
+ports of intermediate routines (including passthroughs) are resolved into connections between their
+ultimate endpoints. Connections inside leaves themselves are not part of the netlist. Connections
+leading nowhere, e.g. ones ending at a port of an intermediate routine which is not connected to
+anything inside it, are dropped.
+
+Ports and connections are stored in flat arrays of indices, so that netlists of large programs take
+little memory. The arrays support the buffer protocol, and hence can be wrapped without copying,
+e.g. with `numpy.frombuffer`.
+"""
+
+from __future__ import annotations
+
+from array import array
+from collections.abc import Iterator
+
+from .functools import accepts_all_qref_types
+from .schema_v1 import RoutineV1
+
+# Port of a routine, identified by the index of the routine in the pre-order traversal and the port's name.
+_Endpoint = tuple[int, str]
+
+
+class Netlist:
+    """Flat netlist of a program.
+
+    Attributes:
+        routines: dotted paths of the routines in the netlist. The first one is the program itself,
+            and the rest are its leaves, in pre-order.
+        port_names: names of ports of all the routines, grouped by routine. Ports are identified
+            by their indices in this list.
+        port_offsets: indices of the first ports of each routine, followed by the total number of ports,
+            so that ports of the i-th routine have indices from `port_offsets[i]` to `port_offsets[i + 1]`.
+        port_routines: index of the routine to which each port belongs.
+        sources: indices of source ports of all connections.
+        targets: indices of target ports of all connections. Connections are ordered by their source ports,
+            and connections from the same port follow the order of connections in the program.
+    """
+
+    __slots__ = ("routines", "port_names", "port_offsets", "port_routines", "sources", "targets")
+
+    def __init__(
+        self,
+        routines: list[str],
+        port_names: list[str],
+        port_offsets: array[int],
+        port_routines: array[int],
+        sources: array[int],
+        targets: array[int],
+    ):
+        self.routines = routines
+        self.port_names = port_names
+        self.port_offsets = port_offsets
+        self.port_routines = port_routines
+        self.sources = sources
+        self.targets = targets
+
+    def __len__(self) -> int:
+        """Number of connections in the netlist."""
+        return len(self.sources)
+
+    def port(self, index: int) -> str:
+        """Get the qualified name (i.e. path of the routine and the name of the port) of given port."""
+        return f"{self.routines[self.port_routines[index]]}.{self.port_names[index]}"
+
+    def edges(self) -> Iterator[tuple[str, str]]:
+        """Iterate over connections in the netlist, as pairs of qualified names of their ports."""
+        for source, target in zip(self.sources, self.targets):
+            yield self.port(source), self.port(target)
+
+
+@accepts_all_qref_types
+def flatten(routine: RoutineV1) -> Netlist:
+    """Flatten a program into a netlist of its leaves.
+
+    The program is traversed once, and every connection is resolved once, hence flattening takes
+    time linear in the size of the program (provided that no port is connected to many others).
+
+    Args:
+        routine: the program to be flattened.
+
+    Returns:
+        Netlist of the program.
+    """
+    routines = [routine]
+    paths = [routine.name]
+    # Indices of the routines in the netlist (i.e. of the program and its leaves), in pre-order.
+    netlist_routines = [0]
+    graph = _Graph()
+
+    stack = [0]
+    while stack:
+        index = stack.pop()
+        current = routines[index]
+        if index and not current.children:
+            netlist_routines.append(index)
+        children = {}
+        for child in current.children:
+            children[child.name] = len(routines)
+            routines.append(child)
+            paths.append(f"{paths[index]}.{child.name}")
+        # Connections inside leaves are not resolved, as they do not lead to any other routine.
+        for connection in current.connections if current.children else ():
+            graph.add(_endpoint(index, children, connection.source), _endpoint(index, children, connection.target))
+        stack.extend(reversed(children.values()))
+
+    port_names: list[str] = []
+    port_offsets = array("I")
+    port_routines = array("I")
+    port_indices: dict[_Endpoint, int] = {}
+    for netlist_index, index in enumerate(netlist_routines):
+        port_offsets.append(len(port_names))
+        for port in routines[index].ports:
+            port_indices[index, port.name] = len(port_names)
+            port_names.append(port.name)
+            port_routines.append(netlist_index)
+    port_offsets.append(len(port_names))
+
+    sources = array("I")
+    targets = array("I")
+    resolved: dict[_Endpoint, tuple[int, ...]] = {}
+    for endpoint, port_index in port_indices.items():
+        for next_endpoint in graph.successors(endpoint):
+            for target in _resolve(next_endpoint, graph, port_indices, resolved):
+                sources.append(port_index)
+                targets.append(target)
+
+    return Netlist(
+        [paths[index] for index in netlist_routines], port_names, port_offsets, port_routines, sources, targets
+    )
+
+
+def _endpoint(index: int, children: dict[str, int], name: str) -> _Endpoint:
+    child, _, port = name.rpartition(".")
+    if not child:
+        return index, port
+    if child not in children:
+        raise ValueError(f"Connection refers to a port of nonexistent child: {name}.")
+    return children[child], port
+
+
+class _Graph:
+    # Graph of connections between endpoints, storing the lists of successors of all endpoints as linked lists
+    # in flat arrays. Compared to storing a list per endpoint, this saves memory and work of the garbage collector.
+    # Successors are listed in the order in which they were added, which keeps connections of netlists in order.
+    def __init__(self) -> None:
+        self._first_edges: dict[_Endpoint, int] = {}
+        self._last_edges: dict[_Endpoint, int] = {}
+        self._next_edges = array("i")
+        self._targets: list[_Endpoint] = []
+
+    def add(self, source: _Endpoint, target: _Endpoint) -> None:
+        edge = len(self._targets)
+        if (last_edge := self._last_edges.get(source)) is None:
+            self._first_edges[source] = edge
+        else:
+            self._next_edges[last_edge] = edge
+        self._last_edges[source] = edge
+        self._next_edges.append(-1)
+        self._targets.append(target)
+
+    def successors(self, endpoint: _Endpoint) -> Iterator[_Endpoint]:
+        edge = self._first_edges.get(endpoint, -1)
+        while edge >= 0:
+            yield self._targets[edge]
+            edge = self._next_edges[edge]
+
+
+def _resolve(
+    endpoint: _Endpoint,
+    graph: _Graph,
+    port_indices: dict[_Endpoint, int],
+    resolved: dict[_Endpoint, tuple[int, ...]],
+) -> tuple[int, ...]:
+    # Ports of the netlist reachable from given endpoint through ports of intermediate routines. Results for
+    # intermediate ports are memoized, so that every connection is followed only once.
+    if (port_index := port_indices.get(endpoint)) is not None:
+        return (port_index,)
+    stack = [(endpoint, False)]
+    while stack:
+        current, successors_done = stack.pop()
+        if successors_done:
+            resolved[current] = tuple(
+                port_index
+                for successor in graph.successors(current)
+                for port_index in (
+                    (port_indices[successor],) if successor in port_indices else resolved.get(successor, ())
+                )
+            )
+        elif current not in resolved:
+            # Marks the endpoint as being resolved, so that cycles (in invalid programs) terminate.
+            resolved[current] = ()
+            stack.append((current, True))
+            stack.extend(
+                (successor, False)
+                for successor in graph.successors(current)
+                if successor not in port_indices and successor not in resolved
+            )
+    return resolved[endpoint]
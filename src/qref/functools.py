@@ -13,12 +13,17 @@
 # limitations under the License.
 
 """Tools for constructing functions operating on Qref objects."""
+import hashlib
+import io
+import pickle
+from collections import OrderedDict
 from functools import singledispatch, wraps
-from typing import Any, Callable, Concatenate, ParamSpec, TypeVar
+from typing import Any, Callable, Concatenate, NamedTuple, ParamSpec, TypeVar
 
+from .lazy import LazyRoutine
 from .schema_v1 import RoutineV1, SchemaV1
 
-AnyQrefType = dict[str, Any] | SchemaV1 | RoutineV1
+AnyQrefType = dict[str, Any] | SchemaV1 | RoutineV1 | LazyRoutine
 
 
 @singledispatch
@@ -33,6 +38,7 @@ def ensure_routine(data: AnyQrefType) -> RoutineV1:
         an instance of SchemaV1, in which case its `program` attribute will be returned,
         an instance of RoutineV1, in which case the object will be returned without changes,
         or a dictionary, in which case it will serve to constructe RoutineV1, or SchemaV1.
+        Lazily loaded routines are fully validated and converted to RoutineV1.
 
     Returns:
         An object of type RoutineV1 corresponding to the provided data.
@@ -42,9 +48,129 @@ def ensure_routine(data: AnyQrefType) -> RoutineV1:
 
 @ensure_routine.register(dict)
 def _ensure_routine_from_dict(data: dict[str, Any]) -> RoutineV1:
+    if _conversion_cache is None:
+        return _routine_from_dict(data)
+    return _conversion_cache.get(data)
+
+
+def _routine_from_dict(data: dict[str, Any]) -> RoutineV1:
     return SchemaV1(**data).program if "version" in data else RoutineV1(**data)
 
 
+class CacheInfo(NamedTuple):
+    """Statistics of the conversion cache, analogous to the ones reported by `functools.lru_cache`."""
+
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+class _ConversionCache:
+    """Bounded cache of routines converted from dictionaries, evicting the least recently used ones."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._routines: OrderedDict[bytes, RoutineV1] = OrderedDict()
+
+    def get(self, data: dict[str, Any]) -> RoutineV1:
+        try:
+            key = _content_hash(data)
+        except (TypeError, ValueError):
+            # Data that cannot be hashed (e.g. containing arbitrary objects) is converted without caching.
+            self.misses += 1
+            return _routine_from_dict(data)
+
+        routine = self._routines.get(key)
+        if routine is not None:
+            self.hits += 1
+            self._routines.move_to_end(key)
+            return routine
+
+        self.misses += 1
+        routine = self._routines[key] = _routine_from_dict(data)
+        if len(self._routines) > self.maxsize:
+            self._routines.popitem(last=False)
+        return routine
+
+    def info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._routines))
+
+
+class _ContentPickler(pickle.Pickler):
+    """Pickler serializing only plain data (dictionaries, lists, strings, numbers etc.), regardless of identities.
+
+    Pickled data retains the types of all the values, so that e.g. 1 and "1" or tuples and lists, which
+    can be validated differently, are serialized differently. In fast mode, objects occurring in the data
+    multiple times are serialized in full every time, and hence equal data is serialized to the same bytes
+    regardless of which of its parts are shared.
+    """
+
+    def __init__(self, file: io.BytesIO):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.fast = True
+
+    def reducer_override(self, obj: Any) -> Any:
+        # Only called for objects other than exact instances of plain types, e.g. instances of arbitrary classes,
+        # whose pickled form does not necessarily reflect everything that affects validation.
+        raise TypeError(f"Cannot hash object of type {type(obj).__name__}.")
+
+
+def _content_hash(data: dict[str, Any]) -> bytes:
+    # Hashing the content (instead of using the identity of the dictionary) guarantees that
+    # dictionaries modified in between the calls are never matched with stale routines.
+    buffer = io.BytesIO()
+    _ContentPickler(buffer).dump(data)
+    return hashlib.blake2b(buffer.getbuffer()).digest()
+
+
+_conversion_cache: _ConversionCache | None = None
+
+
+def enable_conversion_cache(maxsize: int = 16) -> None:
+    """Enable caching of routines converted from dictionaries by `ensure_routine`.
+
+    When enabled, converting the same data more than once (e.g. by passing a dictionary to
+    several functions decorated with `accepts_all_qref_types`) validates it only once.
+    Dictionaries are matched by their content, including the types of values and the order
+    of keys, and hence modifying a dictionary between the calls is safe. Enabling the cache
+    again discards its previous contents.
+
+    Note:
+        Routines returned from the cache are shared between the calls, and hence they
+        should not be modified in place.
+
+    Args:
+        maxsize: maximum number of cached routines, after exceeding it the least recently
+            used routines are evicted.
+
+    Raises:
+        ValueError: if `maxsize` is not positive.
+    """
+    global _conversion_cache
+    if maxsize < 1:
+        raise ValueError(f"Size of the conversion cache has to be positive, got {maxsize}.")
+    _conversion_cache = _ConversionCache(maxsize)
+
+
+def disable_conversion_cache() -> None:
+    """Disable caching of converted routines, discarding all cached ones."""
+    global _conversion_cache
+    _conversion_cache = None
+
+
+def conversion_cache_info() -> CacheInfo | None:
+    """Report statistics of the conversion cache.
+
+    Returns:
+        Numbers of cache hits and misses, maximum and current size of the cache,
+        or None if the cache is disabled.
+    """
+    return None if _conversion_cache is None else _conversion_cache.info()
+
+
 @ensure_routine.register
 def _ensure_routine_from_schema_v1(data: SchemaV1) -> RoutineV1:
     return data.program
@@ -55,6 +181,11 @@ def _ensure_routine_from_routine_v1(data: RoutineV1) -> RoutineV1:
     return data
 
 
+@ensure_routine.register
+def _ensure_routine_from_lazy_routine(data: LazyRoutine) -> RoutineV1:
+    return data.to_routine()
+
+
 P = ParamSpec("P")
 T = TypeVar("T")
 
@@ -63,7 +194,7 @@ def accepts_all_qref_types(f: Callable[Concatenate[RoutineV1, P], T]) -> Callabl
     """Make a callable accepting RoutineV1 as first arg capable of accepting arbitrary QREF object.
 
     Here, by arbitrary QREF object we mean either an instance of SchemaV1, an instance of RoutineV1,
-    or any dictionary that can be converted to an instance of SchemaV1 or RoutineV1.
+    any dictionary that can be converted to an instance of SchemaV1 or RoutineV1, or a lazily loaded routine.
 
     Args:
         f: Callable to be augmented.
@@ -74,7 +205,7 @@ def accepts_all_qref_types(f: Callable[Concatenate[RoutineV1, P], T]) -> Callabl
     """
 
     @wraps(f)
-    def _inner(routine: SchemaV1 | RoutineV1 | dict[str, Any], *args: P.args, **kwargs: P.kwargs) -> T:
+    def _inner(routine: AnyQrefType, *args: P.args, **kwargs: P.kwargs) -> T:
         return f(ensure_routine(routine), *args, **kwargs)
 
     return _inner
@@ -0,0 +1,359 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Lazy loading of programs stored in (potentially very large) JSON documents.
+
+Loading a program with `json.load` followed by `SchemaV1.model_validate` requires holding
+the whole document both as Python dictionaries and as pydantic models. Instead, the lazy loader
+memory-maps the file and only scans it for boundaries of JSON values, without decoding them.
+Fields of a routine are decoded and validated on first access, and children are materialized
+only when they are accessed. Hence, tooling that only looks at e.g. the root's ports and resources
+never pays for decoding the whole tree.
+
+The lazily loaded routines are read-only. Use `LazyRoutine.to_routine` to obtain a fully
+validated RoutineV1 of a given subtree.
+"""
+
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import re
+from collections.abc import Iterator, Mapping, Sequence
+from functools import cache, cached_property
+from typing import Annotated, Any, overload
+
+from pydantic import TypeAdapter
+
+from .schema_v1 import RoutineV1
+
+_Span = tuple[int, int]
+
+_WHITESPACE = re.compile(rb"[ \t\n\r]*")
+_STRING_PATTERN = rb'"[^"\\]*(?:\\.[^"\\]*)*"'
+_STRING = re.compile(_STRING_PATTERN, re.DOTALL)
+_SCALAR = re.compile(rb"[^ \t\n\r,\]}]+")
+
+_QUOTE, _COMMA, _COLON = ord('"'), ord(","), ord(":")
+_OPENING_BRACE, _CLOSING_BRACE, _OPENING_BRACKET, _CLOSING_BRACKET = ord("{"), ord("}"), ord("["), ord("]")
+_OPENING = frozenset(b"[{")
+
+# Maximum nesting of containers matched by a single regex match when skipping values.
+_MAX_MATCHED_NESTING = 7
+
+
+def _balanced_container_pattern(max_nesting: int) -> bytes:
+    """Pattern matching an array or object with nesting not exceeding max_nesting.
+
+    Python's regular expressions are not recursive, so the pattern is constructed explicitly for each level
+    of nesting. Runs of characters other than brackets and quotes are matched as atomic groups (emulated by
+    a capturing lookahead followed by a backreference) to avoid catastrophic backtracking.
+    """
+    container = None
+    for level in range(max_nesting):
+        run = rb"(?=(?P<run%d>[^\"\[\]{}]+))(?P=run%d)" % (level, level)
+        item = b"|".join([run, _STRING_PATTERN] + ([container] if container else []))
+        container = rb"[\[{](?:" + item + rb")*[\]}]"
+    assert container is not None
+    return container
+
+
+@cache
+def _token_regex() -> re.Pattern[bytes]:
+    """Regex of tokens used when skipping values.
+
+    Containers that are not nested too deeply are matched as a whole, strings are matched so that brackets
+    inside them are ignored, and remaining brackets are matched one by one. The regex is compiled on first
+    use, because compiling it takes a noticeable part of the time of importing QREF.
+    """
+    return re.compile(
+        b"|".join([_balanced_container_pattern(_MAX_MATCHED_NESTING), _STRING_PATTERN, rb"[\[\]{}]"]), re.DOTALL
+    )
+
+
+class _Document:
+    """Scanner locating JSON values in a buffer without decoding them."""
+
+    def __init__(self, buffer: bytes | mmap.mmap):
+        self.buffer = buffer
+        # Objects located in arrays, keyed by positions at which the arrays start.
+        self._objects: dict[int, list[tuple[dict[str, _Span], _Span]]] = {}
+
+    def _error(self, message: str, pos: int) -> ValueError:
+        return ValueError(f"Malformed JSON document: {message} at position {pos}.")
+
+    def _skip_whitespace(self, pos: int) -> int:
+        return _WHITESPACE.match(self.buffer, pos).end()  # type: ignore
+
+    def _at(self, char: int, pos: int) -> bool:
+        return pos < len(self.buffer) and self.buffer[pos] == char
+
+    def _expect(self, char: int, pos: int) -> int:
+        if not self._at(char, pos):
+            raise self._error(f"expected {chr(char)!r}", pos)
+        return self._skip_whitespace(pos + 1)
+
+    def _value_end(self, pos: int) -> int:
+        if pos >= len(self.buffer):
+            raise self._error("unexpected end of document", pos)
+
+        char = self.buffer[pos]
+        if char not in _OPENING:
+            match = (_STRING if char == _QUOTE else _SCALAR).match(self.buffer, pos)
+            if match is None:
+                raise self._error("expected a value", pos)
+            return match.end()
+
+        depth = 0
+        for match in _token_regex().finditer(self.buffer, pos):
+            start, end = match.span()
+            char = self.buffer[start]
+            if char == _QUOTE:
+                continue
+            if end - start > 1:  # The whole container was matched at once
+                if depth == 0:
+                    return end
+            elif char in _OPENING:
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return end
+        raise self._error("unterminated value", pos)
+
+    def members(self, pos: int, expand: tuple[str, ...] = ()) -> tuple[dict[str, _Span], int]:
+        """Locate members of an object starting at given position.
+
+        Args:
+            pos: position at which the object starts.
+            expand: path of keys of nested members, which are objects or arrays of objects that should be
+                located right away (and cached until retrieved by `objects`). This saves scanning them
+                twice if they are going to be needed anyway.
+
+        Returns:
+            A mapping of keys to spans of the corresponding values, and the position right after the object.
+        """
+        pos = self._expect(_OPENING_BRACE, self._skip_whitespace(pos))
+        members: dict[str, _Span] = {}
+        if self._at(_CLOSING_BRACE, pos):
+            return members, pos + 1
+        while True:
+            key_match = _STRING.match(self.buffer, pos)
+            if key_match is None:
+                raise self._error("expected a key", pos)
+            key = json.loads(key_match.group())
+            value_start = self._expect(_COLON, self._skip_whitespace(key_match.end()))
+            if expand and key == expand[0]:
+                value_end = self._locate_objects(value_start, expand[1:])
+            else:
+                value_end = self._value_end(value_start)
+            members[key] = (value_start, value_end)
+            pos = self._skip_whitespace(value_end)
+            if self._at(_CLOSING_BRACE, pos):
+                return members, pos + 1
+            pos = self._expect(_COMMA, pos)
+
+    def _locate_objects(self, pos: int, expand: tuple[str, ...] = ()) -> int:
+        objects: list[tuple[dict[str, _Span], _Span]] = []
+        self._objects[pos] = objects
+        if self._at(_OPENING_BRACE, pos):
+            members, end = self.members(pos, expand)
+            objects.append((members, (pos, end)))
+            return end
+
+        pos = self._expect(_OPENING_BRACKET, pos)
+        if self._at(_CLOSING_BRACKET, pos):
+            return pos + 1
+        while True:
+            members, end = self.members(pos, expand)
+            objects.append((members, (pos, end)))
+            pos = self._skip_whitespace(end)
+            if self._at(_CLOSING_BRACKET, pos):
+                return pos + 1
+            pos = self._expect(_COMMA, pos)
+
+    def objects(self, span: _Span) -> list[tuple[dict[str, _Span], _Span]]:
+        """Locate members of an object, or all objects in an array, spanning given range."""
+        if span[0] not in self._objects:
+            self._locate_objects(span[0])
+        # Objects are needed only once, as they are subsequently cached by the callers.
+        return self._objects.pop(span[0])
+
+    def decode(self, span: _Span) -> Any:
+        start, end = span
+        return json.loads(self.buffer[start:end])
+
+
+@cache
+def _field_adapter(name: str) -> TypeAdapter:
+    field = RoutineV1.model_fields[name]
+    annotation: Any = field.annotation
+    return TypeAdapter(Annotated[(annotation, *field.metadata)] if field.metadata else annotation)
+
+
+class LazyRoutine:
+    """Read-only view of a routine stored in a JSON document.
+
+    Attributes of the lazy routine mirror fields of RoutineV1. Each of them is decoded and validated
+    on first access, and the children are represented by a `LazyChildren` sequence, which materializes
+    each child on first access. Note that, unlike RoutineV1, lazy routine does not verify if connections
+    refer to existing ports, which happens only when materializing the routine with `to_routine`.
+    """
+
+    def __init__(self, document: _Document, members: dict[str, _Span], span: _Span):
+        self._document = document
+        self._members = members
+        self._span = span
+
+    def _field(self, name: str) -> Any:
+        if name not in self._members:
+            return RoutineV1.model_fields[name].get_default(call_default_factory=True)
+        return _field_adapter(name).validate_python(self._document.decode(self._members[name]))
+
+    @cached_property
+    def name(self):
+        return self._field("name")
+
+    @cached_property
+    def type(self):
+        return self._field("type")
+
+    @cached_property
+    def ports(self):
+        return self._field("ports")
+
+    @cached_property
+    def resources(self):
+        return self._field("resources")
+
+    @cached_property
+    def connections(self):
+        return self._field("connections")
+
+    @cached_property
+    def input_params(self):
+        return self._field("input_params")
+
+    @cached_property
+    def local_variables(self):
+        return self._field("local_variables")
+
+    @cached_property
+    def linked_params(self):
+        return self._field("linked_params")
+
+    @cached_property
+    def repetition(self):
+        return self._field("repetition")
+
+    @cached_property
+    def meta(self):
+        return self._field("meta")
+
+    @cached_property
+    def children(self) -> LazyChildren:
+        span = self._members.get("children")
+        return LazyChildren(self._document, [] if span is None else self._document.objects(span))
+
+    def to_routine(self) -> RoutineV1:
+        """Decode and validate the whole subtree rooted at this routine."""
+        return RoutineV1.model_validate(self._document.decode(self._span))
+
+    def __repr__(self) -> str:
+        return f"LazyRoutine(name={self.name!r})"
+
+
+class LazyChildren(Sequence[LazyRoutine]):
+    """Sequence of lazily loaded children, also accessible by name via `by_name` like NamedList."""
+
+    def __init__(self, document: _Document, objects: list[tuple[dict[str, _Span], _Span]]):
+        self._document = document
+        self._objects = objects
+        self._children: list[LazyRoutine | None] = [None] * len(objects)
+
+    @overload
+    def __getitem__(self, index: int) -> LazyRoutine:
+        pass
+
+    @overload
+    def __getitem__(self, index: slice) -> list[LazyRoutine]:
+        pass
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        child = self._children[index]
+        if child is None:
+            child = self._children[index] = LazyRoutine(self._document, *self._objects[index])
+        return child
+
+    def __len__(self) -> int:
+        return len(self._objects)
+
+    @cached_property
+    def by_name(self) -> Mapping[str, LazyRoutine]:
+        return _LazyChildrenByName(self)
+
+
+class _LazyChildrenByName(Mapping[str, LazyRoutine]):
+    def __init__(self, children: LazyChildren):
+        self._children = children
+
+    @cached_property
+    def _index(self) -> dict[str, int]:
+        # Names are decoded without materializing the children. In case of duplicates, the first one wins.
+        index: dict[str, int] = {}
+        for i, (members, _) in enumerate(self._children._objects):
+            index.setdefault(self._children._document.decode(members["name"]), i)
+        return index
+
+    def __getitem__(self, name: str) -> LazyRoutine:
+        return self._children[self._index[name]]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._children)
+
+
+def load_lazy(source: str | os.PathLike | bytes) -> LazyRoutine:
+    """Lazily load a program stored in a JSON document.
+
+    Args:
+        source: either path to the JSON file with program in V1 schema, or the document itself.
+            Files are memory-mapped, so that the document is never read into memory as a whole.
+
+    Returns:
+        Lazily loaded routine corresponding to the `program` field of the document.
+
+    Raises:
+        ValueError: if the document is not a JSON object, or it is not a program in V1 schema.
+    """
+    if isinstance(source, bytes):
+        buffer: bytes | mmap.mmap = source
+    else:
+        with open(source, "rb") as f:
+            # The mapping stays valid after closing the file, and is released once no routine refers to it.
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    document = _Document(buffer)
+    members, _ = document.members(0, expand=("program", "children"))
+    if "version" not in members or document.decode(members["version"]) != "v1":
+        raise ValueError("Only programs in V1 schema can be loaded lazily.")
+    if "program" not in members:
+        raise ValueError("Document does not contain a program.")
+    ((program_members, program_span),) = document.objects(members["program"])
+    return LazyRoutine(document, program_members, program_span)
@@ -0,0 +1,397 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Zero-copy read access to programs serialized in the binary format.
+
+Programs serialized with `SchemaV1.to_bytes` are stored in tables of fixed-size records, and hence
+every object can be located by its offset in the serialized buffer without reading anything else.
+The views defined in this module exploit this: opening a file with `load_mapped` only memory-maps it,
+and each record is unpacked directly from the mapped buffer when it is accessed. No pydantic objects
+are constructed while navigating the program.
+
+Since the file is mapped read-only, the operating system shares its pages between all processes
+mapping it. Mapped routines can be passed to other processes (e.g. via `multiprocessing`), in which
+case only the path to the file is pickled and the file is mapped again in the receiving process.
+"""
+
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+from collections.abc import Callable, Iterator, Mapping, Sequence
+from functools import cached_property
+from typing import Any, NamedTuple, TypeVar, overload
+from weakref import WeakValueDictionary
+
+from .binary import (
+    _BIG_INT,
+    _CONNECTIONS,
+    _DIRECTIONS,
+    _FIRST_TABLE_FIELD,
+    _FLOAT,
+    _INT,
+    _NONE,
+    _PARAM_LINKS,
+    _PORTS,
+    _REPETITIONS,
+    _RESOURCE_TYPES,
+    _RESOURCES,
+    _ROUTINES,
+    _SEQUENCE_FIELDS,
+    _SEQUENCE_TYPES,
+    _STR,
+    _TABLES,
+    Layout,
+)
+
+T = TypeVar("T")
+
+_OFFSETS = struct.Struct("<II")
+_INT64 = struct.Struct("<q")
+_FLOAT64 = struct.Struct("<d")
+_REFERENCE = struct.Struct("<I")
+
+
+class MappedPort(NamedTuple):
+    """Read-only counterpart of PortV1."""
+
+    name: str
+    direction: str
+    size: int | float | str | None
+
+
+class MappedResource(NamedTuple):
+    """Read-only counterpart of ResourceV1."""
+
+    name: str
+    type: str
+    value: int | float | str | None
+
+
+class MappedConnection(NamedTuple):
+    """Read-only counterpart of ConnectionV1."""
+
+    source: str
+    target: str
+
+
+class MappedParamLink(NamedTuple):
+    """Read-only counterpart of ParamLinkV1."""
+
+    source: str
+    targets: list[str]
+
+
+class MappedSequence(NamedTuple):
+    """Read-only counterpart of sequences of repetitions (e.g. ConstantSequenceV1).
+
+    Sequences of all types are represented by this class, fields not defined for sequences of given
+    type are None.
+    """
+
+    type: str
+    multiplier: int | float | str | None = None
+    initial_term: int | float | str | None = None
+    difference: int | float | str | None = None
+    ratio: int | float | str | None = None
+    sum: int | float | str | None = None
+    prod: int | float | str | None = None
+    num_terms_symbol: str | None = None
+    term_expression: str | None = None
+    iterator_symbol: str | None = None
+
+
+class MappedRepetition(NamedTuple):
+    """Read-only counterpart of RepetitionV1."""
+
+    count: int | str  # type: ignore[assignment]  # Shadows tuple.count, like the field of RepetitionV1.
+    sequence: MappedSequence
+
+
+class _MappedDocument:
+    """Accessor of records and values stored in a serialized program."""
+
+    def __init__(self, buffer: Any, path: str | None = None, stat: tuple[int, int] | None = None):
+        self.buffer = buffer
+        self.path = path
+        # Modification time and size of the mapped file, used for detecting if it has changed.
+        self.stat = stat
+        self.layout = Layout.from_header(buffer)
+        self._table_starts = self.layout[_FIRST_TABLE_FIELD:]
+
+    def string(self, index: int) -> str:
+        start, end = _OFFSETS.unpack_from(self.buffer, self.layout.string_offsets + 4 * index)
+        start += self.layout.string_data
+        end += self.layout.string_data
+        return str(self.buffer[start:end], "utf-8")
+
+    def value(self, tag: int, index: int) -> int | float | str | None:
+        if tag == _INT:
+            return _INT64.unpack_from(self.buffer, self.layout.integers + 8 * index)[0]
+        if tag == _FLOAT:
+            return _FLOAT64.unpack_from(self.buffer, self.layout.floats + 8 * index)[0]
+        if tag == _STR:
+            return self.string(index)
+        if tag == _BIG_INT:
+            return int(self.string(index))
+        return None
+
+    def reference(self, index: int) -> int:
+        return _REFERENCE.unpack_from(self.buffer, self.layout.references + 4 * index)[0]
+
+    def strings(self, first: int, count: int) -> list[str]:
+        return [self.string(self.reference(i)) for i in range(first, first + count)]
+
+    def record(self, table: int, index: int) -> tuple:
+        return _TABLES[table].unpack_from(self.buffer, self._table_starts[table] + _TABLES[table].size * index)
+
+
+class _MappedSequence(Sequence[T]):
+    """Sequence of objects stored contiguously in one of the tables, accessible also by name."""
+
+    def __init__(self, first: int, count: int, item: Callable[[int], T], name: Callable[[int], str]):
+        self._first = first
+        self._count = count
+        self._item = item
+        self._name = name
+
+    @overload
+    def __getitem__(self, index: int) -> T:
+        pass
+
+    @overload
+    def __getitem__(self, index: slice) -> list[T]:
+        pass
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("index out of range")
+        return self._item(self._first + index)
+
+    def __len__(self) -> int:
+        return self._count
+
+    @cached_property
+    def by_name(self) -> Mapping[str, T]:
+        return _ByName(self)
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+
+class _ByName(Mapping[str, T]):
+    def __init__(self, items: _MappedSequence[T]):
+        self._items = items
+
+    @cached_property
+    def _index(self) -> dict[str, int]:
+        # Only the names are unpacked. In case of duplicates, the first item is the one accessible by name.
+        index: dict[str, int] = {}
+        first = self._items._first
+        for i in range(first, first + len(self._items)):
+            index.setdefault(self._items._name(i), i - first)
+        return index
+
+    def __getitem__(self, name: str) -> T:
+        return self._items[self._index[name]]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+
+class MappedRoutine:
+    """Read-only view of a routine stored in a serialized program.
+
+    Attributes of the mapped routine mirror fields of RoutineV1, except that ports, resources, connections
+    and parameter links are represented by lightweight named tuples. Children, ports and resources are
+    sequences that can also be accessed by name via `by_name`, like NamedList.
+    """
+
+    def __init__(self, document: _MappedDocument, index: int):
+        self._document = document
+        self._index = index
+        (
+            self._name,
+            self._type,
+            _,
+            self._first_child,
+            self._n_children,
+            self._first_port,
+            self._n_ports,
+            self._first_resource,
+            self._n_resources,
+            self._first_connection,
+            self._n_connections,
+            self._first_param,
+            self._n_params,
+            self._first_variable,
+            self._n_variables,
+            self._first_link,
+            self._n_links,
+            self._repetition,
+            self._meta,
+        ) = document.record(_ROUTINES, index)
+
+    @cached_property
+    def name(self) -> str:
+        return self._document.string(self._name)
+
+    @property
+    def type(self) -> str | None:
+        return None if self._type == _NONE else self._document.string(self._type)
+
+    @cached_property
+    def children(self) -> _MappedSequence[MappedRoutine]:
+        document = self._document
+        return _MappedSequence(
+            self._first_child,
+            self._n_children,
+            lambda i: MappedRoutine(document, i),
+            lambda i: document.string(document.record(_ROUTINES, i)[0]),
+        )
+
+    @cached_property
+    def ports(self) -> _MappedSequence[MappedPort]:
+        document = self._document
+
+        def _port(i: int) -> MappedPort:
+            name, direction, tag, size = document.record(_PORTS, i)
+            return MappedPort(document.string(name), _DIRECTIONS[direction], document.value(tag, size))
+
+        return _MappedSequence(
+            self._first_port, self._n_ports, _port, lambda i: document.string(document.record(_PORTS, i)[0])
+        )
+
+    @cached_property
+    def resources(self) -> _MappedSequence[MappedResource]:
+        document = self._document
+
+        def _resource(i: int) -> MappedResource:
+            name, type_, tag, value = document.record(_RESOURCES, i)
+            return MappedResource(document.string(name), _RESOURCE_TYPES[type_], document.value(tag, value))
+
+        return _MappedSequence(
+            self._first_resource,
+            self._n_resources,
+            _resource,
+            lambda i: document.string(document.record(_RESOURCES, i)[0]),
+        )
+
+    @property
+    def connections(self) -> list[MappedConnection]:
+        return [
+            MappedConnection(self._endpoint(source_child, source_port), self._endpoint(target_child, target_port))
+            for source_child, source_port, target_child, target_port in (
+                self._document.record(_CONNECTIONS, i)
+                for i in range(self._first_connection, self._first_connection + self._n_connections)
+            )
+        ]
+
+    def _endpoint(self, child: int, port: int) -> str:
+        if child == _NONE:
+            return self._document.string(port)
+        return f"{self.children[child].name}.{self._document.string(port)}"
+
+    @property
+    def input_params(self) -> list[str]:
+        return self._document.strings(self._first_param, self._n_params)
+
+    @property
+    def local_variables(self) -> dict[str, str]:
+        names_and_expressions = iter(self._document.strings(self._first_variable, 2 * self._n_variables))
+        return dict(zip(names_and_expressions, names_and_expressions))
+
+    @property
+    def linked_params(self) -> list[MappedParamLink]:
+        document = self._document
+        return [
+            MappedParamLink(document.string(source), document.strings(first_target, n_targets))
+            for source, first_target, n_targets in (
+                document.record(_PARAM_LINKS, i) for i in range(self._first_link, self._first_link + self._n_links)
+            )
+        ]
+
+    @property
+    def repetition(self) -> MappedRepetition | None:
+        if self._repetition == _NONE:
+            return None
+        count_tag, count, sequence_type, _, *values = self._document.record(_REPETITIONS, self._repetition)
+        type_name = _SEQUENCE_TYPES[sequence_type]
+        # Types of values are known from the schema, but not to the type checker.
+        value: Callable[[int, int], Any] = self._document.value
+        fields = {
+            name: value(tag, index) for name, tag, index in zip(_SEQUENCE_FIELDS[type_name], values[::2], values[1::2])
+        }
+        return MappedRepetition(value(count_tag, count), MappedSequence(type_name, **fields))
+
+    @property
+    def meta(self) -> dict[str, Any]:
+        return {} if self._meta == _NONE else json.loads(self._document.string(self._meta))
+
+    def __reduce__(self):
+        if self._document.path is None:
+            return _from_buffer, (bytes(self._document.buffer), self._index)
+        return _from_path, (self._document.path, self._index)
+
+    def __repr__(self) -> str:
+        return f"MappedRoutine(name={self.name!r})"
+
+
+def load_mapped(source: str | os.PathLike | bytes | bytearray | memoryview) -> MappedRoutine:
+    """Open program serialized with `SchemaV1.to_bytes` for reading, without loading it.
+
+    Args:
+        source: either path to the file with serialized program, or the serialized program itself.
+            Files are memory-mapped read-only, so that they are never read into memory as a whole,
+            and their pages are shared between all processes mapping them.
+
+    Returns:
+        Mapped routine corresponding to the `program` field of the serialized SchemaV1 object.
+
+    Raises:
+        ValueError: if the source does not contain a program serialized to the binary format.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return _from_buffer(source, 0)
+    return _from_path(os.fspath(source), 0)
+
+
+def _from_buffer(buffer: Any, index: int) -> MappedRoutine:
+    return MappedRoutine(_MappedDocument(buffer), index)
+
+
+# Documents currently mapped by this process, so that e.g. routines unpickled from the same file share the mapping.
+_mapped_documents: WeakValueDictionary[str, _MappedDocument] = WeakValueDictionary()
+
+
+def _from_path(path: str, index: int) -> MappedRoutine:
+    path = os.path.abspath(path)
+    stat_result = os.stat(path)
+    stat = (stat_result.st_mtime_ns, stat_result.st_size)
+    document = _mapped_documents.get(path)
+    if document is None or document.stat != stat:
+        with open(path, "rb") as f:
+            # The mapping stays valid after closing the file, and is released once no routine refers to it.
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        document = _mapped_documents[path] = _MappedDocument(buffer, path, stat)
+    return MappedRoutine(document, index)
@@ -0,0 +1,223 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Propagation of values of parameters from routines to their descendants.
+
+Parameters of all routines in a program are identified by their qualified names, i.e. dotted paths
+of the routines they belong to followed by their names (e.g. `root.foo.M`). Values flow along the
+parameter-dependency graph, in which:
+
+- every target of a link (see `RoutineV1.linked_params`) depends on the link's source,
+- every local variable depends on the symbols occurring in its expression.
+
+The graph is built once, and values bound to some parameters are propagated to all the others in
+a single pass over the graph in topological order. Re-binding some parameters recomputes only the
+ones depending on them.
+
+Values can be numbers or NumPy arrays, so that the resulting values can be passed directly to
+`qref.evaluation.evaluate_resources`. Evaluating local variables requires NumPy.
+"""
+
+from __future__ import annotations
+
+from collections import defaultdict
+from collections.abc import Iterable, Mapping
+from typing import Any
+
+from .expressions import compile_expression, free_symbols, parse
+from .functools import AnyQrefType, accepts_all_qref_types, ensure_routine
+from .schema_v1 import RoutineV1
+
+
+class ParameterPropagator:
+    """Propagator of values of parameters through a program.
+
+    The parameter-dependency graph is built once, when the propagator is constructed. Afterwards,
+    values can be bound to (and unbound from) any parameters, any number of times.
+    """
+
+    def __init__(self, program: AnyQrefType):
+        """Build the parameter-dependency graph of a program.
+
+        Args:
+            program: the program whose parameters should be propagated.
+
+        Raises:
+            ValueError: if some parameter is a target of multiple links, or parameters depend on
+                each other cyclically.
+        """
+        routine = ensure_routine(program)
+        # For each parameter: the parameter whose value it takes, or local variable's expression and its symbols.
+        self._sources: dict[str, str] = {}
+        self._expressions: dict[str, tuple[str | int | float, dict[str, str]]] = {}
+        dependents: defaultdict[str, list[str]] = defaultdict(list)
+        parameters: dict[str, None] = {}
+
+        stack = [(routine, routine.name)]
+        while stack:
+            current, path = stack.pop()
+            for name in current.input_params:
+                parameters[f"{path}.{name}"] = None
+            for link in current.linked_params:
+                source = f"{path}.{link.source}"
+                parameters[source] = None
+                for target in link.targets:
+                    qualified_target = f"{path}.{target}"
+                    if qualified_target in self._sources:
+                        raise ValueError(f"Parameter {qualified_target} is a target of multiple links.")
+                    self._sources[qualified_target] = source
+                    parameters[qualified_target] = None
+                    dependents[source].append(qualified_target)
+            for name, expression in current.local_variables.items():
+                variable = f"{path}.{name}"
+                parameters[variable] = None
+                try:
+                    symbols = free_symbols(parse(expression))
+                except ValueError:
+                    # Malformed expressions are not evaluated, hence the variable never gets a value.
+                    continue
+                scope = {symbol: f"{path}.{symbol}" for symbol in symbols}
+                self._expressions[variable] = (expression, scope)
+                for dependency in scope.values():
+                    parameters[dependency] = None
+                    dependents[dependency].append(variable)
+            stack.extend((child, f"{path}.{child.name}") for child in current.children)
+
+        self._dependents = dict(dependents)
+        self._order = _topological_order(parameters, self._dependents)
+        self._position = {parameter: position for position, parameter in enumerate(self._order)}
+        self._bindings: dict[str, Any] = {}
+        self._values: dict[str, Any] = {}
+
+    @property
+    def parameters(self) -> list[str]:
+        """Qualified names of all parameters, in topological order."""
+        return list(self._order)
+
+    @property
+    def values(self) -> dict[str, Any]:
+        """Values of all parameters whose values are known, keyed by their qualified names."""
+        return dict(self._values)
+
+    def routine_values(self, path: str) -> dict[str, Any]:
+        """Get known values of parameters of the routine with given dotted path, keyed by their names."""
+        prefix = f"{path}."
+        start = len(prefix)
+        return {
+            name[start:]: value
+            for name, value in self._values.items()
+            if name.startswith(prefix) and "." not in name[start:]
+        }
+
+    def bind(self, values: Mapping[str, Any]) -> None:
+        """Bind values to parameters, and propagate them to all parameters depending on them.
+
+        Values bound explicitly take precedence over propagated ones. Parameters which were bound
+        previously, and are not present in `values`, keep their values.
+
+        Args:
+            values: mapping of qualified names of parameters to their values.
+
+        Raises:
+            ValueError: if some of the names do not correspond to any parameter.
+        """
+        self._check_parameters(values)
+        self._bindings.update(values)
+        self._propagate(values)
+
+    def unbind(self, names: Iterable[str]) -> None:
+        """Remove values bound to parameters, and propagate the changes.
+
+        Args:
+            names: qualified names of parameters to unbind.
+
+        Raises:
+            ValueError: if some of the names do not correspond to any parameter.
+        """
+        names = list(names)
+        self._check_parameters(names)
+        for name in names:
+            self._bindings.pop(name, None)
+        self._propagate(names)
+
+    def _check_parameters(self, names: Iterable[str]) -> None:
+        unknown = [name for name in names if name not in self._position]
+        if unknown:
+            raise ValueError(f"Unknown parameters: {', '.join(unknown)}.")
+
+    def _propagate(self, changed: Iterable[str]) -> None:
+        # Only parameters depending (possibly transitively) on the changed ones need recomputing.
+        affected = set(changed)
+        stack = list(affected)
+        while stack:
+            for dependent in self._dependents.get(stack.pop(), ()):
+                if dependent not in affected:
+                    affected.add(dependent)
+                    stack.append(dependent)
+
+        for parameter in sorted(affected, key=self._position.__getitem__):
+            self._values.pop(parameter, None)
+            if parameter in self._bindings:
+                self._values[parameter] = self._bindings[parameter]
+            elif (source := self._sources.get(parameter)) is not None:
+                if source in self._values:
+                    self._values[parameter] = self._values[source]
+            elif parameter in self._expressions:
+                expression, scope = self._expressions[parameter]
+                if all(dependency in self._values for dependency in scope.values()):
+                    arguments = {symbol: self._values[dependency] for symbol, dependency in scope.items()}
+                    self._values[parameter] = compile_expression(expression)(arguments)
+
+
+def _topological_order(parameters: Iterable[str], dependents: Mapping[str, list[str]]) -> list[str]:
+    in_degrees = dict.fromkeys(parameters, 0)
+    for targets in dependents.values():
+        for target in targets:
+            in_degrees[target] += 1
+    ready = [parameter for parameter, degree in in_degrees.items() if degree == 0]
+    order = []
+    while ready:
+        parameter = ready.pop()
+        order.append(parameter)
+        for dependent in dependents.get(parameter, ()):
+            in_degrees[dependent] -= 1
+            if in_degrees[dependent] == 0:
+                ready.append(dependent)
+    if len(order) < len(in_degrees):
+        cyclic = sorted(parameter for parameter, degree in in_degrees.items() if degree > 0)
+        raise ValueError(f"Parameters depend on each other cyclically: {', '.join(cyclic)}.")
+    return order
+
+
+@accepts_all_qref_types
+def propagate_parameters(routine: RoutineV1, values: Mapping[str, Any]) -> dict[str, Any]:
+    """Propagate values of parameters through a program.
+
+    This is a shorthand for constructing `ParameterPropagator` and binding the values once. If the
+    values are to be re-bound, use `ParameterPropagator` directly, to avoid rebuilding the graph.
+
+    Args:
+        routine: the program whose parameters should be propagated.
+        values: mapping of qualified names of parameters to their values.
+
+    Returns:
+        Values of all parameters whose values are known, keyed by their qualified names.
+
+    Raises:
+        ValueError: if the parameter-dependency graph is invalid (see `ParameterPropagator`), or some
+            of the names in `values` do not correspond to any parameter.
+    """
+    propagator = ParameterPropagator(routine)
+    propagator.bind(values)
+    return propagator.values
@@ -0,0 +1,143 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Index of dotted paths of routines and ports in a program.
+
+Paths of routines consist of names of all the routines leading from the program to the routine
+(e.g. `root.a.b`), and paths of ports consist of paths of the routines they belong to followed
+by the names of the ports (e.g. `root.a.b.thru_0`). The index maps all such paths to the
+corresponding objects, and objects back to their paths, in constant time.
+
+The index is built on first use and rebuilt lazily, on the first lookup after any routine in the
+program has been modified (see `RoutineV1.mark_modified`). Modifications of ports are not tracked, hence renaming a
+port requires marking its routine as modified.
+"""
+
+from __future__ import annotations
+
+from ._subtree_cache import link_children, routine_cache, subtree_revision
+from .functools import accepts_all_qref_types
+from .schema_v1 import PortV1, RoutineV1
+
+_PATH_INDEX_CACHE_KEY = "path_index"
+
+
+class PathIndex:
+    """Index of paths of all routines and ports in a program.
+
+    If a routine has a child and a port with the same name, the path is ambiguous. In such a case,
+    it refers to the child when looked up with `__getitem__`. Similarly, if the same routine object
+    occurs in a program more than once, `path_of` returns the first of its paths, in pre-order.
+    """
+
+    def __init__(self, routine: RoutineV1):
+        self._root = routine
+        self._routines: dict[str, RoutineV1] = {}
+        self._ports: dict[str, PortV1] = {}
+        self._paths: dict[int, str] = {}
+        # Subtree revision of the program at the time the index was built.
+        self._built_at: int | None = None
+
+    def _ensure_up_to_date(self) -> None:
+        if self._built_at == subtree_revision(self._root):
+            return
+        routines: dict[str, RoutineV1] = {}
+        ports: dict[str, PortV1] = {}
+        paths: dict[int, str] = {}
+        stack = [(self._root, self._root.name)]
+        while stack:
+            routine, path = stack.pop()
+            routines[path] = routine
+            paths.setdefault(id(routine), path)
+            link_children(routine)
+            for port in routine.ports:
+                port_path = f"{path}.{port.name}"
+                ports[port_path] = port
+                paths.setdefault(id(port), port_path)
+            stack.extend((child, f"{path}.{child.name}") for child in reversed(routine.children))
+        self._routines, self._ports, self._paths = routines, ports, paths
+        self._built_at = subtree_revision(self._root)
+
+    def routine(self, path: str) -> RoutineV1:
+        """Get the routine with given path.
+
+        Raises:
+            KeyError: if there is no routine with given path.
+        """
+        self._ensure_up_to_date()
+        return self._routines[path]
+
+    def port(self, path: str) -> PortV1:
+        """Get the port with given path.
+
+        Raises:
+            KeyError: if there is no port with given path.
+        """
+        self._ensure_up_to_date()
+        return self._ports[path]
+
+    def __getitem__(self, path: str) -> RoutineV1 | PortV1:
+        """Get the routine or port with given path.
+
+        Raises:
+            KeyError: if there is no routine nor port with given path.
+        """
+        self._ensure_up_to_date()
+        if path in self._routines:
+            return self._routines[path]
+        return self._ports[path]
+
+    def __contains__(self, path: object) -> bool:
+        self._ensure_up_to_date()
+        return path in self._routines or path in self._ports
+
+    def __len__(self) -> int:
+        """Number of distinct paths in the index."""
+        self._ensure_up_to_date()
+        return len(self._routines.keys() | self._ports.keys())
+
+    def path_of(self, item: RoutineV1 | PortV1) -> str:
+        """Get the path of given routine or port.
+
+        Raises:
+            KeyError: if the routine or port is not part of the program.
+        """
+        self._ensure_up_to_date()
+        try:
+            return self._paths[id(item)]
+        except KeyError:
+            raise KeyError(f"{type(item).__name__} {item.name} is not part of the program.") from None
+
+    def routine_paths(self) -> list[str]:
+        """Get paths of all routines in the program, in pre-order."""
+        self._ensure_up_to_date()
+        return list(self._routines)
+
+
+@accepts_all_qref_types
+def path_index(routine: RoutineV1) -> PathIndex:
+    """Get the index of paths of a program.
+
+    The index is cached on the program, so that it is built only once, and shared by all its users.
+
+    Args:
+        routine: the program to be indexed.
+
+    Returns:
+        Index of paths of all routines and ports in the program, starting with its name.
+    """
+    cache = routine_cache(routine)
+    if (index := cache.get(_PATH_INDEX_CACHE_KEY)) is None:
+        index = cache[_PATH_INDEX_CACHE_KEY] = PathIndex(routine)
+    return index
@@ -16,8 +16,10 @@
 
 from __future__ import annotations
 
-from collections.abc import Iterator, MutableMapping
-from typing import Annotated, Any, Literal, TypeVar, get_args
+from collections.abc import Iterable, Iterator, MutableMapping
+from copy import copy, deepcopy
+from itertools import count
+from typing import Annotated, Any, Literal, SupportsIndex, TypeVar, get_args
 
 from pydantic import (
     AfterValidator,
@@ -48,33 +50,50 @@ _Value = int | float | str
 
 T = TypeVar("T")
 
+_revisions = count()
+
+
+def _bookkeeping(routine: RoutineV1) -> dict[str, Any]:
+    """Get bookkeeping data of a routine used for tracking its modifications, creating it on first use.
+
+    The data is stored as private attributes of the routine. They are not declared as such, because pydantic
+    would then initialize them for every validated routine, which noticeably slows down validation of large
+    programs, while most routines are never modified nor used with any of the caches.
+
+    Revision identifies the state of the routine and changes each time the routine is modified. Revisions
+    are never reused, and hence they can be used for detecting stale entries of the cache, which is used for
+    storing data derived from the routine (e.g. by incremental topology verification).
+
+    Subtree revision changes each time the routine or any of its descendants is modified. As long as it stays
+    the same, data derived from the whole subtree (e.g. fingerprints) remains valid, see qref._subtree_cache.
+
+    Parents are routines which were found to contain this one as a child when traversing the tree. The links
+    are only used for propagating modifications to ancestors, and hence stale ones merely cause needless
+    invalidation.
+    """
+    private = routine.__pydantic_private__
+    if private is None:
+        private = {"_revision": next(_revisions), "_subtree_revision": next(_revisions), "_parents": [], "_cache": {}}
+        _set_attribute(routine, "__pydantic_private__", private)
+    return private
+
 
 class _ProxyMapping(MutableMapping[str, T]):
-    def __init__(self, source: list[T]):
+    def __init__(self, source: NamedList[T]):
         self.source = source
 
-    def _find_item(self, name: str) -> tuple[int, T]:
-        try:
-            # To avoid the type: ignore below, we would have to define a protocol for named things,
-            # which seems to be an overkill, especially that this class is private.
-            return next(iter([(i, item) for i, item in enumerate(self.source) if item.name == name]))  # type: ignore
-        except StopIteration:
-            raise KeyError(name)
-
     def __getitem__(self, name: str) -> T:
-        _index, item = self._find_item(name)
-        return item
+        return self.source[self.source._find_index(name)]
 
     def __setitem__(self, name: str, new_item: T) -> None:
-        index, _current_item = self._find_item(name)
-        self.source[index] = new_item
+        self.source[self.source._find_index(name)] = new_item
 
     def __delitem__(self, name: str):
-        index, _current_item = self._find_item(name)
-        del self.source[index]
+        del self.source[self.source._find_index(name)]
 
     def __iter__(self) -> Iterator[str]:
-        # Same reason for type: ignore as above
+        # To avoid the type: ignore below, we would have to define a protocol for named things,
+        # which seems to be an overkill, especially that this class is private.
         return iter((item.name for item in self.source))  # type: ignore
 
     def __len__(self) -> int:
@@ -82,9 +101,108 @@ class _ProxyMapping(MutableMapping[str, T]):
 
 
 class NamedList(list[T]):
+    """List of named objects (e.g. routines, ports or resources) that can also be accessed by name.
+
+    The mapping from names to positions is built lazily on the first access by name and then
+    kept up to date when the list is extended, and rebuilt after any other modification.
+    Hence, looking up an item by name takes constant time, regardless of the size of the list.
+
+    Note:
+        Renaming items in place cannot be detected. Items are no longer found by their old names,
+        but they are only found by their new names once the mapping is rebuilt, e.g. after marking
+        the routine to which the list belongs as modified (see `RoutineV1.mark_modified`). Hence,
+        replacing the renamed item with a new one is preferred. Lookups of missing names never
+        rebuild the mapping, so that they take constant time as well.
+    """
+
+    # Class-level defaults make sure the attributes exist even for instances constructed
+    # without calling __init__, as it happens e.g. during unpickling.
+    _index: dict[str, int] | None = None
+    _proxy: _ProxyMapping[T] | None = None
+
     @property
     def by_name(self) -> _ProxyMapping[T]:
-        return _ProxyMapping(self)
+        if self._proxy is None:
+            self._proxy = _ProxyMapping(self)
+        return self._proxy
+
+    def _build_index(self) -> dict[str, int]:
+        index: dict[str, int] = {}
+        for i, item in enumerate(self):
+            # Same reason for type: ignore as in _ProxyMapping.__iter__. In case of duplicates,
+            # the first item with given name is the one accessible by name.
+            index.setdefault(item.name, i)  # type: ignore
+        self._index = index
+        return index
+
+    def _find_index(self, name: str) -> int:
+        i = (self._build_index() if self._index is None else self._index).get(name)
+        if i is not None and (i >= len(self) or self[i].name != name):  # type: ignore
+            # The item was renamed in place since the index was built, and some other item may have its name now.
+            i = self._build_index().get(name)
+        if i is None:
+            raise KeyError(name)
+        return i
+
+    def _invalidate_index(self) -> None:
+        self._index = None
+
+    def append(self, item: T) -> None:
+        if self._index is not None:
+            self._index.setdefault(item.name, len(self))  # type: ignore
+        super().append(item)
+
+    def extend(self, items: Iterable[T]) -> None:
+        start = len(self)
+        super().extend(items)
+        if self._index is not None:
+            for i in range(start, len(self)):
+                self._index.setdefault(self[i].name, i)  # type: ignore
+
+    def __iadd__(self, items: Iterable[T]) -> Self:  # type: ignore[misc, override]
+        self.extend(items)
+        return self
+
+    def __setitem__(self, key, value) -> None:
+        if not (isinstance(key, int) and self[key].name == value.name):  # type: ignore
+            self._invalidate_index()
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key) -> None:
+        self._invalidate_index()
+        super().__delitem__(key)
+
+    def __imul__(self, n: SupportsIndex) -> Self:  # type: ignore[misc, override]
+        self._invalidate_index()
+        return super().__imul__(n)
+
+    def insert(self, i, item: T) -> None:
+        self._invalidate_index()
+        super().insert(i, item)
+
+    def pop(self, i=-1) -> T:
+        self._invalidate_index()
+        return super().pop(i)
+
+    def remove(self, item: T) -> None:
+        self._invalidate_index()
+        super().remove(item)
+
+    def clear(self) -> None:
+        self._invalidate_index()
+        super().clear()
+
+    def sort(self, *args, **kwargs) -> None:
+        self._invalidate_index()
+        super().sort(*args, **kwargs)
+
+    def reverse(self) -> None:
+        self._invalidate_index()
+        super().reverse()
+
+    def __getstate__(self):
+        # Cached index and proxy are cheap to recreate and should not be copied nor pickled.
+        return {}
 
     @classmethod
     def __get_pydantic_core_schema__(cls, source, handler):
@@ -130,13 +248,15 @@ CONNECTION_SCHEMA = {
 }
 
 
+# Core schemas of all the models are built on their first use instead of on import, which makes importing
+# QREF (e.g. by CLI tools, or by modules using only parts of it) considerably faster.
 class PortV1(BaseModel):
     """Description of Port in V1 schema"""
 
     name: _Name
     direction: Literal["input", "output", "through"]
     size: _Value | None
-    model_config = ConfigDict(title="Port")
+    model_config = ConfigDict(title="Port", defer_build=True)
 
 
 class ConnectionV1(BaseModel):
@@ -145,7 +265,7 @@ class ConnectionV1(BaseModel):
     source: _OptionallyNamespacedName
     target: _OptionallyNamespacedName
 
-    model_config = ConfigDict(title="Connection", use_enum_values=True)
+    model_config = ConfigDict(title="Connection", use_enum_values=True, defer_build=True)
 
 
 class ResourceV1(BaseModel):
@@ -155,7 +275,7 @@ class ResourceV1(BaseModel):
     type: Literal["additive", "multiplicative", "qubits", "other"]
     value: _Value | None
 
-    model_config = ConfigDict(title="Resource")
+    model_config = ConfigDict(title="Resource", defer_build=True)
 
 
 class ParamLinkV1(BaseModel):
@@ -164,7 +284,7 @@ class ParamLinkV1(BaseModel):
     source: _OptionallyNamespacedName
     targets: list[_MultiNamespacedName]
 
-    model_config = ConfigDict(title="ParamLink")
+    model_config = ConfigDict(title="ParamLink", defer_build=True)
 
 
 class ConstantSequenceV1(BaseModel):
@@ -176,6 +296,8 @@ class ConstantSequenceV1(BaseModel):
     type: Literal["constant"]
     multiplier: _Value = 1
 
+    model_config = ConfigDict(defer_build=True)
+
 
 class ArithmeticSequenceV1(BaseModel):
     """Description of an arithmetic sequence in a V1 Schema.
@@ -188,6 +310,8 @@ class ArithmeticSequenceV1(BaseModel):
     initial_term: _Value = 0
     difference: _Value
 
+    model_config = ConfigDict(defer_build=True)
+
 
 class GeometricSequenceV1(BaseModel):
     """Description of a geometric sequence in a V1 Schema.
@@ -199,6 +323,8 @@ class GeometricSequenceV1(BaseModel):
     type: Literal["geometric"]
     ratio: _Value
 
+    model_config = ConfigDict(defer_build=True)
+
 
 class ClosedFormSequenceV1(BaseModel):
     """Description of a sequence with known closed-form for a sum or product in a V1 Schema.
@@ -212,6 +338,8 @@ class ClosedFormSequenceV1(BaseModel):
     prod: _Value | None = None
     num_terms_symbol: str
 
+    model_config = ConfigDict(defer_build=True)
+
 
 class CustomSequenceV1(BaseModel):
     """Description of a custom sequence in a V1 Schema.
@@ -225,6 +353,8 @@ class CustomSequenceV1(BaseModel):
     term_expression: str
     iterator_symbol: str = "i"
 
+    model_config = ConfigDict(defer_build=True)
+
 
 class RepetitionV1(BaseModel):
     """Description of a repetition of a routine in V1 schema."""
@@ -232,6 +362,8 @@ class RepetitionV1(BaseModel):
     count: int | str
     sequence: ConstantSequenceV1 | ArithmeticSequenceV1 | GeometricSequenceV1 | ClosedFormSequenceV1 | CustomSequenceV1
 
+    model_config = ConfigDict(defer_build=True)
+
 
 class RoutineV1(BaseModel):
     """Description of Routine in V1 schema.
@@ -251,11 +383,77 @@ class RoutineV1(BaseModel):
     linked_params: Annotated[list[ParamLinkV1], _source_sorter] = []
     repetition: RepetitionV1 | None = None
     meta: dict[str, Any] = {}
-    model_config = ConfigDict(title="Routine", validate_assignment=True)
+    model_config = ConfigDict(title="Routine", validate_assignment=True, defer_build=True)
 
     def __init__(self, **data: Any):
         super().__init__(**{k: v for k, v in data.items() if v != [] and v != {}})
 
+    def __setattr__(self, name: str, value: Any) -> None:
+        try:
+            super().__setattr__(name, value)
+        finally:
+            # Even if the assignment fails validation, the routine is left with the new value.
+            if name in RoutineV1.model_fields:
+                self.mark_modified()
+
+    def __eq__(self, other: Any) -> bool:
+        # Private attributes only hold bookkeeping data (see _bookkeeping), and hence they are excluded.
+        if not isinstance(other, RoutineV1):
+            return NotImplemented
+        return self.__dict__ == other.__dict__
+
+    # Copies are not linked to the parents of the original, and hence they cannot share its bookkeeping data.
+    def __copy__(self) -> Self:
+        return _construct(type(self), copy(self.__dict__), copy(self.__pydantic_fields_set__))
+
+    def __deepcopy__(self, memo: dict[int, Any] | None = None) -> Self:
+        return _construct(type(self), deepcopy(self.__dict__, memo), copy(self.__pydantic_fields_set__))
+
+    def __getstate__(self) -> dict[Any, Any]:
+        # Weak references to parents cannot be pickled.
+        return {**super().__getstate__(), "__pydantic_private__": None}
+
+    def mark_modified(self) -> None:
+        """Mark this routine as modified, invalidating any data derived from it or its ancestors.
+
+        Assigning to any of the routine's fields marks it as modified automatically. However,
+        modifications done in place, like appending a port to `ports`, cannot be detected
+        and should be followed by a call to this method on the modified routine.
+        """
+        # Items of the lists may have been renamed in place.
+        for items in (self.children, self.ports, self.resources):
+            if isinstance(items, NamedList):
+                items._invalidate_index()
+        # Nothing can be derived from a routine which has no bookkeeping data yet.
+        if self.__pydantic_private__ is None:
+            return
+        private = self.__pydantic_private__
+        revision = private["_revision"] = next(_revisions)
+        private["_cache"].clear()
+        # Only ancestors of the routine have to be revisited, which is what makes recomputing data derived
+        # from large programs after small modifications cheap. The check of the revision stops the traversal
+        # at ancestors reachable in more than one way, and guards against cycles of stale links.
+        stack = [self]
+        while stack:
+            private = _bookkeeping(stack.pop())
+            if private["_subtree_revision"] != revision:
+                private["_subtree_revision"] = revision
+                stack.extend(parent for ref in private["_parents"] if (parent := ref()) is not None)
+
+    def fingerprint(self) -> str:
+        """Compute structural fingerprint of this routine.
+
+        Fingerprints of routines with identical contents (including their whole subtrees) are
+        the same, regardless of the routines' names. Hence, they can be used for detecting
+        identical subroutines anywhere in a program. See `qref.fingerprinting` for details.
+
+        Returns:
+            Hexadecimal digest uniquely identifying the structure of this routine.
+        """
+        from .fingerprinting import fingerprint
+
+        return fingerprint(self)
+
     @model_validator(mode="after")
     def _validate_connections(self) -> Self:
         children_port_names = [f"{child.name}.{port.name}" for child in self.children for port in child.ports]
@@ -282,6 +480,139 @@ class SchemaV1(BaseModel):
     version: Literal["v1"]
     program: RoutineV1
 
+    model_config = ConfigDict(defer_build=True)
+
+    @classmethod
+    def load_trusted(cls, data: dict[str, Any]) -> Self:
+        """Construct SchemaV1 object from data known to be valid, without validating it.
+
+        This takes about three quarters of the time of `model_validate` for large programs, and is
+        meant for loading programs that were already validated, e.g. ones serialized by a trusted
+        pipeline. The constructed object is equal to the one constructed by `model_validate`. In particular,
+        ports, resources, connections and parameter links are sorted, and connections given as strings are parsed.
+
+        Warning:
+            No validation is performed whatsoever, so loading invalid data results in a malformed object.
+
+        Args:
+            data: dictionary with program in V1 schema, as obtained e.g. by loading a JSON or YAML file.
+
+        Returns:
+            An instance of SchemaV1 corresponding to the provided data.
+        """
+        return _construct(cls, {"version": data["version"], "program": _construct_routine(data["program"])}, set(data))
+
+    def to_bytes(self) -> bytes:
+        """Serialize this program to a compact binary format.
+
+        The binary format is considerably smaller and faster to load than JSON or YAML, because names
+        are interned and ports, resources and connections are stored in tables of fixed-size records.
+        See `qref.binary` for the description of the format.
+
+        Returns:
+            Serialized program, which can be loaded back with `SchemaV1.from_bytes`.
+        """
+        from .binary import encode
+
+        return encode(self)
+
+    @classmethod
+    def from_bytes(cls, data: bytes | bytearray | memoryview) -> SchemaV1:
+        """Load program serialized with `SchemaV1.to_bytes`.
+
+        Like `load_trusted`, this method does not validate the program, because only valid programs
+        can be serialized in the first place.
+
+        Args:
+            data: program serialized to the binary format.
+
+        Returns:
+            An instance of SchemaV1 equal to the one that was serialized.
+
+        Raises:
+            ValueError: if `data` is not a program serialized to the binary format.
+        """
+        from .binary import decode
+
+        return decode(data)
+
+
+_SEQUENCE_MODELS: dict[str, type[BaseModel]] = {
+    "constant": ConstantSequenceV1,
+    "arithmetic": ArithmeticSequenceV1,
+    "geometric": GeometricSequenceV1,
+    "closed_form": ClosedFormSequenceV1,
+    "custom": CustomSequenceV1,
+}
+
+_M = TypeVar("_M", bound=BaseModel)
+
+_set_attribute = object.__setattr__
+
+
+def _construct(
+    model: type[_M], fields: dict[str, Any], fields_set: set[str], private: dict[str, Any] | None = None
+) -> _M:
+    """Create an instance of a model from values of all its fields, without validating them.
+
+    This is equivalent to `model.model_construct`, except that all the fields have to be provided,
+    which avoids the overhead of resolving default values. Said overhead makes `model_construct`
+    slower than validating the data with `model_validate` in the first place.
+    """
+    instance = model.__new__(model)
+    _set_attribute(instance, "__dict__", fields)
+    _set_attribute(instance, "__pydantic_fields_set__", fields_set)
+    _set_attribute(instance, "__pydantic_extra__", None)
+    _set_attribute(instance, "__pydantic_private__", private)
+    return instance
+
+
+def _construct_simple(model: type[_M], data: dict[str, Any]) -> _M:
+    # Only for models with all fields required, like PortV1 or ConnectionV1. Fields are stored in the same
+    # order as by model_validate, which matters e.g. for the order of keys in the JSON produced by model_dump_json.
+    return _construct(model, {name: data[name] for name in model.__pydantic_fields__}, set(data))
+
+
+def _construct_named_list(model: type[PortV1] | type[ResourceV1], items: Iterable[dict[str, Any]]) -> NamedList:
+    return NamedList(sorted((_construct_simple(model, item) for item in items), key=lambda item: item.name))
+
+
+def _construct_routine(data: dict[str, Any]) -> RoutineV1:
+    """Recursively construct RoutineV1 from a dictionary without validating it, see SchemaV1.load_trusted."""
+    fields: dict[str, Any] = {
+        "name": data["name"],
+        "children": NamedList(_construct_routine(child) for child in data.get("children", ())),
+        "type": data.get("type"),
+        "ports": _construct_named_list(PortV1, data.get("ports", ())),
+        "resources": _construct_named_list(ResourceV1, data.get("resources", ())),
+        "connections": sorted(
+            (
+                _construct_simple(ConnectionV1, _parse_connection(connection))
+                for connection in data.get("connections", ())
+            ),
+            key=lambda connection: connection.source,
+        ),
+        "input_params": list(data.get("input_params", ())),
+        "local_variables": dict(data.get("local_variables", ())),
+        "linked_params": sorted(
+            (
+                _construct(ParamLinkV1, {"source": link["source"], "targets": list(link["targets"])}, set(link))
+                for link in data.get("linked_params", ())
+            ),
+            key=lambda link: link.source,
+        ),
+        "repetition": None,
+        "meta": dict(data.get("meta", ())),
+    }
+    if (repetition := data.get("repetition")) is not None:
+        sequence = repetition["sequence"]
+        fields["repetition"] = _construct(
+            RepetitionV1,
+            {"count": repetition["count"], "sequence": _SEQUENCE_MODELS[sequence["type"]].model_construct(**sequence)},
+            set(repetition),
+        )
+    return _construct(RoutineV1, fields, set(data))
+
 
 class _GenerateV1JsonSchema(GenerateJsonSchema):
     def generate(self, schema, mode="validation"):
@@ -12,16 +12,33 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from collections import Counter, defaultdict
+import heapq
+from collections import defaultdict
 from dataclasses import dataclass
 from graphlib import CycleError, TopologicalSorter
-from typing import Callable
+from itertools import count
 
+from ._subtree_cache import link_children, revision, routine_cache, subtree_revision
+from .connections import connection_index
 from .functools import accepts_all_qref_types
 from .schema_v1 import RoutineV1
 
 Graph = dict[str, list[str]]
 
+_TOPOLOGY_CACHE_KEY = "verified_topology"
+_SUBTREE_TOPOLOGY_CACHE_KEY = "verified_subtree_topology"
+
+# Number of tasks per worker used by parallel verification, more tasks give better load balancing
+# at the expense of larger overhead of communication between processes.
+_TASKS_PER_WORKER = 4
+
+# Routine being verified by given worker process, see _verify_in_parallel.
+_worker_routine: RoutineV1 | None = None
+
+# Segment of a task of parallel verification, comprising indices leading from the root to the routine
+# to be verified, and a flag whether the whole subtree should be verified or the routine alone.
+_Segment = tuple[tuple[int, ...], bool]
+
 
 @dataclass
 class TopologyVerificationOutput:
@@ -38,137 +55,276 @@ class TopologyVerificationOutput:
 
 
 @accepts_all_qref_types
-def verify_topology(routine: RoutineV1) -> TopologyVerificationOutput:
+def verify_topology(routine: RoutineV1, incremental: bool = False, workers: int = 1) -> TopologyVerificationOutput:
     """Checks whether program has correct topology.
 
     Correct topology cannot include cycles or disconnected ports.
 
     Args:
         routine: Routine or program to be verified.
+        incremental: if True, routines which were found correct by previous incremental verification,
+            and which were not modified since then, are not verified again. Subtrees without any modified
+            routines are skipped as a whole, and hence re-verification after editing a large program only
+            visits the edited routines, their ancestors and the ancestors' children. Note that routines
+            modified in place have to be explicitly marked as such, see `RoutineV1.mark_modified`.
+        workers: number of processes used for verification. If greater than one, the program is split
+            into subtrees verified in parallel by a pool of worker processes. The problems are reported
+            in exactly the same order as when verifying serially.
+
+    Raises:
+        ValueError: if `workers` is not positive, or if parallel verification is requested together
+            with the incremental one.
     """
-    problems = _verify_routine_topology(routine)
+    if workers < 1:
+        raise ValueError(f"Number of workers has to be positive, got {workers}.")
+    if workers > 1 and incremental:
+        raise ValueError("Incremental verification cannot be done in parallel.")
+    problems = _verify_in_parallel(routine, workers) if workers > 1 else _verify_routine_topology(routine, incremental)
     return TopologyVerificationOutput(problems)
 
 
-def _make_prefixer(ancestor_path: tuple[str, ...]) -> Callable[[str], str]:
-    def _prefix(text: str) -> str:
-        return ".".join([*ancestor_path, text])
+class _RoutinePath:
+    """Dotted path of a routine in the hierarchy, formatted only when it is needed to report a problem.
+
+    Formatting paths eagerly would make verification quadratic in the depth of the hierarchy.
+    """
+
+    __slots__ = ("name", "parent")
+
+    def __init__(self, name: str, parent: "_RoutinePath | None" = None):
+        self.name = name
+        self.parent = parent
+
+    def __str__(self) -> str:
+        names = []
+        node: _RoutinePath | None = self
+        while node is not None:
+            names.append(node.name)
+            node = node.parent
+        return ".".join(reversed(names))
+
+
+def _topology_stamp(routine: RoutineV1) -> tuple[int, ...]:
+    # Topology of a routine depends on the routine itself and on its direct children (e.g. their ports).
+    return (revision(routine), *(revision(child) for child in routine.children))
+
+
+def _verify_routine_topology(
+    routine: RoutineV1, incremental: bool = False, path: _RoutinePath | None = None
+) -> list[str]:
+    # The tree is traversed iteratively in pre-order, so that arbitrarily deep programs can be verified
+    # and problems are reported in the same order as in the depth-first recursive traversal. In incremental
+    # verification, the stack also holds markers of leaving subtrees, comprising the number of problems
+    # found before entering them.
+    problems: list[str] = []
+    stack: list[tuple[RoutineV1, _RoutinePath | int]] = [(routine, path or _RoutinePath(routine.name))]
+    while stack:
+        current, path_or_marker = stack.pop()
+        if isinstance(path_or_marker, int):
+            if len(problems) == path_or_marker:
+                routine_cache(current)[_SUBTREE_TOPOLOGY_CACHE_KEY] = subtree_revision(current)
+            continue
+
+        # Only correct routines and subtrees are cached, because problems contain paths which change when
+        # routines are moved around. Since problems should be rare, this has negligible cost.
+        if incremental:
+            if routine_cache(current).get(_SUBTREE_TOPOLOGY_CACHE_KEY) == subtree_revision(current):
+                continue
+            # Children are linked, so that modifying any of them changes the subtree revision of the routine.
+            link_children(current)
+            stack.append((current, len(problems)))
+        stack.extend((child, _RoutinePath(child.name, path_or_marker)) for child in reversed(current.children))
+
+        if incremental and routine_cache(current).get(_TOPOLOGY_CACHE_KEY) == (stamp := _topology_stamp(current)):
+            continue
+
+        local_problems = _verify_local_topology(current, path_or_marker)
+        if incremental and not local_problems:
+            routine_cache(current)[_TOPOLOGY_CACHE_KEY] = stamp
+        problems.extend(local_problems)
+    return problems
+
+
+def _verify_local_topology(routine: RoutineV1, path: _RoutinePath) -> list[str]:
+    return [*_find_cycles(routine, path), *_find_disconnected_ports(routine, path)]
 
-    return _prefix
 
+def _verify_in_parallel(routine: RoutineV1, workers: int) -> list[str]:
+    # Imported here, because importing multiprocessing noticeably slows down importing QREF.
+    from concurrent.futures import ProcessPoolExecutor
 
-def _verify_routine_topology(routine: RoutineV1, ancestor_path: tuple[str, ...] = ()) -> list[str]:
-    return [
-        *_find_cycles(routine, ancestor_path),
-        *_find_disconnected_ports(routine, ancestor_path),
-        *[
-            problem
-            for child in routine.children
-            for problem in _verify_routine_topology(child, ancestor_path + (routine.name,))
-        ],
-    ]
+    tasks = _split_into_tasks(routine, workers * _TASKS_PER_WORKER)
+    # Routine is passed to the workers only once, and tasks refer to its parts by indices. In particular,
+    # with the "fork" start method, the routine is inherited by the workers without being pickled at all.
+    with ProcessPoolExecutor(max_workers=workers, initializer=_set_worker_routine, initargs=(routine,)) as pool:
+        return [problem for problems in pool.map(_verify_segments, tasks) for problem in problems]
 
 
-def _graph_from_routine(routine: RoutineV1, path: tuple[str, ...]) -> Graph:
+def _set_worker_routine(routine: RoutineV1) -> None:
+    global _worker_routine
+    _worker_routine = routine
+
+
+def _verify_segments(segments: list[_Segment]) -> list[str]:
+    assert _worker_routine is not None
+    problems = []
+    for indices, whole_subtree in segments:
+        routine = _worker_routine
+        path = _RoutinePath(routine.name)
+        for i in indices:
+            routine = routine.children[i]
+            path = _RoutinePath(routine.name, path)
+        if whole_subtree:
+            problems.extend(_verify_routine_topology(routine, path=path))
+        else:
+            problems.extend(_verify_local_topology(routine, path))
+    return problems
+
+
+def _subtree_sizes(routine: RoutineV1) -> dict[int, int]:
+    pre_order: list[RoutineV1] = []
+    stack = [routine]
+    while stack:
+        current = stack.pop()
+        pre_order.append(current)
+        stack.extend(current.children)
+
+    sizes: dict[int, int] = {}
+    for current in reversed(pre_order):
+        sizes[id(current)] = 1 + sum(sizes[id(child)] for child in current.children)
+    return sizes
+
+
+def _split_into_tasks(routine: RoutineV1, n_tasks: int) -> list[list[_Segment]]:
+    """Split routine into tasks, each comprising segments which can be verified independently.
+
+    The largest subtrees are split (i.e. their root is verified separately from each of the children's subtrees)
+    until there are at least `n_tasks` subtrees or only leaves are left. Consecutive segments are then grouped
+    into tasks of similar sizes, so that e.g. thousands of leaf children of a wide routine are not verified by
+    separate tasks. The segments are ordered in pre-order, so that concatenating their problems gives the same
+    result as verifying the whole routine at once.
+    """
+    sizes = _subtree_sizes(routine)
+    tie_breaker = count()
+    heap = [(-sizes[id(routine)], next(tie_breaker), routine)]
+    split: set[int] = set()
+
+    while len(heap) < n_tasks:
+        _, _, largest = heapq.heappop(heap)
+        if not largest.children:
+            break
+        split.add(id(largest))
+        for child in largest.children:
+            heapq.heappush(heap, (-sizes[id(child)], next(tie_breaker), child))
+
+    tasks: list[list[_Segment]] = [[]]
+    task_size = 0
+    max_task_size = sizes[id(routine)] / n_tasks
+    stack: list[tuple[RoutineV1, tuple[int, ...]]] = [(routine, ())]
+    while stack:
+        current, indices = stack.pop()
+        if id(current) in split:
+            segment, segment_size = (indices, False), 1
+            stack.extend((current.children[i], (*indices, i)) for i in reversed(range(len(current.children))))
+        else:
+            segment, segment_size = (indices, True), sizes[id(current)]
+        if task_size > 0 and task_size + segment_size > max_task_size:
+            tasks.append([])
+            task_size = 0
+        tasks[-1].append(segment)
+        task_size += segment_size
+    return tasks
+
+
+def _graph_from_routine(routine: RoutineV1) -> Graph:
     """Convert routine to a graph in a format expected by graphlib.
 
     Nodes represent ports and edges represent connections (they're directed).
     Additionaly, we add node for each children and edges coming from all the input ports
     into the children, and from the children into all the output ports.
-    """
-    graph = defaultdict[str, list[str]](list)
-    _prefix = _make_prefixer(path + (routine.name,))
 
+    Nodes are named relative to the routine, so that the cost of constructing the graph
+    does not depend on how deep in the hierarchy the routine is.
+    """
     # First, we go through all the connections and add them as adges to the graph
-    for connection in routine.connections:
-        source = _prefix(connection.source)
-        target = _prefix(connection.target)
-        graph[target].append(source)
+    graph = defaultdict[str, list[str]](
+        list, ((target, list(sources)) for target, sources in connection_index(routine).incoming.items())
+    )
 
     # Then for each children we add an extra node and set of connections
     for child in routine.children:
-        input_ports: list[str] = []
-        output_ports: list[str] = []
+        child_prefix = f"{child.name}."
+        input_ports = [child_prefix + port.name for port in child.ports if port.direction == "input"]
+        output_ports = [child_prefix + port.name for port in child.ports if port.direction == "output"]
 
-        child_path = _prefix(child.name)
-        for port in child.ports:
-            if port.direction == "input":
-                input_ports.append(".".join([child_path, port.name]))
-            elif port.direction == "output":
-                output_ports.append(".".join([child_path, port.name]))
-
-        for input_port in input_ports:
-            graph[child_path].append(input_port)
+        if input_ports:
+            graph[child.name].extend(input_ports)
 
         for output_port in output_ports:
-            graph[output_port].append(child_path)
+            graph[output_port].append(child.name)
 
     return graph
 
 
-def _find_cycles(routine: RoutineV1, ancestor_path: tuple[str, ...]) -> list[str]:
-    sorter = TopologicalSorter(_graph_from_routine(routine, ancestor_path))
+def _find_cycles(routine: RoutineV1, path: _RoutinePath) -> list[str]:
+    sorter = TopologicalSorter(_graph_from_routine(routine))
     try:
         _ = tuple(sorter.static_order())  # static_order is a generator, tuple() triggers actual iteration
     except CycleError as e:
-        return [f"Cycle detected: {e.args[1]}"]
+        return [f"Cycle detected: {[f'{path}.{node}' for node in e.args[1]]}"]
 
     return []
 
 
-def _find_disconnected_ports(routine: RoutineV1, ancestor_path: tuple[str, ...]) -> list[str]:
+def _find_disconnected_ports(routine: RoutineV1, path: _RoutinePath) -> list[str]:
     problems: list[str] = []
 
-    _prefix = _make_prefixer(ancestor_path + (routine.name,))
-
-    sources_counts = Counter[str]()
-    target_counts = Counter[str]()
-
-    for connection in routine.connections:
-        sources_counts[connection.source] += 1
-        target_counts[connection.target] += 1
+    index = connection_index(routine)
 
-    multi_sources = [source for source, count in sources_counts.items() if count > 1]
+    multi_sources = [source for source, targets in index.outgoing.items() if len(targets) > 1]
 
-    multi_targets = [target for target, count in target_counts.items() if count > 1]
+    multi_targets = [target for target, sources in index.incoming.items() if len(sources) > 1]
 
     if multi_sources:
-        problems.append(f"Too many outgoing connections from {','.join(_prefix(target) for target in multi_sources)}.")
+        problems.append(f"Too many outgoing connections from {','.join(f'{path}.{pname}' for pname in multi_sources)}.")
 
     if multi_targets:
-        problems.append(f"Too many incoming connections to {','.join(_prefix(target) for target in multi_targets)}.")
+        problems.append(f"Too many incoming connections to {','.join(f'{path}.{pname}' for pname in multi_targets)}.")
 
-    requiring_outgoing = set[str]()
-    requiring_incoming = set[str]()
-    thru_ports = set[str]()
+    # Dicts are used instead of sets to make the order of problems independent of hash randomization,
+    # which in particular makes results of serial and parallel verification identical.
+    requiring_outgoing = dict[str, None]()
+    requiring_incoming = dict[str, None]()
+    thru_ports = dict[str, None]()
 
     for port in routine.ports:
         if port.direction == "input" and routine.children:
-            requiring_outgoing.add(port.name)
+            requiring_outgoing[port.name] = None
         elif port.direction == "output" and routine.children:
-            requiring_incoming.add(port.name)
+            requiring_incoming[port.name] = None
         elif port.direction == "through":  # Note: through ports have to be valid regardless of existence of children
-            thru_ports.add(port.name)
+            thru_ports[port.name] = None
 
     for child in routine.children:
         # Directions are reversed compared to parent + through ports have to be connected on both ends
+        child_prefix = f"{child.name}."
         for port in child.ports:
-            pname = f"{child.name}.{port.name}"
+            pname = child_prefix + port.name
             if port.direction != "output":
-                requiring_incoming.add(pname)
+                requiring_incoming[pname] = None
             if port.direction != "input":
-                requiring_outgoing.add(pname)
+                requiring_outgoing[pname] = None
 
     for pname in requiring_outgoing:
-        if pname not in sources_counts:
-            problems.append(f"No outgoing connection from {_prefix(pname)}.")
+        if pname not in index.outgoing:
+            problems.append(f"No outgoing connection from {path}.{pname}.")
 
     for pname in requiring_incoming:
-        if pname not in target_counts:
-            problems.append(f"No incoming connection to {_prefix(pname)}.")
+        if pname not in index.incoming:
+            problems.append(f"No incoming connection to {path}.{pname}.")
 
     for pname in thru_ports:
-        if pname in sources_counts or pname in target_counts:
-            problems.append(f"A through port {_prefix(pname)} is connected via an internal connection.")
+        if index.is_connected(pname):
+            problems.append(f"A through port {path}.{pname} is connected via an internal connection.")
 
     return problems
@@ -12,10 +12,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import io
 import json
+import shutil
 from subprocess import Popen
 
-from qref.experimental.rendering import to_graphviz
+import pytest
+
+from qref.experimental.rendering import render_files, to_graphviz, write_dot
 
 
 def test_example_valid_programs_can_converted_to_graphviz(valid_program):
@@ -33,3 +37,145 @@ def test_example_valid_programs_can_be_rendered_from_cli(valid_program, tmp_path
     process.wait()
 
     assert process.returncode == 0
+
+
+NESTED_PROGRAM = {
+    "version": "v1",
+    "program": {
+        "name": "root",
+        "ports": [{"name": "in_0", "direction": "input", "size": 1}],
+        "children": [
+            {
+                "name": "a",
+                "ports": [{"name": "in_0", "direction": "input", "size": 1}],
+                "children": [{"name": "b", "ports": [{"name": "in_0", "direction": "input", "size": 1}]}],
+                "connections": ["in_0 -> b.in_0"],
+            }
+        ],
+        "connections": ["in_0 -> a.in_0"],
+    },
+}
+
+
+def test_nested_routines_are_rendered_as_nested_clusters():
+    assert to_graphviz(NESTED_PROGRAM).source.splitlines() == [
+        "digraph {",
+        "\tgraph [fontname=Helvetica rankdir=LR splines=false]",
+        '\tsubgraph "cluster_.root" {',
+        "\t\tgraph [label=root style=rounded]",
+        '\t\tsubgraph ".root: inputs" {',
+        "\t\t\tgraph [rank=same]",
+        '\t\t\t"\\".root.in_0\\"" [label=in_0 color="#ffa44a" fontsize=10 shape=circle style=bold]',
+        "\t\t}",
+        '\t\tsubgraph ".root: outputs" {',
+        "\t\t\tgraph [rank=same]",
+        "\t\t}",
+        '\t\tsubgraph ".root: through" {',
+        "\t\t\tgraph [rank=same]",
+        "\t\t}",
+        '\t\tsubgraph "cluster_.root.a" {',
+        "\t\t\tgraph [label=a style=rounded]",
+        '\t\t\tsubgraph ".root.a: inputs" {',
+        "\t\t\t\tgraph [rank=same]",
+        '\t\t\t\t"\\".root.a.in_0\\"" [label=in_0 color="#ffa44a" fontsize=10 shape=circle style=bold]',
+        "\t\t\t}",
+        '\t\t\tsubgraph ".root.a: outputs" {',
+        "\t\t\t\tgraph [rank=same]",
+        "\t\t\t}",
+        '\t\t\tsubgraph ".root.a: through" {',
+        "\t\t\t\tgraph [rank=same]",
+        "\t\t\t}",
+        '\t\t\t"\\".root.a.b\\"" [label="{{<in_0> in_0}|b|{}}" color="#0288f5" fontsize=12 shape=Mrecord style=bold]',
+        '\t\t\t"\\".root.a.in_0\\"" -> "\\".root.a.b\\"":" in_0"',
+        "\t\t}",
+        '\t\t"\\".root.in_0\\"" -> "\\".root.a.in_0\\""',
+        "\t}",
+        "}",
+    ]
+
+
+def test_routines_deeper_than_max_depth_are_not_rendered():
+    source = to_graphviz(NESTED_PROGRAM, max_depth=1).source
+
+    assert "cluster_.root.a" not in source
+    assert ".root.a.b" not in source
+    assert 'style="bold,dashed"' in source
+    assert '"\\".root.in_0\\"" -> "\\".root.a\\"":" in_0"' in source
+
+
+def test_subtree_is_rendered_with_the_same_names_as_in_the_whole_program():
+    whole = to_graphviz(NESTED_PROGRAM).source.splitlines()
+    subtree = to_graphviz(NESTED_PROGRAM, path="root.a").source.splitlines()
+
+    # The subtree is drawn as the cluster of routine a in the whole program, one level of nesting up.
+    assert ["\t" + line for line in subtree[2:-1]] == whole[14:-3]
+
+
+@pytest.mark.parametrize(
+    "kwargs, match",
+    [
+        ({"max_depth": -1}, "nonnegative"),
+        ({"path": "program.a"}, "does not start with"),
+        ({"path": "root.a.c"}, "root.a has no child named c"),
+    ],
+)
+def test_rendering_invalid_parts_of_program_fails(kwargs, match):
+    with pytest.raises(ValueError, match=match):
+        to_graphviz(NESTED_PROGRAM, **kwargs)
+
+
+def test_example_valid_programs_are_written_as_dot_the_same_as_converted_to_graphviz(valid_program):
+    file = io.StringIO()
+    write_dot(valid_program, file)
+
+    assert file.getvalue() == to_graphviz(valid_program).source
+
+
+@pytest.mark.parametrize("kwargs", [{}, {"max_depth": 0}, {"max_depth": 1}, {"path": "root.a"}])
+def test_parts_of_programs_are_written_as_dot_the_same_as_converted_to_graphviz(kwargs):
+    file = io.StringIO()
+    write_dot(NESTED_PROGRAM, file, **kwargs)
+
+    assert file.getvalue() == to_graphviz(NESTED_PROGRAM, **kwargs).source
+
+
+def test_nothing_is_written_as_dot_for_invalid_parts_of_program():
+    file = io.StringIO()
+    with pytest.raises(ValueError, match="root.a has no child named c"):
+        write_dot(NESTED_PROGRAM, file, path="root.a.c")
+
+    assert file.getvalue() == ""
+
+
+def _write_programs(directory, programs):
+    directory.mkdir()
+    for name, program in programs.items():
+        with open(directory / f"{name}.json", "wt") as f:
+            json.dump(program, f)
+
+
+@pytest.mark.skipif(shutil.which("dot") is None, reason="Rendering requires graphviz binaries")
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_many_programs_can_be_rendered_in_parallel(tmp_path, jobs):
+    _write_programs(tmp_path / "inputs", {"first": NESTED_PROGRAM, "second": NESTED_PROGRAM})
+
+    errors = render_files(sorted((tmp_path / "inputs").iterdir()), tmp_path / "outputs", jobs=jobs)
+
+    assert errors == {}
+    assert (tmp_path / "outputs" / "first.svg").exists()
+    assert (tmp_path / "outputs" / "second.svg").exists()
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_failures_of_rendering_many_programs_are_reported(tmp_path, jobs):
+    _write_programs(tmp_path / "inputs", {"invalid": {"version": "v1", "program": {"name": "1st"}}})
+
+    errors = render_files([tmp_path / "inputs" / "invalid.json"], tmp_path / "outputs", jobs=jobs)
+
+    assert list(errors) == [tmp_path / "inputs" / "invalid.json"]
+    assert errors[tmp_path / "inputs" / "invalid.json"].startswith("ValidationError")
+
+
+def test_rendering_many_programs_into_the_same_files_fails(tmp_path):
+    with pytest.raises(ValueError, match="same files"):
+        render_files([tmp_path / "a" / "program.yaml", tmp_path / "b" / "program.json"], tmp_path / "outputs")
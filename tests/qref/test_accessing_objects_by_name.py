@@ -11,9 +11,12 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import copy
+import pickle
+
 import pytest
 
-from qref.schema_v1 import PortV1, ResourceV1, RoutineV1
+from qref.schema_v1 import NamedList, PortV1, ResourceV1, RoutineV1
 
 
 @pytest.fixture
@@ -132,3 +135,87 @@ class TestAccessingResourcesByName:
             example_routine.resources.by_name["n_qubits"] = new_resource
 
         assert exc_info.value.args == ("n_qubits",)
+
+
+class TestNameIndexIsKeptUpToDate:
+    @pytest.fixture
+    def routines(self):
+        return NamedList(RoutineV1(name=name) for name in ["a", "b", "c"])
+
+    def test_by_name_returns_the_same_proxy_on_every_access(self, routines):
+        assert routines.by_name is routines.by_name
+
+    def test_appended_and_extended_items_can_be_accessed_by_name(self, routines):
+        _ = routines.by_name["a"]
+        routines.append(RoutineV1(name="d"))
+        routines.extend([RoutineV1(name="e"), RoutineV1(name="f")])
+        routines += [RoutineV1(name="g")]
+
+        assert [routines.by_name[name].name for name in "abcdefg"] == list("abcdefg")
+
+    @pytest.mark.parametrize(
+        "mutate",
+        [
+            lambda routines: routines.insert(0, RoutineV1(name="x")),
+            lambda routines: routines.remove(routines[1]),
+            lambda routines: routines.pop(0),
+            lambda routines: routines.sort(key=lambda r: r.name, reverse=True),
+            lambda routines: routines.reverse(),
+            lambda routines: routines.__setitem__(slice(0, 2), [RoutineV1(name="y")]),
+            lambda routines: routines.__delitem__(slice(1, None)),
+            lambda routines: routines.__setitem__(0, RoutineV1(name="z")),
+        ],
+    )
+    def test_index_stays_correct_after_modifying_the_list(self, routines, mutate):
+        _ = routines.by_name["a"]
+        mutate(routines)
+
+        assert all(routines.by_name[routine.name] is routine for routine in routines)
+        assert set(routines.by_name) == {routine.name for routine in routines}
+
+    def test_items_removed_from_the_list_cannot_be_accessed_by_name(self, routines):
+        _ = routines.by_name["a"]
+        routines.clear()
+
+        assert "a" not in routines.by_name
+
+    def test_item_renamed_in_place_can_be_accessed_by_its_new_name(self, routines):
+        _ = routines.by_name["a"]
+        routines[0].name = "b"
+        routines[1].name = "a"
+
+        assert routines.by_name["a"] is routines[1]
+
+    def test_item_renamed_in_place_to_a_new_name_can_be_accessed_by_it_after_marking_routine_as_modified(
+        self, routines
+    ):
+        routine = RoutineV1(name="root", children=routines)
+        _ = routine.children.by_name["a"]
+        routine.children[0].name = "z"
+        routine.mark_modified()
+
+        assert list(routine.children.by_name) == [child.name for child in routine.children]
+        assert "z" in routine.children.by_name
+        assert routine.children.by_name["z"] is routine.children[0]
+        assert "a" not in routine.children.by_name
+
+    def test_looking_up_missing_names_does_not_rebuild_the_index(self, routines, monkeypatch):
+        built = []
+        build_index = NamedList._build_index
+        monkeypatch.setattr(NamedList, "_build_index", lambda self: built.append(self) or build_index(self))
+
+        for i in range(100):
+            assert f"missing_{i}" not in routines.by_name
+            assert routines.by_name.get(f"missing_{i}") is None
+
+        assert len(built) == 1
+
+    @pytest.mark.parametrize("copy_func", [copy.copy, copy.deepcopy, lambda obj: pickle.loads(pickle.dumps(obj))])
+    def test_copied_list_has_independent_index(self, routines, copy_func):
+        _ = routines.by_name["a"]
+        copied = copy_func(routines)
+        copied.append(RoutineV1(name="d"))
+
+        assert isinstance(copied, NamedList)
+        assert copied.by_name["d"] is copied[-1]
+        assert "d" not in routines.by_name
@@ -0,0 +1,76 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import pytest
+
+from qref.evaluation import evaluate_resources, parameter_grid
+
+np = pytest.importorskip("numpy")
+
+
+@pytest.fixture
+def routine():
+    return {
+        "name": "root",
+        "resources": [{"name": "T_gates", "type": "additive", "value": "4*L - 4"}],
+        "children": [
+            {
+                "name": "usp",
+                "local_variables": {"R": "ceiling(log_2(L))", "S": "2*R"},
+                "resources": [
+                    {"name": "T_gates", "type": "additive", "value": "8*L/multiplicity(2,L)"},
+                    {"name": "qubits", "type": "qubits", "value": "S + 1"},
+                    {"name": "rotations", "type": "additive", "value": 2},
+                    {"name": "notes", "type": "other", "value": "O(L)"},
+                    {"name": "unknown", "type": "additive", "value": None},
+                ],
+            }
+        ],
+    }
+
+
+def test_parameter_grid_contains_all_combinations_of_values():
+    grid = parameter_grid(L=[4, 8], mu=[1, 2, 3])
+
+    assert sorted(zip(grid["L"], grid["mu"])) == [(L, mu) for L in (4, 8) for mu in (1, 2, 3)]
+
+
+def test_resources_of_all_routines_are_evaluated_over_whole_grid(routine):
+    result = evaluate_resources(routine, parameter_grid(L=[4, 6, 12], mu=[1, 2]))
+
+    assert list(result) == ["root", "root.usp"]
+    assert list(result["root.usp"]) == ["T_gates", "qubits", "rotations"]
+    np.testing.assert_allclose(result["root"]["T_gates"], [12, 12, 20, 20, 44, 44])
+    np.testing.assert_allclose(result["root.usp"]["T_gates"], [16, 16, 48, 48, 48, 48])
+    np.testing.assert_allclose(result["root.usp"]["qubits"], [5, 5, 7, 7, 9, 9])
+    np.testing.assert_allclose(result["root.usp"]["rotations"], [2] * 6)
+
+
+def test_parameters_qualified_with_paths_take_precedence_in_their_routines(routine):
+    result = evaluate_resources(routine, {"L": np.array([4.0, 8.0]), "root.usp.R": 10})
+
+    np.testing.assert_allclose(result["root.usp"]["qubits"], [21, 21])
+    np.testing.assert_allclose(result["root"]["T_gates"], [12, 28])
+
+
+def test_resources_referring_to_unknown_symbols_cannot_be_evaluated(routine):
+    with pytest.raises(ValueError, match="T_gates of root"):
+        evaluate_resources(routine, {"M": [1.0]})
+
+
+def test_resources_which_cannot_be_evaluated_are_omitted_if_not_strict(routine):
+    routine["children"][0]["resources"][0]["value"] = "O(L)"
+
+    result = evaluate_resources(routine, {"L": [4.0]}, strict=False)
+
+    assert list(result["root.usp"]) == ["qubits", "rotations"]
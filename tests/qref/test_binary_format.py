@@ -0,0 +1,99 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import math
+
+import pytest
+
+from qref import SchemaV1
+
+
+def assert_round_trips(program):
+    loaded = SchemaV1.from_bytes(program.to_bytes())
+
+    assert loaded == program
+    assert loaded.model_dump() == program.model_dump()
+    assert loaded.model_dump(exclude_unset=True) == program.model_dump(exclude_unset=True)
+
+
+def test_valid_program_round_trips_through_binary_format(valid_program):
+    assert_round_trips(SchemaV1.model_validate(valid_program))
+
+
+def test_values_of_all_types_round_trip_through_binary_format():
+    program = SchemaV1.model_validate(
+        {
+            "version": "v1",
+            "program": {
+                "name": "root",
+                "type": "ünïcode",
+                "ports": [
+                    {"name": "in_0", "direction": "input", "size": 2**70},
+                    {"name": "in_1", "direction": "input", "size": -(2**63)},
+                    {"name": "out_0", "direction": "output", "size": -0.0},
+                    {"name": "out_1", "direction": "output", "size": None},
+                    {"name": "through_0", "direction": "through", "size": "N"},
+                ],
+                "resources": [
+                    {"name": "a", "type": "additive", "value": 0.0},
+                    {"name": "b", "type": "multiplicative", "value": 1e-300},
+                    {"name": "c", "type": "qubits", "value": 0},
+                    {"name": "d", "type": "other", "value": "ünïcode"},
+                ],
+                "input_params": ["N", "M"],
+                "local_variables": {"K": "N + M"},
+                "meta": {"nested": {"list": [1, 2.5, None, "λ"]}},
+            },
+        }
+    )
+
+    assert_round_trips(program)
+    assert math.copysign(1, SchemaV1.from_bytes(program.to_bytes()).program.ports.by_name["out_0"].size) == -1
+
+
+@pytest.mark.parametrize(
+    "sequence",
+    [
+        {"type": "constant"},
+        {"type": "constant", "multiplier": "2*N"},
+        {"type": "arithmetic", "difference": 3},
+        {"type": "arithmetic", "initial_term": 1.5, "difference": "d"},
+        {"type": "geometric", "ratio": 2},
+        {"type": "closed_form", "sum": "N*(N+1)/2", "num_terms_symbol": "N"},
+        {"type": "closed_form", "sum": "2*N", "prod": "2**N", "num_terms_symbol": "N"},
+        {"type": "custom", "term_expression": "i**2"},
+        {"type": "custom", "term_expression": "j**2", "iterator_symbol": "j"},
+    ],
+)
+def test_repetitions_round_trip_through_binary_format(sequence):
+    program = SchemaV1.model_validate(
+        {
+            "version": "v1",
+            "program": {
+                "name": "root",
+                "children": [{"name": "child", "repetition": {"count": "N", "sequence": sequence}}],
+                "linked_params": [{"source": "N", "targets": ["child.N", "child.M"]}],
+            },
+        }
+    )
+
+    assert_round_trips(program)
+
+
+@pytest.mark.parametrize(
+    "data",
+    [b"", b"JSON" + bytes(100), SchemaV1.model_validate({"version": "v1", "program": {"name": "a"}}).to_bytes()[:-1]],
+)
+def test_loading_invalid_data_raises_value_error(data):
+    with pytest.raises(ValueError):
+        SchemaV1.from_bytes(data)
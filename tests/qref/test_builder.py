@@ -0,0 +1,159 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import pydantic
+import pytest
+
+from qref import SchemaV1, verify_topology
+from qref.builder import ProgramBuilder
+
+
+def _make_builder():
+    builder = ProgramBuilder("root", type="algorithm")
+    builder.add_port(builder.root, "out_0", "output", "N")
+    builder.add_port(builder.root, "in_0", "input", "N")
+    builder.update_routine(builder.root, input_params=["N"], linked_params=[{"source": "N", "targets": ["b.N"]}])
+    b = builder.add_routine(builder.root, "b")
+    a = builder.add_routine(builder.root, "a")
+    builder.add_connection(builder.root, "in_0", "b.in_0")
+    builder.add_connection(builder.root, "b.out_0", "a.in_0")
+    builder.add_connection(builder.root, "a.out_0", "out_0")
+    for child in (a, b):
+        builder.add_port(child, "out_0", "output", "N")
+        builder.add_port(child, "in_0", "input", "N")
+        builder.add_resource(child, "T_gates", "additive", "2*N")
+    builder.update_routine(
+        b, input_params=["N"], meta={"note": "leaf"}, repetition={"count": 2, "sequence": {"type": "constant"}}
+    )
+    return builder
+
+
+EXPECTED = {
+    "version": "v1",
+    "program": {
+        "name": "root",
+        "type": "algorithm",
+        "children": [
+            {
+                "name": "b",
+                "ports": [
+                    {"name": "out_0", "direction": "output", "size": "N"},
+                    {"name": "in_0", "direction": "input", "size": "N"},
+                ],
+                "resources": [{"name": "T_gates", "type": "additive", "value": "2*N"}],
+                "input_params": ["N"],
+                "repetition": {"count": 2, "sequence": {"type": "constant"}},
+                "meta": {"note": "leaf"},
+            },
+            {
+                "name": "a",
+                "ports": [
+                    {"name": "out_0", "direction": "output", "size": "N"},
+                    {"name": "in_0", "direction": "input", "size": "N"},
+                ],
+                "resources": [{"name": "T_gates", "type": "additive", "value": "2*N"}],
+            },
+        ],
+        "ports": [
+            {"name": "out_0", "direction": "output", "size": "N"},
+            {"name": "in_0", "direction": "input", "size": "N"},
+        ],
+        "connections": ["in_0 -> b.in_0", "b.out_0 -> a.in_0", "a.out_0 -> out_0"],
+        "input_params": ["N"],
+        "linked_params": [{"source": "N", "targets": ["b.N"]}],
+    },
+}
+
+
+def test_built_program_is_equal_to_validated_one():
+    program = _make_builder().build()
+
+    assert program == SchemaV1.model_validate(EXPECTED)
+    assert program.model_dump(exclude_unset=True) == SchemaV1.model_validate(EXPECTED).model_dump(exclude_unset=True)
+    assert verify_topology(program)
+
+
+def test_building_again_gives_independent_program():
+    builder = _make_builder()
+    first = builder.build()
+    second = builder.build()
+
+    assert first == second
+    assert first.program is not second.program
+    assert first.program.ports[0] is not second.program.ports[0]
+    assert first.program.linked_params[0] is not second.program.linked_params[0]
+
+
+@pytest.mark.parametrize(
+    "add",
+    [
+        lambda builder: builder.add_routine(builder.root, "1st"),
+        lambda builder: builder.add_port(builder.root, "in_0", "sideways", 1),
+        lambda builder: builder.add_port(builder.root, "in 0", "input", 1),
+        lambda builder: builder.add_resource(builder.root, "T_gates", "additive", [1]),
+        lambda builder: builder.add_connection(builder.root, "in_0", "a..in_0"),
+        lambda builder: builder.update_routine(builder.root, input_params=["N M"]),
+    ],
+)
+def test_invalid_items_are_rejected_as_in_validation(add):
+    with pytest.raises(pydantic.ValidationError):
+        add(ProgramBuilder("root"))
+
+
+def test_values_of_other_types_are_coerced_as_in_validation():
+    builder = ProgramBuilder("root")
+    builder.add_port(builder.root, "in_0", "input", True)
+    builder.add_resource(builder.root, "T_gates", "additive", False)
+
+    expected = SchemaV1.model_validate(
+        {
+            "version": "v1",
+            "program": {
+                "name": "root",
+                "ports": [{"name": "in_0", "direction": "input", "size": True}],
+                "resources": [{"name": "T_gates", "type": "additive", "value": False}],
+            },
+        }
+    )
+    program = builder.build().program
+
+    assert program == expected.program
+    assert type(program.ports[0].size) is type(program.resources[0].value) is int
+
+
+def test_items_cannot_be_added_to_nonexistent_routines():
+    builder = ProgramBuilder("root")
+
+    with pytest.raises(ValueError, match="no routine with handle 1"):
+        builder.add_port(1, "in_0", "input", 1)
+
+
+def test_connections_to_nonexistent_ports_are_rejected_when_building():
+    builder = ProgramBuilder("root")
+    child = builder.add_routine(builder.root, "a")
+    builder.add_routine(child, "b")
+    builder.add_connection(child, "b.in_0", "b.out_0")
+
+    with pytest.raises(ValueError, match=r"connection of root\.a .*\['b\.in_0', 'b\.out_0'\]"):
+        builder.build()
+
+
+def test_updating_routines_with_empty_values_resets_them():
+    builder = ProgramBuilder("root")
+    builder.update_routine(builder.root, meta={"note": 1}, input_params=["N"])
+    builder.update_routine(builder.root, meta={})
+
+    assert builder.build() == SchemaV1(version="v1", program={"name": "root", "input_params": ["N"]})
+
+    with pytest.raises(ValueError, match="ports cannot be set"):
+        builder.update_routine(builder.root, ports=[])
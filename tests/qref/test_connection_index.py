@@ -0,0 +1,104 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import pytest
+
+from qref import SchemaV1
+from qref._subtree_cache import routine_cache
+from qref.connections import _CONNECTION_INDEX_CACHE_KEY, connection_index
+from qref.schema_v1 import ConnectionV1
+
+
+@pytest.fixture
+def data():
+    return {
+        "version": "v1",
+        "program": {
+            "name": "root",
+            "ports": [
+                {"name": "in_0", "direction": "input", "size": 1},
+                {"name": "out_0", "direction": "output", "size": 1},
+                {"name": "out_1", "direction": "output", "size": 1},
+            ],
+            "children": [
+                {
+                    "name": "a",
+                    "ports": [
+                        {"name": "in_0", "direction": "input", "size": 1},
+                        {"name": "out_0", "direction": "output", "size": 1},
+                    ],
+                },
+                {
+                    "name": "b",
+                    "ports": [
+                        {"name": "in_0", "direction": "input", "size": 1},
+                        {"name": "out_0", "direction": "output", "size": 1},
+                    ],
+                },
+            ],
+            "connections": ["in_0 -> a.in_0", "a.out_0 -> b.in_0", "a.out_0 -> out_1", "b.out_0 -> out_0"],
+        },
+    }
+
+
+def test_connections_are_indexed_by_sources_and_targets(data):
+    index = connection_index(SchemaV1.model_validate(data).program)
+
+    assert index.targets("a.out_0") == ["b.in_0", "out_1"]
+    assert index.sources("b.in_0") == ["a.out_0"]
+    assert index.targets("b.in_0") == []
+    assert index.is_connected("out_0")
+    assert not index.is_connected("a.foo")
+
+
+def test_connections_are_indexed_by_children(data):
+    index = connection_index(SchemaV1.model_validate(data).program)
+
+    assert [(connection.source, connection.target) for connection in index.child_connections("a")] == [
+        ("a.out_0", "b.in_0"),
+        ("a.out_0", "out_1"),
+        ("in_0", "a.in_0"),
+    ]
+    assert [(connection.source, connection.target) for connection in index.child_connections("b")] == [
+        ("a.out_0", "b.in_0"),
+        ("b.out_0", "out_0"),
+    ]
+    assert index.child_connections("c") == []
+
+
+@pytest.mark.parametrize("load", [SchemaV1.model_validate, SchemaV1.load_trusted])
+def test_index_is_built_once_per_routine(data, load):
+    routine = load(data).program
+
+    assert connection_index(routine) is connection_index(routine)
+
+
+def test_index_is_not_built_by_validation(data):
+    routine = SchemaV1.model_validate(data).program
+
+    routine.connections = ["in_0 -> a.in_0", "a.out_0 -> b.in_0", "b.out_0 -> out_0"]
+
+    assert _CONNECTION_INDEX_CACHE_KEY not in routine_cache(routine)
+    assert connection_index(routine).targets("a.out_0") == ["b.in_0"]
+
+
+def test_index_is_rebuilt_after_connections_are_modified(data):
+    routine = SchemaV1.model_validate(data).program
+    assert connection_index(routine).targets("a.out_0") == ["b.in_0", "out_1"]
+
+    routine.connections = ["in_0 -> a.in_0", "a.out_0 -> out_1", "b.out_0 -> out_0"]
+    assert connection_index(routine).targets("a.out_0") == ["out_1"]
+
+    routine.connections.append(ConnectionV1(source="a.out_0", target="b.in_0"))
+    routine.mark_modified()
+    assert connection_index(routine).targets("a.out_0") == ["out_1", "b.in_0"]
@@ -0,0 +1,149 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import sys
+
+import pytest
+
+from qref import SchemaV1
+from qref.definitions import (
+    dump_with_definitions,
+    expand_definitions,
+    load_with_definitions,
+)
+
+
+def _leaf(name):
+    return {
+        "name": name,
+        "ports": [
+            {"name": "in_0", "direction": "input", "size": "N"},
+            {"name": "out_0", "direction": "output", "size": "N"},
+        ],
+        "resources": [{"name": "T_gates", "type": "additive", "value": 1}],
+    }
+
+
+def _block(name):
+    return {
+        "name": name,
+        "ports": [
+            {"name": "in_0", "direction": "input", "size": "N"},
+            {"name": "out_0", "direction": "output", "size": "N"},
+        ],
+        "children": [_leaf("x"), _leaf("y")],
+        "connections": ["in_0 -> x.in_0", "x.out_0 -> y.in_0", "y.out_0 -> out_0"],
+    }
+
+
+@pytest.fixture
+def program():
+    return SchemaV1.model_validate(
+        {"version": "v1", "program": {"name": "root", "children": [_block("a"), _block("b"), _leaf("c")]}}
+    )
+
+
+def test_repeated_subroutines_are_dumped_as_definitions(program):
+    data = dump_with_definitions(program)
+
+    assert data["program"]["children"] == [
+        {"name": "a", "ref": "a"},
+        {"name": "b", "ref": "a"},
+        {"name": "c", "ref": "x"},
+    ]
+    assert data["definitions"]["a"]["children"] == [{"name": "x", "ref": "x"}, {"name": "y", "ref": "x"}]
+    assert "name" not in data["definitions"]["x"]
+
+
+def test_programs_without_repeated_subroutines_are_dumped_without_definitions():
+    data = {"version": "v1", "program": {"name": "root", "children": [_leaf("x"), {"name": "y"}]}}
+
+    assert dump_with_definitions(SchemaV1.model_validate(data)) == data
+
+
+def test_dumped_program_can_be_loaded_back(valid_program):
+    program = SchemaV1.model_validate(valid_program)
+
+    assert load_with_definitions(dump_with_definitions(program)) == program
+
+
+def test_dumped_program_can_be_expanded_to_ordinary_form(program):
+    assert SchemaV1.model_validate(expand_definitions(dump_with_definitions(program))) == program
+
+
+def test_routines_referring_to_the_same_definition_share_contents(program):
+    loaded = load_with_definitions(dump_with_definitions(program)).program
+    a, b, c = loaded.children
+
+    assert a.children is b.children
+    assert a.children[0].ports is c.ports
+    # Descendants of routines referring to the same definition are shared as well.
+    assert a.children[0] is b.children[0]
+
+
+def test_assigning_to_routine_referring_to_definition_does_not_affect_other_ones(program):
+    loaded = load_with_definitions(dump_with_definitions(program)).program
+    a, b, _ = loaded.children
+
+    a.type = "modified"
+
+    assert b.type is None
+    assert a.fingerprint() != b.fingerprint()
+
+
+def test_long_chains_of_definitions_can_be_loaded_and_expanded():
+    depth = 3 * sys.getrecursionlimit()
+    definitions = {f"level_{i}": {"children": [{"name": "child", "ref": f"level_{i + 1}"}]} for i in range(depth)}
+    definitions[f"level_{depth}"] = {}
+    data = {"version": "v1", "definitions": definitions, "program": {"name": "root", "children": []}}
+    data["program"]["children"].append({"name": "child", "ref": "level_0"})
+
+    routine = load_with_definitions(data).program
+    expanded = expand_definitions(data)["program"]
+    for _ in range(depth + 1):
+        routine = routine.children[0]
+        expanded = expanded["children"][0]
+
+    assert routine.name == expanded["name"] == "child"
+    assert not routine.children
+    assert "children" not in expanded
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        {"version": "v1", "program": {"name": "root", "children": [{"name": "a", "ref": "missing"}]}},
+        {
+            "version": "v1",
+            "definitions": {"loop": {"children": [{"name": "a", "ref": "loop"}]}},
+            "program": {"name": "root", "children": [{"name": "a", "ref": "loop"}]},
+        },
+    ],
+)
+def test_invalid_references_are_reported(data):
+    with pytest.raises(ValueError):
+        load_with_definitions(data)
+
+    with pytest.raises(ValueError):
+        expand_definitions(data)
+
+
+def test_names_of_routines_referring_to_definitions_are_validated():
+    data = {
+        "version": "v1",
+        "definitions": {"leaf": {}},
+        "program": {"name": "root", "children": [{"name": "not a name", "ref": "leaf"}]},
+    }
+
+    with pytest.raises(ValueError):
+        load_with_definitions(data)
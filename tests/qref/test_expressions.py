@@ -0,0 +1,124 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import pytest
+
+from qref.expressions import (
+    EXPRESSION_CACHE_SIZE,
+    BinaryOp,
+    Call,
+    Number,
+    Symbol,
+    UnaryOp,
+    clear_expression_cache,
+    compile_expression,
+    expression_cache_info,
+    free_symbols,
+    parse,
+)
+
+np = pytest.importorskip("numpy")
+
+
+@pytest.mark.parametrize(
+    "expression, expected",
+    [
+        ("N", Symbol("N")),
+        ("a.N", Symbol("a.N")),
+        ("2.5", Number(2.5)),
+        ("1 + 2*N", BinaryOp("+", Number(1), BinaryOp("*", Number(2), Symbol("N")))),
+        ("2^N^2", BinaryOp("**", Number(2), BinaryOp("**", Symbol("N"), Number(2)))),
+        ("-N**2", UnaryOp("-", BinaryOp("**", Symbol("N"), Number(2)))),
+        ("2L", BinaryOp("*", Number(2), Symbol("L"))),
+        ("ceiling(log_2(L))", Call("ceil", (Call("log2", (Symbol("L"),)),))),
+    ],
+)
+def test_expressions_are_parsed_into_syntax_trees(expression, expected):
+    assert parse(expression) == expected
+
+
+@pytest.mark.parametrize(
+    "expression", ["", "1 +", "(N", "N)", "O(N)", "max()", "sum(i, 1, 0, N)", "N $ 2", "ceil(N, 2)"]
+)
+def test_malformed_expressions_cannot_be_parsed(expression):
+    with pytest.raises(ValueError):
+        parse(expression)
+
+
+def test_iterators_of_sums_are_not_free_symbols():
+    assert free_symbols(parse("sum(i*a, i, start, N) + M")) == {"a", "start", "N", "M"}
+
+
+@pytest.mark.parametrize(
+    "expression, values, expected",
+    [
+        ("8*L/multiplicity(2,L)", {"L": [2, 4, 6, 12]}, [16, 16, 48, 48]),
+        ("ceiling(log_2(L))", {"L": [4, 5, 8]}, [2, 3, 3]),
+        ("max(N, 3, M) - min(N, M)", {"N": [1, 5], "M": [2, 4]}, [2, 1]),
+        ("sum(2^i, i, 0, N - 1)", {"N": [1, 2, 3, 4]}, [1, 3, 7, 15]),
+        ("prod(i, i, 1, N)", {"N": [1, 3, 5]}, [1, 6, 120]),
+        ("-2^2 + 7/2", {}, -0.5),
+    ],
+)
+def test_compiled_expressions_are_evaluated_over_arrays(expression, values, expected):
+    result = compile_expression(expression)({name: np.asarray(value, dtype=float) for name, value in values.items()})
+
+    np.testing.assert_allclose(result, expected)
+
+
+@pytest.mark.parametrize(
+    "expression", ["sum((-1)^i * 10^(400 * i), i, 1, N)", "prod(10^(400 * (2 - i)) * (2 - i), i, 1, N)"]
+)
+def test_infinite_terms_followed_by_terms_making_result_undefined_give_nan(expression, monkeypatch):
+    # Every term is evaluated in a separate chunk, so that infinite partial results are seen between chunks.
+    monkeypatch.setattr("qref.expressions._MAX_CHUNK_ELEMENTS", 1)
+
+    with np.errstate(over="ignore", invalid="ignore"):
+        result = compile_expression(expression)({"N": np.asarray([1.0, 2.0])})
+
+    assert np.isinf(result[0])
+    assert np.isnan(result[1])
+
+
+def test_evaluating_expression_without_values_of_all_symbols_fails():
+    with pytest.raises(ValueError, match="M"):
+        compile_expression("N + M")({"N": 1.0})
+
+
+class TestExpressionCache:
+    @pytest.fixture(autouse=True)
+    def clear_cache(self):
+        clear_expression_cache()
+        yield
+        clear_expression_cache()
+
+    def test_each_distinct_expression_is_compiled_once(self):
+        first = compile_expression("2*N + 1")
+
+        assert compile_expression("2*N + 1") is first
+        assert compile_expression("2*N + 2") is not first
+        assert expression_cache_info() == (1, 2, EXPRESSION_CACHE_SIZE, 2)
+
+    def test_numbers_of_different_types_are_cached_separately(self):
+        assert compile_expression(1).tree == Number(1)
+        assert compile_expression(1.0).tree == Number(1.0)
+        assert isinstance(compile_expression(1.0).tree.value, float)
+
+    def test_syntax_trees_are_shared_between_expressions_and_compiled_forms(self):
+        assert compile_expression("ceiling(log_2(L))").tree is parse("ceiling(log_2(L))")
+
+    def test_clearing_cache_resets_its_statistics(self):
+        compile_expression("N")
+        clear_expression_cache()
+
+        assert expression_cache_info() == (0, 0, EXPRESSION_CACHE_SIZE, 0)
@@ -0,0 +1,166 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import copy
+import pickle
+import sys
+
+import pytest
+from pydantic import ValidationError
+
+from qref import SchemaV1, _subtree_cache
+from qref.fingerprinting import find_identical_subroutines
+from qref.schema_v1 import PortV1, ResourceV1, RoutineV1
+
+
+def _leaf(name, t_gates=1):
+    return {
+        "name": name,
+        "ports": [{"name": "in_0", "direction": "input", "size": "N"}],
+        "resources": [{"name": "T_gates", "type": "additive", "value": t_gates}],
+    }
+
+
+@pytest.fixture
+def program():
+    return SchemaV1.model_validate(
+        {
+            "version": "v1",
+            "program": {
+                "name": "root",
+                "children": [
+                    {"name": "a", "children": [_leaf("x"), _leaf("y", t_gates=2)]},
+                    {"name": "b", "children": [_leaf("x"), _leaf("y", t_gates=2)]},
+                    _leaf("c"),
+                ],
+            },
+        }
+    ).program
+
+
+def test_fingerprints_of_identical_routines_are_equal_regardless_of_their_names(program):
+    a, b, c = program.children
+
+    assert a.fingerprint() == b.fingerprint()
+    assert a.children.by_name["x"].fingerprint() == c.fingerprint()
+    assert a.children.by_name["x"].fingerprint() != a.children.by_name["y"].fingerprint()
+
+
+def test_fingerprints_depend_on_names_of_children(program):
+    program.children.by_name["b"].children.by_name["x"].name = "z"
+
+    assert program.children.by_name["a"].fingerprint() != program.children.by_name["b"].fingerprint()
+
+
+def test_fingerprints_are_the_same_for_equal_programs(valid_program):
+    assert SchemaV1.model_validate(valid_program).program.fingerprint() == (
+        SchemaV1.load_trusted(valid_program).program.fingerprint()
+    )
+
+
+def test_fingerprints_of_ancestors_change_after_assignment_to_descendant(program):
+    root_fingerprint = program.fingerprint()
+    a_fingerprint = program.children.by_name["a"].fingerprint()
+
+    program.children.by_name["a"].children.by_name["y"].resources = [
+        ResourceV1(name="T_gates", type="additive", value=1)
+    ]
+
+    assert program.fingerprint() != root_fingerprint
+    assert program.children.by_name["a"].fingerprint() != a_fingerprint
+    assert program.children.by_name["a"].children.by_name["y"].fingerprint() == program.children[2].fingerprint()
+
+
+def test_fingerprints_change_after_in_place_modification_marked_as_such(program):
+    root_fingerprint = program.fingerprint()
+    leaf = program.children.by_name["c"]
+
+    leaf.ports.append(PortV1(name="out_0", direction="output", size="N"))
+    leaf.mark_modified()
+
+    assert program.fingerprint() != root_fingerprint
+
+
+def test_fingerprints_change_after_rejected_assignment(program):
+    root_fingerprint = program.fingerprint()
+
+    # Even though the assignment is rejected, the routine is left with the new value.
+    with pytest.raises(ValidationError):
+        program.children.by_name["a"].connections = ["in_0 -> z.in_0"]
+
+    assert program.fingerprint() != root_fingerprint
+
+
+@pytest.fixture
+def traversed_routines(monkeypatch):
+    traversed = []
+
+    def link_children(routine):
+        traversed.append(routine.name)
+        original(routine)
+
+    original = _subtree_cache.link_children
+    monkeypatch.setattr(_subtree_cache, "link_children", link_children)
+    return traversed
+
+
+def test_only_ancestors_of_modified_routine_are_traversed_again(program, traversed_routines):
+    program.fingerprint()
+    traversed_routines.clear()
+
+    program.children.by_name["b"].children.by_name["y"].resources = []
+    program.fingerprint()
+
+    assert traversed_routines == ["root", "b", "y"]
+
+
+def test_modifications_of_other_programs_do_not_invalidate_fingerprints(program, traversed_routines):
+    other = copy.deepcopy(program)
+    program.fingerprint()
+    other.fingerprint()
+    traversed_routines.clear()
+
+    other.children.by_name["c"].resources = []
+    program.fingerprint()
+
+    assert traversed_routines == []
+
+
+@pytest.mark.parametrize("copy_func", [copy.copy, copy.deepcopy, lambda obj: pickle.loads(pickle.dumps(obj))])
+def test_fingerprints_of_copies_change_after_modification_of_their_descendants(program, copy_func):
+    root_fingerprint = program.fingerprint()
+    copied = copy_func(program)
+    assert copied.fingerprint() == root_fingerprint
+
+    copied.children = [copy.deepcopy(child) for child in copied.children]
+    copied.fingerprint()
+    copied.children.by_name["a"].children.by_name["x"].resources = []
+
+    assert copied.fingerprint() != root_fingerprint
+    assert program.fingerprint() == root_fingerprint
+
+
+def test_identical_subroutines_are_found(program):
+    assert find_identical_subroutines(program) == [
+        ["root.a", "root.b"],
+        ["root.a.x", "root.b.x", "root.c"],
+        ["root.a.y", "root.b.y"],
+    ]
+
+
+def test_fingerprint_of_deep_routine_can_be_computed():
+    routine = RoutineV1(name="leaf")
+    for i in range(sys.getrecursionlimit() + 100):
+        routine = RoutineV1(name=f"level_{i}", children=[routine])
+
+    assert len(routine.fingerprint()) == 32
@@ -0,0 +1,127 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import pytest
+
+from qref.flattening import flatten
+
+
+def _routine(name, ports, children=(), connections=()):
+    return {
+        "name": name,
+        "ports": [{"name": port, "direction": direction, "size": 1} for port, direction in ports.items()],
+        "children": list(children),
+        "connections": list(connections),
+    }
+
+
+def _leaf(name):
+    return _routine(name, {"in_0": "input", "out_0": "output"})
+
+
+@pytest.fixture
+def program():
+    # Routine a wraps leaves b and c, connected in a chain, while d is a leaf following a.
+    # Additionally, the program has a passthrough from in_1 to out_1.
+    a = _routine(
+        "a",
+        {"in_0": "input", "out_0": "output"},
+        children=[_leaf("b"), _leaf("c")],
+        connections=["in_0 -> b.in_0", "b.out_0 -> c.in_0", "c.out_0 -> out_0"],
+    )
+    return _routine(
+        "root",
+        {"in_0": "input", "in_1": "input", "out_0": "output", "out_1": "output"},
+        children=[a, _leaf("d")],
+        connections=["in_0 -> a.in_0", "a.out_0 -> d.in_0", "d.out_0 -> out_0", "in_1 -> out_1"],
+    )
+
+
+def test_netlist_contains_program_and_its_leaves_in_pre_order(program):
+    assert flatten(program).routines == ["root", "root.a.b", "root.a.c", "root.d"]
+
+
+def test_connections_are_resolved_through_intermediate_routines(program):
+    assert sorted(flatten(program).edges()) == [
+        ("root.a.b.out_0", "root.a.c.in_0"),
+        ("root.a.c.out_0", "root.d.in_0"),
+        ("root.d.out_0", "root.out_0"),
+        ("root.in_0", "root.a.b.in_0"),
+        ("root.in_1", "root.out_1"),
+    ]
+
+
+def test_ports_of_each_routine_are_stored_contiguously(program):
+    netlist = flatten(program)
+
+    assert list(netlist.port_offsets) == [0, 4, 6, 8, 10]
+    assert [netlist.port(index) for index in range(netlist.port_offsets[1], netlist.port_offsets[2])] == [
+        "root.a.b.in_0",
+        "root.a.b.out_0",
+    ]
+    assert len(netlist) == len(netlist.sources) == len(netlist.targets) == 5
+
+
+def test_connections_fanning_out_through_intermediate_routines_are_all_resolved():
+    a = _routine(
+        "a",
+        {"in_0": "input", "out_0": "output", "out_1": "output"},
+        connections=["in_0 -> out_0", "in_0 -> out_1"],
+        children=[_leaf("x")],
+    )
+    program = _routine(
+        "root",
+        {"in_0": "input", "out_0": "output", "out_1": "output"},
+        children=[a],
+        connections=["in_0 -> a.in_0", "a.out_0 -> out_0", "a.out_1 -> out_1"],
+    )
+
+    assert sorted(flatten(program).edges()) == [("root.in_0", "root.out_0"), ("root.in_0", "root.out_1")]
+
+
+def test_connections_from_the_same_port_follow_the_order_of_connections_in_the_program():
+    a = _routine(
+        "a",
+        {"in_0": "input", "out_0": "output"},
+        children=[_leaf("x"), _leaf("y")],
+        connections=["in_0 -> y.in_0", "in_0 -> x.in_0"],
+    )
+    program = _routine(
+        "root", {"in_0": "input"}, children=[a, _leaf("z")], connections=["in_0 -> z.in_0", "in_0 -> a.in_0"]
+    )
+
+    assert list(flatten(program).edges()) == [
+        ("root.in_0", "root.z.in_0"),
+        ("root.in_0", "root.a.y.in_0"),
+        ("root.in_0", "root.a.x.in_0"),
+    ]
+
+
+def test_connections_leading_nowhere_and_inside_leaves_are_dropped():
+    a = _routine("a", {"in_0": "input", "out_0": "output"}, children=[_leaf("x")])
+    leaf = _routine("b", {"in_0": "input", "out_0": "output"}, connections=["in_0 -> out_0"])
+    program = _routine(
+        "root",
+        {"in_0": "input", "in_1": "input"},
+        children=[a, leaf],
+        connections=["in_0 -> a.in_0", "in_1 -> b.in_0"],
+    )
+
+    assert list(flatten(program).edges()) == [("root.in_1", "root.b.in_0")]
+
+
+def test_program_without_children_is_its_own_netlist():
+    netlist = flatten(_leaf("root"))
+
+    assert netlist.routines == ["root"]
+    assert len(netlist) == 0
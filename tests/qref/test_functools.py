@@ -13,7 +13,19 @@
 # limitations under the License.
 
 
-from qref.functools import accepts_all_qref_types, ensure_routine
+import copy
+
+import pytest
+from pydantic import ValidationError
+
+from qref.functools import (
+    CacheInfo,
+    accepts_all_qref_types,
+    conversion_cache_info,
+    disable_conversion_cache,
+    enable_conversion_cache,
+    ensure_routine,
+)
 from qref.schema_v1 import RoutineV1, SchemaV1
 
 
@@ -43,3 +55,78 @@ def test_callables_can_be_augmented_to_accept_all_qref_types(valid_program):
     assert all(isinstance(output, RoutineV1) for output in outputs)
 
     assert outputs[0] == outputs[1] == outputs[2] == outputs[3]
+
+
+class TestConversionCache:
+    @pytest.fixture(autouse=True)
+    def cache(self):
+        enable_conversion_cache(maxsize=2)
+        yield
+        disable_conversion_cache()
+
+    def test_converting_the_same_data_twice_reuses_converted_routine(self, valid_program):
+        first = ensure_routine(valid_program)
+        second = ensure_routine(copy.deepcopy(valid_program))
+
+        assert first is second
+        assert conversion_cache_info() == CacheInfo(hits=1, misses=1, maxsize=2, currsize=1)
+
+    def test_modified_data_is_converted_again(self):
+        data = {"name": "root", "ports": [{"name": "in_0", "direction": "input", "size": 1}]}
+        first = ensure_routine(data)
+
+        data["ports"][0]["size"] = 2
+        second = ensure_routine(data)
+
+        assert second.ports[0].size == 2
+        assert first is not second
+        assert conversion_cache_info().misses == 2
+
+    @pytest.mark.parametrize(
+        "first_meta, second_meta",
+        [
+            ({"1": "a"}, {1: "a"}),
+            ({"shape": [1, 2]}, {"shape": (1, 2)}),
+            ({"value": 1}, {"value": "1"}),
+            ({"value": 1}, {"value": True}),
+        ],
+    )
+    def test_data_differing_only_in_types_is_converted_separately(self, first_meta, second_meta):
+        ensure_routine({"name": "root", "meta": first_meta})
+
+        if isinstance(next(iter(second_meta)), str):
+            assert repr(ensure_routine({"name": "root", "meta": second_meta}).meta) == repr(second_meta)
+        else:
+            with pytest.raises(ValidationError):
+                ensure_routine({"name": "root", "meta": second_meta})
+        assert conversion_cache_info().misses == 2
+
+    def test_least_recently_used_routines_are_evicted(self):
+        a, b, c = ({"name": name} for name in "abc")
+        routine_a = ensure_routine(a)
+        ensure_routine(b)
+        ensure_routine(a)
+        ensure_routine(c)
+
+        assert ensure_routine(a) is routine_a
+        assert conversion_cache_info() == CacheInfo(hits=2, misses=3, maxsize=2, currsize=2)
+
+        ensure_routine(b)
+        assert conversion_cache_info().misses == 4
+
+    def test_decorated_functions_use_the_cache(self, valid_program):
+        @accepts_all_qref_types
+        def identity(r: RoutineV1) -> RoutineV1:
+            return r
+
+        assert identity(valid_program) is identity(valid_program)
+
+    def test_cache_can_be_disabled(self):
+        disable_conversion_cache()
+
+        assert ensure_routine({"name": "a"}) is not ensure_routine({"name": "a"})
+        assert conversion_cache_info() is None
+
+    def test_cache_size_has_to_be_positive(self):
+        with pytest.raises(ValueError):
+            enable_conversion_cache(maxsize=0)
@@ -0,0 +1,75 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import pkgutil
+import subprocess
+import sys
+import typing
+
+import pytest
+
+import qref
+from qref import schema_v1, verification
+
+
+def _imported_modules(code):
+    result = subprocess.run(
+        [sys.executable, "-c", f"import sys\n{code}\nprint(*sys.modules, file=sys.stderr)"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return set(result.stderr.split())
+
+
+def test_importing_qref_does_not_import_pydantic():
+    assert "pydantic" not in _imported_modules("import qref")
+
+
+def test_printing_help_of_qref_render_does_not_import_rendering_machinery():
+    modules = _imported_modules(
+        "from contextlib import suppress\n"
+        "from qref.experimental._cli import render_entry_point\n"
+        "sys.argv = ['qref-render', '--help']\n"
+        "with suppress(SystemExit):\n"
+        "    render_entry_point()"
+    )
+
+    assert modules.isdisjoint({"pydantic", "graphviz", "yaml", "qref.experimental.rendering"})
+
+
+def test_names_exported_by_qref_are_imported_on_first_access():
+    assert qref.SchemaV1 is schema_v1.SchemaV1
+    assert qref.verify_topology is verification.verify_topology
+    assert qref.MODELS == {"v1": schema_v1.SchemaV1}
+    assert qref.SCHEMA_GENERATORS == {"v1": schema_v1.generate_schema_v1}
+
+
+def test_submodules_of_qref_are_imported_on_first_access():
+    _imported_modules(
+        "import qref\n"
+        "assert qref.schema_v1.SchemaV1 is qref.SchemaV1\n"
+        "assert qref.functools.accepts_all_qref_types\n"
+        "assert qref.verification.verify_topology is qref.verify_topology"
+    )
+    public_submodules = {module.name for module in pkgutil.iter_modules(qref.__path__) if module.name[0] != "_"}
+    assert qref._SUBMODULES == public_submodules
+
+
+def test_type_hints_of_functions_exported_by_qref_can_be_resolved():
+    assert typing.get_type_hints(qref.generate_program_schema) == {"version": str, "return": dict[str, typing.Any]}
+
+
+def test_accessing_nonexistent_attribute_of_qref_fails():
+    with pytest.raises(AttributeError, match="no attribute"):
+        qref.nonexistent
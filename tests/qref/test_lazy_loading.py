@@ -0,0 +1,105 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+
+import pytest
+
+from qref import SchemaV1, verify_topology
+from qref.lazy import load_lazy
+
+FIELDS = [
+    "name",
+    "type",
+    "ports",
+    "resources",
+    "connections",
+    "input_params",
+    "local_variables",
+    "linked_params",
+    "repetition",
+    "meta",
+]
+
+
+def assert_lazy_routine_matches(lazy_routine, routine):
+    for field in FIELDS:
+        assert getattr(lazy_routine, field) == getattr(routine, field)
+
+    assert len(lazy_routine.children) == len(routine.children)
+
+    for lazy_child, child in zip(lazy_routine.children, routine.children):
+        assert lazy_routine.children.by_name[child.name] is lazy_child
+        assert_lazy_routine_matches(lazy_child, child)
+
+
+@pytest.fixture(params=[None, 2], ids=["compact", "indented"])
+def program_path(valid_program, tmp_path, request):
+    path = tmp_path / "program.json"
+    with open(path, "w") as f:
+        json.dump(valid_program, f, indent=request.param)
+    return path
+
+
+def test_lazily_loaded_program_matches_validated_one(valid_program, program_path):
+    assert_lazy_routine_matches(load_lazy(program_path), SchemaV1.model_validate(valid_program).program)
+
+
+def test_lazily_loaded_routine_can_be_materialized(valid_program, program_path):
+    assert load_lazy(program_path).to_routine() == SchemaV1.model_validate(valid_program).program
+
+
+def test_lazily_loaded_routine_can_be_passed_to_functions_accepting_all_qref_types(program_path):
+    assert verify_topology(load_lazy(program_path))
+
+
+def test_document_can_be_loaded_lazily_from_bytes():
+    data = {
+        "version": "v1",
+        "program": {
+            "name": "root",
+            "meta": {"description": 'Brackets and quotes in strings, like "[{", are not confused with JSON syntax.'},
+            "children": [{"name": "a", "meta": {"nested": [[[[[[[[[[1]]]]]]]]]]}}, {"name": "b"}],
+        },
+    }
+
+    program = load_lazy(json.dumps(data).encode())
+
+    assert program.meta == data["program"]["meta"]
+    assert [child.name for child in program.children] == ["a", "b"]
+    assert program.children.by_name["a"].meta == {"nested": [[[[[[[[[[1]]]]]]]]]]}
+    assert "c" not in program.children.by_name
+
+
+def test_invalid_field_is_reported_only_when_accessed():
+    data = {"version": "v1", "program": {"name": "root", "ports": [{"name": "in_0", "direction": "sideways"}]}}
+
+    program = load_lazy(json.dumps(data).encode())
+
+    assert program.name == "root"
+    with pytest.raises(ValueError):
+        _ = program.ports
+
+
+@pytest.mark.parametrize(
+    "document",
+    [
+        b'{"version": "v2", "program": {"name": "root"}}',
+        b'{"version": "v1"}',
+        b'{"version": "v1", "program": {"name": "root"',
+        b'["version", "v1"]',
+    ],
+)
+def test_loading_invalid_document_raises_value_error(document):
+    with pytest.raises(ValueError):
+        load_lazy(document)
@@ -0,0 +1,118 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import pickle
+
+import pytest
+
+from qref import SchemaV1
+from qref.mapped import MappedRepetition, MappedSequence, load_mapped
+
+
+def assert_mapped_routine_matches(mapped_routine, routine):
+    assert mapped_routine.name == routine.name
+    assert mapped_routine.type == routine.type
+    assert [tuple(port) for port in mapped_routine.ports] == [
+        (port.name, port.direction, port.size) for port in routine.ports
+    ]
+    assert [tuple(resource) for resource in mapped_routine.resources] == [
+        (resource.name, resource.type, resource.value) for resource in routine.resources
+    ]
+    assert [tuple(connection) for connection in mapped_routine.connections] == [
+        (connection.source, connection.target) for connection in routine.connections
+    ]
+    assert [tuple(link) for link in mapped_routine.linked_params] == [
+        (link.source, link.targets) for link in routine.linked_params
+    ]
+    assert mapped_routine.input_params == routine.input_params
+    assert mapped_routine.local_variables == routine.local_variables
+    if routine.repetition is None:
+        assert mapped_routine.repetition is None
+    else:
+        assert isinstance(mapped_routine.repetition, MappedRepetition)
+        assert mapped_routine.repetition.count == routine.repetition.count
+        assert mapped_routine.repetition.sequence == MappedSequence(**routine.repetition.sequence.model_dump())
+    assert mapped_routine.meta == routine.meta
+
+    for port in routine.ports:
+        assert mapped_routine.ports.by_name[port.name].size == port.size
+
+    assert len(mapped_routine.children) == len(routine.children)
+    for mapped_child, child in zip(mapped_routine.children, routine.children):
+        assert mapped_routine.children.by_name[child.name].name == child.name
+        assert_mapped_routine_matches(mapped_child, child)
+
+
+def test_mapped_program_matches_the_serialized_one(valid_program, tmp_path):
+    program = SchemaV1.model_validate(valid_program)
+    path = tmp_path / "program.qref"
+    path.write_bytes(program.to_bytes())
+
+    assert_mapped_routine_matches(load_mapped(path), program.program)
+
+
+def test_program_can_be_mapped_from_bytes(valid_program):
+    program = SchemaV1.model_validate(valid_program)
+
+    assert_mapped_routine_matches(load_mapped(program.to_bytes()), program.program)
+
+
+@pytest.mark.parametrize("from_file", [True, False])
+def test_mapped_routines_can_be_pickled(valid_program, tmp_path, from_file):
+    program = SchemaV1.model_validate(valid_program)
+    path = tmp_path / "program.qref"
+    path.write_bytes(program.to_bytes())
+    mapped_program = load_mapped(path if from_file else program.to_bytes())
+
+    for routine, mapped_routine in [(program.program, mapped_program)] + [
+        (child, mapped_child) for child, mapped_child in zip(program.program.children, mapped_program.children)
+    ]:
+        assert_mapped_routine_matches(pickle.loads(pickle.dumps(mapped_routine)), routine)
+
+
+@pytest.mark.parametrize(
+    "sequence",
+    [
+        {"type": "constant", "multiplier": "2*N"},
+        {"type": "arithmetic", "difference": 3},
+        {"type": "geometric", "ratio": 2.5},
+        {"type": "closed_form", "sum": "2*N", "num_terms_symbol": "N"},
+        {"type": "custom", "term_expression": "i**2"},
+    ],
+)
+def test_repetitions_are_mapped_without_constructing_pydantic_objects(sequence):
+    program = SchemaV1.model_validate(
+        {"version": "v1", "program": {"name": "root", "repetition": {"count": "N", "sequence": sequence}}}
+    )
+
+    repetition = load_mapped(program.to_bytes()).repetition
+
+    assert type(repetition) is MappedRepetition
+    assert type(repetition.sequence) is MappedSequence
+    assert repetition.count == "N"
+    assert repetition.sequence == MappedSequence(**program.program.repetition.sequence.model_dump())
+
+
+def test_accessing_missing_objects_raises_errors():
+    mapped_program = load_mapped(SchemaV1.model_validate({"version": "v1", "program": {"name": "root"}}).to_bytes())
+
+    with pytest.raises(IndexError):
+        mapped_program.children[0]
+
+    with pytest.raises(KeyError):
+        mapped_program.ports.by_name["in_0"]
+
+
+def test_mapping_invalid_data_raises_value_error():
+    with pytest.raises(ValueError):
+        load_mapped(b"not a serialized program")
@@ -0,0 +1,116 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import pytest
+
+from qref.parameters import ParameterPropagator, propagate_parameters
+
+
+@pytest.fixture
+def program():
+    return {
+        "name": "root",
+        "input_params": ["N", "K"],
+        "linked_params": [{"source": "N", "targets": ["a.M", "b.N"]}, {"source": "K", "targets": ["a.c.K"]}],
+        "children": [
+            {
+                "name": "a",
+                "input_params": ["M"],
+                "linked_params": [{"source": "M", "targets": ["c.L"]}],
+                "children": [{"name": "c", "input_params": ["L", "K"]}],
+            },
+            {"name": "b", "input_params": ["N"]},
+        ],
+    }
+
+
+def test_values_are_propagated_to_all_descendants(program):
+    values = propagate_parameters(program, {"root.N": 10, "root.K": 2})
+
+    assert values == {
+        "root.N": 10,
+        "root.K": 2,
+        "root.a.M": 10,
+        "root.b.N": 10,
+        "root.a.c.L": 10,
+        "root.a.c.K": 2,
+    }
+
+
+def test_parameters_are_ordered_topologically(program):
+    order = ParameterPropagator(program).parameters
+
+    assert order.index("root.N") < order.index("root.a.M") < order.index("root.a.c.L")
+
+
+def test_parameters_without_values_are_omitted(program):
+    assert propagate_parameters(program, {"root.K": 2}) == {"root.K": 2, "root.a.c.K": 2}
+
+
+def test_values_of_parameters_of_single_routine_are_keyed_by_their_names(program):
+    propagator = ParameterPropagator(program)
+    propagator.bind({"root.N": 10, "root.K": 2})
+
+    assert propagator.routine_values("root.a.c") == {"L": 10, "K": 2}
+
+
+def test_rebinding_parameter_recomputes_only_parameters_depending_on_it(program):
+    propagator = ParameterPropagator(program)
+    value = object()
+    propagator.bind({"root.N": 10, "root.K": value})
+
+    propagator.bind({"root.N": 20})
+
+    assert propagator.routine_values("root.a.c") == {"L": 20, "K": value}
+    assert propagator.values["root.b.N"] == 20
+
+
+def test_explicitly_bound_values_take_precedence_over_propagated_ones(program):
+    propagator = ParameterPropagator(program)
+    propagator.bind({"root.N": 10, "root.a.M": 5})
+
+    assert propagator.values["root.a.c.L"] == 5
+
+    propagator.unbind(["root.a.M"])
+
+    assert propagator.values["root.a.c.L"] == 10
+
+
+def test_binding_unknown_parameters_fails(program):
+    with pytest.raises(ValueError, match="root.X"):
+        propagate_parameters(program, {"root.X": 1})
+
+
+def test_parameters_cannot_be_targets_of_multiple_links(program):
+    program["linked_params"][1]["targets"].append("a.M")
+
+    with pytest.raises(ValueError, match="multiple links"):
+        ParameterPropagator(program)
+
+
+def test_cyclic_dependencies_between_parameters_are_detected():
+    routine = {"name": "root", "local_variables": {"R": "S + 1", "S": "2*R"}}
+
+    with pytest.raises(ValueError, match="cyclically"):
+        ParameterPropagator(routine)
+
+
+def test_local_variables_are_evaluated_and_propagated(program):
+    np = pytest.importorskip("numpy")
+    program["local_variables"] = {"R": "ceiling(log_2(N))"}
+    program["linked_params"].append({"source": "R", "targets": ["b.R"]})
+    program["children"][1]["input_params"].append("R")
+
+    values = propagate_parameters(program, {"root.N": np.array([4.0, 5.0, 16.0])})
+
+    np.testing.assert_allclose(values["root.b.R"], [2, 3, 4])
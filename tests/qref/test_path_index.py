@@ -0,0 +1,88 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import pytest
+
+from qref import SchemaV1
+from qref.paths import path_index
+from qref.schema_v1 import PortV1, RoutineV1
+
+
+@pytest.fixture
+def program():
+    return SchemaV1.model_validate(
+        {
+            "version": "v1",
+            "program": {
+                "name": "root",
+                "ports": [{"name": "in_0", "direction": "input", "size": 1}],
+                "children": [
+                    {
+                        "name": "a",
+                        "children": [{"name": "b", "ports": [{"name": "thru_0", "direction": "through", "size": 1}]}],
+                    },
+                    {"name": "c"},
+                ],
+            },
+        }
+    ).program
+
+
+def test_routines_and_ports_are_found_by_their_paths(program):
+    index = path_index(program)
+    b = program.children.by_name["a"].children.by_name["b"]
+
+    assert index.routine("root.a.b") is b
+    assert index.port("root.a.b.thru_0") is b.ports[0]
+    assert index["root.in_0"] is program.ports[0]
+    assert index["root.c"] is program.children.by_name["c"]
+    assert len(index) == 6
+    assert index.routine_paths() == ["root", "root.a", "root.a.b", "root.c"]
+
+
+def test_paths_are_found_by_objects(program):
+    index = path_index(program)
+    b = program.children.by_name["a"].children.by_name["b"]
+
+    assert index.path_of(b) == "root.a.b"
+    assert index.path_of(b.ports[0]) == "root.a.b.thru_0"
+
+
+def test_looking_up_nonexistent_paths_and_objects_fails(program):
+    index = path_index(program)
+
+    assert "root.x" not in index
+    with pytest.raises(KeyError):
+        index["root.x"]
+    with pytest.raises(KeyError, match="not part of the program"):
+        index.path_of(RoutineV1(name="x"))
+
+
+def test_index_is_built_once_per_program(program):
+    assert path_index(program) is path_index(program)
+
+
+def test_index_is_rebuilt_after_modifications(program):
+    index = path_index(program)
+    a = program.children.by_name["a"]
+    assert "root.a.b" in index
+
+    a.children.by_name["b"].name = "d"
+    a.mark_modified()
+
+    assert "root.a.b" not in index
+    assert index.path_of(a.children[0]) == "root.a.d"
+
+    a.children[0].ports = [PortV1(name="out_0", direction="output", size=1)]
+
+    assert index.port("root.a.d.out_0") is a.children[0].ports[0]
@@ -0,0 +1,158 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from pathlib import Path
+
+import pytest
+import yaml
+
+from qref.aggregation import aggregate_all_resources
+from qref.evaluation import evaluate_aggregated_resources, evaluate_repetition
+from qref.schema_v1 import RepetitionV1
+
+np = pytest.importorskip("numpy")
+
+REPETITIONS_PATH = Path(__file__).parent / "data" / "valid_programs" / "programs_with_repetitions"
+
+COUNTS = np.array([0.0, 1.0, 2.0, 7.0, 20.0])
+
+
+def _repetition(sequence, count="N"):
+    return RepetitionV1.model_validate({"count": count, "sequence": sequence})
+
+
+@pytest.mark.parametrize(
+    "sequence, term",
+    [
+        ({"type": "constant", "multiplier": "a"}, lambda i, a: a),
+        ({"type": "arithmetic", "initial_term": "a", "difference": 3}, lambda i, a: a + 3 * i),
+        ({"type": "geometric", "ratio": "a"}, lambda i, a: a**i),
+        ({"type": "geometric", "ratio": 1}, lambda i, a: 1),
+        ({"type": "custom", "term_expression": "a*i^2", "iterator_symbol": "i"}, lambda i, a: a * i**2),
+        ({"type": "custom", "term_expression": "a", "iterator_symbol": "i"}, lambda i, a: a),
+    ],
+)
+def test_repetitions_are_evaluated_over_whole_grid_as_sums_of_terms(sequence, term):
+    a = np.array([1.0, 2.0, 0.5, 3.0, 1.0])
+
+    expected = [sum(term(i, a_value) for i in range(int(count))) for count, a_value in zip(COUNTS, a)]
+
+    np.testing.assert_allclose(evaluate_repetition(_repetition(sequence), {"N": COUNTS, "a": a}), expected)
+
+
+def test_closed_form_sequences_are_evaluated_with_expression_for_given_type_of_resources():
+    repetition = _repetition({"type": "closed_form", "sum": "n*(n+1)/2", "prod": "2*n", "num_terms_symbol": "n"})
+
+    np.testing.assert_allclose(evaluate_repetition(repetition, {"N": COUNTS}), COUNTS * (COUNTS + 1) / 2)
+    np.testing.assert_allclose(evaluate_repetition(repetition, {"N": COUNTS}, "multiplicative"), 2 * COUNTS)
+
+
+def test_closed_form_sequence_without_needed_expression_cannot_be_evaluated():
+    repetition = _repetition({"type": "closed_form", "prod": "n", "num_terms_symbol": "n"})
+
+    with pytest.raises(ValueError, match="additive"):
+        evaluate_repetition(repetition, {"N": COUNTS})
+
+
+def test_repetitions_with_huge_counts_are_evaluated_without_unrolling():
+    repetition = _repetition({"type": "arithmetic", "initial_term": 1, "difference": 2})
+
+    # Sum of the first N odd numbers is N^2.
+    assert evaluate_repetition(repetition, {"N": 1e9}) == pytest.approx(1e18)
+
+
+def test_custom_sequences_stop_being_summed_once_sums_are_undefined():
+    # Terms alternate between -inf and inf after the first one, hence the sums become undefined after three terms.
+    repetition = _repetition({"type": "custom", "term_expression": "(-1)^i * 10^(400 * i)", "iterator_symbol": "i"})
+
+    with np.errstate(over="ignore", invalid="ignore"):
+        result = evaluate_repetition(repetition, {"N": np.array([1.0, 2.0, 1e12])})
+
+    np.testing.assert_allclose(result, [1, -np.inf, np.nan])
+
+
+@pytest.mark.parametrize("name", ["repetition_1_arithmetic", "repetition_2_geometric", "repetition_5_nested"])
+def test_aggregated_resources_match_symbolic_aggregation(name):
+    data = yaml.safe_load((REPETITIONS_PATH / f"{name}.yaml").read_text())["input"]
+    values = {"N": 3.0, "bits_of_precision": 5.0}
+
+    evaluated = evaluate_aggregated_resources(data, {name: np.array([value]) for name, value in values.items()})
+    symbolic = aggregate_all_resources(data)
+
+    assert evaluated.keys() == symbolic.keys()
+    for path, resources in symbolic.items():
+        expected = {resource.name: eval(str(resource.value).replace("^", "**"), values) for resource in resources}
+        assert {name: value[0] for name, value in evaluated[path].items()} == pytest.approx(expected)
+
+
+def test_resources_are_aggregated_from_children_unless_declared():
+    routine = {
+        "name": "root",
+        "children": [
+            {"name": "a", "resources": [{"name": "T", "type": "additive", "value": "N"}]},
+            {"name": "b", "resources": [{"name": "T", "type": "additive", "value": 2}]},
+            {"name": "c", "resources": [{"name": "q", "type": "qubits", "value": "N"}]},
+        ],
+        "resources": [{"name": "q", "type": "qubits", "value": 100}],
+    }
+
+    result = evaluate_aggregated_resources(routine, {"N": np.array([1.0, 5.0])})
+
+    np.testing.assert_allclose(result["root"]["T"], [3, 7])
+    np.testing.assert_allclose(result["root"]["q"], [100, 100])
+
+
+def test_unknown_resources_are_aggregated_into_nans_if_not_strict():
+    routine = {
+        "name": "root",
+        "children": [
+            {"name": "a", "resources": [{"name": "T", "type": "additive", "value": "O(N)"}]},
+            {"name": "b", "resources": [{"name": "T", "type": "additive", "value": 2}]},
+        ],
+    }
+
+    with pytest.raises(ValueError, match="root.a"):
+        evaluate_aggregated_resources(routine, {"N": np.array([1.0])})
+
+    assert np.isnan(evaluate_aggregated_resources(routine, {"N": np.array([1.0])}, strict=False)["root"]["T"]).all()
+
+
+def test_resources_of_children_with_the_same_name_are_aggregated_separately():
+    routine = {
+        "name": "root",
+        "children": [
+            {"name": "a", "resources": [{"name": "T", "type": "additive", "value": 1}]},
+            {"name": "a", "resources": [{"name": "T", "type": "additive", "value": "N"}]},
+        ],
+    }
+
+    result = evaluate_aggregated_resources(routine, {"N": np.array([1.0, 5.0])})
+
+    np.testing.assert_allclose(result["root"]["T"], [2, 6])
+
+
+def test_only_the_first_of_routines_with_the_same_path_is_included_in_the_result():
+    routine = {
+        "name": "root",
+        "children": [
+            {"name": "a", "children": [{"name": "x", "resources": [{"name": "T", "type": "additive", "value": 1}]}]},
+            {"name": "a", "children": [{"name": "y", "resources": [{"name": "T", "type": "additive", "value": "N"}]}]},
+        ],
+    }
+
+    result = evaluate_aggregated_resources(routine, {"N": np.array([1.0, 5.0])})
+
+    assert list(result) == ["root", "root.a", "root.a.x", "root.a.y"]
+    np.testing.assert_allclose(result["root.a"]["T"], [1, 1])
+    np.testing.assert_allclose(result["root.a.y"]["T"], [1, 5])
+    np.testing.assert_allclose(result["root"]["T"], [2, 6])
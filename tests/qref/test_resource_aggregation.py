@@ -0,0 +1,195 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from pathlib import Path
+
+import pytest
+import yaml
+
+from qref import SchemaV1, aggregation
+from qref.aggregation import aggregate_all_resources, aggregate_resources
+from qref.schema_v1 import ResourceV1
+
+REPETITIONS_PATH = Path(__file__).parent / "data" / "valid_programs" / "programs_with_repetitions"
+
+
+def _leaf(name, **resources):
+    types = {"t_gates": "additive", "rotations": "additive", "success": "multiplicative", "qubits": "qubits"}
+    return {
+        "name": name,
+        "resources": [
+            {"name": resource, "type": types.get(resource, "other"), "value": value}
+            for resource, value in resources.items()
+        ],
+    }
+
+
+def _values(resources):
+    return {resource.name: resource.value for resource in resources}
+
+
+def _repeated(count, sequence, **resources):
+    return {"name": "root", "children": [_leaf("a", **resources)], "repetition": {"count": count, "sequence": sequence}}
+
+
+def test_resources_are_aggregated_according_to_their_types():
+    routine = {
+        "name": "root",
+        "children": [
+            _leaf("a", t_gates=2, success=0.5, qubits=3, label="x"),
+            _leaf("b", t_gates=5, success=0.5, qubits=10),
+        ],
+    }
+
+    assert _values(aggregate_resources(routine)) == {"t_gates": 7, "success": 0.25, "qubits": 10}
+
+
+def test_declared_resources_take_precedence_over_aggregated_ones():
+    routine = {
+        "name": "root",
+        "children": [_leaf("a", t_gates=2, qubits=3), _leaf("b", t_gates=5)],
+        "resources": [{"name": "t_gates", "type": "additive", "value": 100}],
+    }
+
+    assert _values(aggregate_resources(routine)) == {"t_gates": 100, "qubits": 3}
+
+
+def test_symbolic_resources_are_aggregated_into_expressions():
+    routine = {"name": "root", "children": [_leaf("a", t_gates="N", qubits="M"), _leaf("b", t_gates=2, qubits=4)]}
+
+    assert _values(aggregate_resources(routine)) == {"t_gates": "N + 2", "qubits": "max(M, 4)"}
+
+
+def test_resources_with_unknown_values_of_children_are_unknown():
+    routine = {"name": "root", "children": [_leaf("a", t_gates=None), _leaf("b", t_gates=2)]}
+
+    assert _values(aggregate_resources(routine)) == {"t_gates": None}
+
+
+def test_resources_with_different_types_in_children_cannot_be_aggregated():
+    routine = {
+        "name": "root",
+        "children": [
+            _leaf("a", t_gates=1),
+            {"name": "b", "resources": [{"name": "t_gates", "type": "qubits", "value": 1}]},
+        ],
+    }
+
+    with pytest.raises(ValueError, match="different types"):
+        aggregate_resources(routine)
+
+
+@pytest.mark.parametrize(
+    "count, sequence, expected",
+    [
+        (10, {"type": "constant", "multiplier": 2}, {"t_gates": 60, "success": 0.5**20, "qubits": 4}),
+        (
+            4,
+            {"type": "arithmetic", "initial_term": 1, "difference": 2},
+            {"t_gates": 48, "success": 0.5**16, "qubits": 4},
+        ),
+        (4, {"type": "geometric", "ratio": 2}, {"t_gates": 45, "success": 0.5**15, "qubits": 4}),
+        (4, {"type": "geometric", "ratio": 1}, {"t_gates": 12, "success": 0.5**4, "qubits": 4}),
+    ],
+)
+def test_repetitions_with_numeric_counts_are_folded(count, sequence, expected):
+    routine = _repeated(count, sequence, t_gates=3, success=0.5, qubits=4)
+
+    assert _values(aggregate_resources(routine)) == pytest.approx(expected)
+
+
+def test_closed_form_sequences_are_aggregated_by_substituting_count():
+    sequence = {"type": "closed_form", "sum": "n*(n+1)/2", "prod": "n", "num_terms_symbol": "n"}
+    routine = _repeated("N", sequence, t_gates=3, success=0.5)
+
+    assert _values(aggregate_resources(routine)) == {"t_gates": "3*(N*(N+1)/2)", "success": "0.5**N"}
+
+
+def test_closed_form_sequence_without_needed_expression_cannot_be_aggregated():
+    routine = _repeated("N", {"type": "closed_form", "prod": "N", "num_terms_symbol": "N"}, t_gates=3)
+
+    with pytest.raises(ValueError, match="additive"):
+        aggregate_resources(routine)
+
+
+def test_custom_sequences_are_aggregated_into_sums():
+    routine = _repeated("N", {"type": "custom", "term_expression": "2^i", "iterator_symbol": "i"}, t_gates=3)
+
+    assert _values(aggregate_resources(routine)) == {"t_gates": "3*(sum(2^i, i, 0, N - 1))"}
+
+
+def test_nested_repetitions_are_aggregated_from_the_innermost_one():
+    data = yaml.safe_load((REPETITIONS_PATH / "repetition_5_nested.yaml").read_text())["input"]
+
+    resources = aggregate_all_resources(data)
+    values = {name: eval(value, {"N": 3}) for name, value in _values(resources["root"]).items()}
+
+    # Routine a repeats b 1 + 3 + 5 = 9 times, and root repeats a 10 times.
+    assert values == pytest.approx({"y": 3 * 9 * 10, "z": 3 ** (9 * 10)})
+    assert _values(resources["root.a.b"]) == {"y": "N", "z": "N"}
+
+
+def test_all_resources_are_aggregated_for_every_routine():
+    routine = {"name": "root", "children": [{"name": "a", "children": [_leaf("b", t_gates=1)]}, _leaf("c", t_gates=2)]}
+
+    resources = aggregate_all_resources(routine)
+
+    assert list(resources) == ["root", "root.a", "root.a.b", "root.c"]
+    assert _values(resources["root"]) == {"t_gates": 3}
+    assert _values(resources["root.a"]) == {"t_gates": 1}
+
+
+class TestCachingOfAggregatedResources:
+    @pytest.fixture
+    def program(self):
+        return SchemaV1.model_validate(
+            {
+                "version": "v1",
+                "program": {
+                    "name": "root",
+                    "children": [
+                        {"name": "a", "children": [_leaf("x", t_gates=1), _leaf("y", t_gates=2)]},
+                        {"name": "b", "children": [_leaf("x", t_gates=1), _leaf("y", t_gates=2)]},
+                    ],
+                },
+            }
+        ).program
+
+    @pytest.fixture
+    def aggregated_routines(self, monkeypatch):
+        aggregated = []
+        original = aggregation._aggregate
+
+        def _aggregate(routine, children_resources):
+            aggregated.append(routine.name)
+            return original(routine, children_resources)
+
+        monkeypatch.setattr(aggregation, "_aggregate", _aggregate)
+        return aggregated
+
+    def test_unchanged_resources_are_not_aggregated_again(self, program, aggregated_routines):
+        aggregate_resources(program)
+        aggregated_routines.clear()
+
+        assert _values(aggregate_resources(program)) == {"t_gates": 6}
+        assert aggregated_routines == []
+
+    def test_only_ancestors_of_modified_routines_are_aggregated_again(self, program, aggregated_routines):
+        aggregate_resources(program)
+        aggregated_routines.clear()
+
+        leaf = program.children.by_name["b"].children.by_name["y"]
+        leaf.resources = [ResourceV1(name="t_gates", type="additive", value=10)]
+
+        assert _values(aggregate_resources(program)) == {"t_gates": 14}
+        assert sorted(aggregated_routines) == ["b", "root", "y"]
@@ -72,3 +72,29 @@ def test_chronology_of_children_is_preserved_when_constructing_model_instances()
     qref_obj = SchemaV1.model_validate(input)
 
     assert [child.name for child in qref_obj.program.children] == ["c", "b", "d"]
+
+
+def test_loading_trusted_program_gives_the_same_object_as_validating_it(valid_program):
+    trusted = SchemaV1.load_trusted(valid_program)
+
+    assert trusted == SchemaV1.model_validate(valid_program)
+    assert trusted.model_dump(exclude_unset=True) == SchemaV1.model_validate(valid_program).model_dump(
+        exclude_unset=True
+    )
+
+
+def test_objects_in_trusted_program_can_be_accessed_by_name():
+    input = {
+        "version": "v1",
+        "program": {
+            "name": "root",
+            "children": [{"name": "a", "ports": [{"name": "in_0", "direction": "input", "size": 1}]}, {"name": "b"}],
+            "ports": [{"name": "in_0", "direction": "input", "size": 1}],
+            "connections": ["in_0 -> a.in_0"],
+        },
+    }
+
+    program = SchemaV1.load_trusted(input).program
+
+    assert program.children.by_name["a"].ports.by_name["in_0"].size == 1
+    assert (program.connections[0].source, program.connections[0].target) == ("in_0", "a.in_0")
@@ -12,12 +12,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import sys
 from pathlib import Path
 
 import pytest
 import yaml
+from pydantic import ValidationError
 
-from qref import SchemaV1
+from qref import SchemaV1, verification
+from qref.schema_v1 import PortV1, RoutineV1
 from qref.verification import verify_topology
 
 
@@ -50,6 +53,39 @@ def test_invalid_program_fails_to_validate_with_schema_v1(input, problems):
     assert sorted(verification_output.problems) == sorted(problems)
 
 
+@pytest.mark.parametrize(
+    "modify, problems",
+    [
+        pytest.param(
+            lambda connections: connections.pop(),
+            ["No outgoing connection from root.in_0.", "No incoming connection to root.a.in_0."],
+            id="removed connection",
+        ),
+        pytest.param(
+            lambda connections: connections.append(connections[0]),
+            ["Too many outgoing connections from root.a.out_0.", "Too many incoming connections to root.out_0."],
+            id="duplicated connection",
+        ),
+    ],
+)
+def test_connections_modified_in_place_are_verified_without_marking_routine_as_modified(modify, problems):
+    ports = [{"name": "in_0", "direction": "input", "size": 1}, {"name": "out_0", "direction": "output", "size": 1}]
+    program = SchemaV1(
+        version="v1",
+        program={
+            "name": "root",
+            "ports": ports,
+            "children": [{"name": "a", "ports": ports}],
+            "connections": ["in_0 -> a.in_0", "a.out_0 -> out_0"],
+        },
+    )
+    assert verify_topology(program)
+
+    modify(program.program.connections)
+
+    assert sorted(verify_topology(program).problems) == sorted(problems)
+
+
 @pytest.mark.timeout(10)
 def test_topology_verification_of_a_large_routine_completes_in_acceptable_time():
     N_CHILDREN = 10000
@@ -75,3 +111,220 @@ def test_topology_verification_of_a_large_routine_completes_in_acceptable_time()
     }
 
     assert verify_topology(qref_obj)
+
+
+@pytest.mark.timeout(10)
+def test_topology_of_routine_deeper_than_recursion_limit_can_be_verified():
+    depth = 2 * sys.getrecursionlimit()
+    ports = [{"name": "in_0", "direction": "input", "size": 1}, {"name": "out_0", "direction": "output", "size": 1}]
+
+    # Dictionary this deep cannot be validated by pydantic, so we construct the routine bottom-up.
+    routine = RoutineV1(name="leaf", ports=ports)
+    for i in range(depth):
+        routine = RoutineV1(
+            name=f"level_{i}",
+            ports=ports,
+            children=[routine],
+            connections=[f"in_0 -> {routine.name}.in_0", f"{routine.name}.out_0 -> out_0"],
+        )
+
+    assert verify_topology(routine)
+
+    routine.connections = [f"in_0 -> {routine.children[0].name}.in_0"]
+
+    assert sorted(verify_topology(routine).problems) == [
+        f"No incoming connection to {routine.name}.out_0.",
+        f"No outgoing connection from {routine.name}.{routine.children[0].name}.out_0.",
+    ]
+
+
+class TestIncrementalVerification:
+    @pytest.fixture
+    def program(self):
+        return SchemaV1(
+            version="v1",
+            program={
+                "name": "root",
+                "ports": [
+                    {"name": "in_0", "direction": "input", "size": 1},
+                    {"name": "out_0", "direction": "output", "size": 1},
+                ],
+                "children": [
+                    {
+                        "name": f"child_{i}",
+                        "ports": [
+                            {"name": "in_0", "direction": "input", "size": 1},
+                            {"name": "out_0", "direction": "output", "size": 1},
+                        ],
+                        "children": [
+                            {"name": "leaf_a", "ports": [{"name": "thru_0", "direction": "through", "size": 1}]},
+                            {"name": "leaf_b", "ports": [{"name": "thru_0", "direction": "through", "size": 1}]},
+                        ],
+                        "connections": [
+                            "in_0 -> leaf_a.thru_0",
+                            "leaf_a.thru_0 -> leaf_b.thru_0",
+                            "leaf_b.thru_0 -> out_0",
+                        ],
+                    }
+                    for i in range(3)
+                ],
+                "connections": [
+                    "in_0 -> child_0.in_0",
+                    "child_0.out_0 -> child_1.in_0",
+                    "child_1.out_0 -> child_2.in_0",
+                    "child_2.out_0 -> out_0",
+                ],
+            },
+        )
+
+    @pytest.fixture
+    def verified_routines(self, monkeypatch):
+        verified_routines = []
+        original_find_cycles = verification._find_cycles
+
+        def _find_cycles(routine, path):
+            verified_routines.append(str(path))
+            return original_find_cycles(routine, path)
+
+        monkeypatch.setattr(verification, "_find_cycles", _find_cycles)
+        return verified_routines
+
+    @pytest.mark.parametrize(
+        "input", [pytest.param(example.values[0], id=example.id) for example in load_invalid_examples()]
+    )
+    def test_incremental_verification_gives_the_same_problems_as_the_full_one(self, input):
+        program = SchemaV1(**input)
+
+        expected_problems = verify_topology(program).problems
+
+        assert verify_topology(program, incremental=True).problems == expected_problems
+        assert verify_topology(program, incremental=True).problems == expected_problems
+
+    def test_unmodified_routines_are_not_verified_again(self, program, verified_routines):
+        assert verify_topology(program, incremental=True)
+        verified_routines.clear()
+
+        assert verify_topology(program, incremental=True)
+        assert verified_routines == []
+
+    def test_only_modified_routines_and_their_parents_are_verified_again(self, program, verified_routines):
+        assert verify_topology(program, incremental=True)
+        verified_routines.clear()
+
+        program.program.children[1].children[0].type = "modified"
+
+        assert verify_topology(program, incremental=True)
+        assert verified_routines == ["root.child_1", "root.child_1.leaf_a"]
+
+    def test_subtrees_without_modified_routines_are_skipped_as_a_whole(self, program, monkeypatch):
+        assert verify_topology(program, incremental=True)
+        visited_routines = []
+        original_link_children = verification.link_children
+
+        def _link_children(routine):
+            visited_routines.append(routine.name)
+            original_link_children(routine)
+
+        monkeypatch.setattr(verification, "link_children", _link_children)
+        program.program.children[1].children[0].type = "modified"
+
+        assert verify_topology(program, incremental=True)
+        assert visited_routines == ["root", "child_1", "leaf_a"]
+
+    def test_problems_introduced_by_assignment_are_detected(self, program):
+        assert verify_topology(program, incremental=True)
+
+        program.program.children[1].connections = ["in_0 -> leaf_a.thru_0"]
+
+        assert verify_topology(program, incremental=True).problems == verify_topology(program).problems
+        assert not verify_topology(program, incremental=True)
+
+    def test_problems_introduced_by_rejected_assignment_are_detected(self, program):
+        assert verify_topology(program, incremental=True)
+
+        with pytest.raises(ValidationError):
+            program.program.connections = ["in_0 -> nope.in_0"]
+
+        assert verify_topology(program, incremental=True).problems == verify_topology(program).problems
+        assert not verify_topology(program, incremental=True)
+
+    def test_problems_introduced_by_in_place_modification_are_detected_after_marking_routine_as_modified(self, program):
+        assert verify_topology(program, incremental=True)
+
+        leaf = program.program.children[1].children[0]
+        leaf.ports.append(PortV1(name="in_0", direction="input", size=1))
+        leaf.mark_modified()
+
+        assert verify_topology(program, incremental=True).problems == [
+            "No incoming connection to root.child_1.leaf_a.in_0."
+        ]
+
+    def test_routines_with_problems_are_reported_with_current_path(self, program):
+        program.program.children[1].children[0].ports.append(PortV1(name="in_0", direction="input", size=1))
+        assert not verify_topology(program, incremental=True)
+
+        program.program.name = "new_root"
+
+        assert verify_topology(program, incremental=True).problems == [
+            "No incoming connection to new_root.child_1.leaf_a.in_0."
+        ]
+
+
+class TestParallelVerification:
+    @pytest.fixture
+    def program_with_problems(self):
+        def _make_routine(name, depth):
+            routine = {
+                "name": name,
+                "ports": [
+                    {"name": "in_0", "direction": "input", "size": 1},
+                    {"name": "out_0", "direction": "output", "size": 1},
+                ],
+            }
+            if depth > 0:
+                routine["children"] = [_make_routine(f"child_{i}", depth - 1) for i in range(4)]
+                # Every other routine misses connection to its first child.
+                routine["connections"] = [
+                    *([] if depth % 2 else ["in_0 -> child_0.in_0"]),
+                    *[f"child_{i}.out_0 -> child_{i + 1}.in_0" for i in range(3)],
+                    "child_3.out_0 -> out_0",
+                ]
+            return routine
+
+        return SchemaV1(version="v1", program=_make_routine("root", 4))
+
+    @pytest.mark.parametrize("workers", [2, 3])
+    def test_parallel_verification_reports_the_same_problems_in_the_same_order_as_serial_one(
+        self, program_with_problems, workers
+    ):
+        expected_problems = verify_topology(program_with_problems).problems
+
+        assert expected_problems
+        assert verify_topology(program_with_problems, workers=workers).problems == expected_problems
+
+    def test_correct_program_passes_parallel_verification(self, valid_program):
+        assert verify_topology(valid_program, workers=2)
+
+    @pytest.mark.parametrize("input, problems", load_invalid_examples())
+    def test_invalid_program_fails_parallel_verification(self, input, problems):
+        assert sorted(verify_topology(input, workers=2).problems) == sorted(problems)
+
+    def test_parallel_verification_cannot_be_incremental(self, program_with_problems):
+        with pytest.raises(ValueError):
+            verify_topology(program_with_problems, incremental=True, workers=2)
+
+    def test_leaves_of_wide_routine_are_grouped_into_few_tasks(self):
+        routine = RoutineV1(name="root", children=[RoutineV1(name=f"child_{i}") for i in range(1000)])
+
+        tasks = verification._split_into_tasks(routine, 8)
+
+        assert len(tasks) <= 9
+        assert [segment for task in tasks for segment in task] == [
+            ((), False),
+            *[((i,), True) for i in range(1000)],
+        ]
+
+    @pytest.mark.parametrize("workers", [0, -1])
+    def test_number_of_workers_has_to_be_positive(self, program_with_problems, workers):
+        with pytest.raises(ValueError):
+            verify_topology(program_with_problems, workers=workers)